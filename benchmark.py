@@ -0,0 +1,136 @@
+"""Benchmarks da camada de armazenamento do bot.
+
+Uso:
+    python benchmark.py --formatos
+    GITHUB_FALSO=1 python benchmark.py --armazenamento
+
+Com GITHUB_FALSO=1 o backend "github" fala com um GitHub falso em processo
+(github_falso.py), iniciado aqui e nunca pelo bot.
+"""
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+
+import bot
+from github_falso import GitHubFalso
+
+# === GITHUB FALSO ===
+GITHUB_FALSO = os.getenv("GITHUB_FALSO", "0") == "1"
+GITHUB_FALSO_DIR = os.getenv("GITHUB_FALSO_DIR")  # semeia o repositório falso com os arquivos deste diretório
+GITHUB_FALSO_LATENCIA_MS = float(os.getenv("GITHUB_FALSO_LATENCIA_MS", "0"))  # média por requisição
+GITHUB_FALSO_LIMITE = int(os.getenv("GITHUB_FALSO_LIMITE", "5000"))  # requisições por janela
+GITHUB_FALSO_JANELA = float(os.getenv("GITHUB_FALSO_JANELA", "3600"))  # segundos até a cota renovar
+GITHUB_FALSO_POR_SEGUNDO = int(os.getenv("GITHUB_FALSO_POR_SEGUNDO", "0"))  # limite secundário (0 = sem)
+
+def iniciar_github_falso():
+    """Sobe o GitHub falso e aponta o backend do bot para ele."""
+    github_falso = GitHubFalso(
+        GITHUB_FALSO_LATENCIA_MS, GITHUB_FALSO_LIMITE, GITHUB_FALSO_JANELA, GITHUB_FALSO_POR_SEGUNDO
+    )
+    if GITHUB_FALSO_DIR:
+        github_falso.semear(GITHUB_FALSO_DIR)
+    bot.GITHUB_API_URL = github_falso.iniciar()
+    bot.REPO = bot.REPO or "local/dados"
+    print(f"🧪 GitHub falso ativo em {bot.GITHUB_API_URL} (repositório {bot.REPO})")
+    return github_falso
+
+# === BENCHMARK DE FORMATOS ===
+def benchmark_formatos(repeticoes=20):
+    """Compara tamanho e tempo de codificação dos formatos nos arquivos atuais do backend."""
+    nomes = bot.DOCUMENTOS_CONHECIDOS
+    print(f"Backend: {bot.backend.nome} | {repeticoes} repetições por medida")
+    print(f"{'arquivo':<30} {'formato':<9} {'bytes':>10} {'base64':>10} {'codificar':>11} {'decodificar':>12}")
+    totais = {formato: 0 for formato in bot.FORMATOS_ARMAZENAMENTO}
+    for nome in nomes:
+        dados = bot.backend.carregar(nome)
+        if not dados:
+            continue
+        for formato in bot.FORMATOS_ARMAZENAMENTO:
+            inicio = time.perf_counter()
+            for _ in range(repeticoes):
+                conteudo = bot._serializar(dados, formato)
+            codificar = (time.perf_counter() - inicio) / repeticoes * 1000
+            inicio = time.perf_counter()
+            for _ in range(repeticoes):
+                bot._desserializar(conteudo)
+            decodificar = (time.perf_counter() - inicio) / repeticoes * 1000
+            tamanho_base64 = len(base64.b64encode(conteudo))
+            totais[formato] += tamanho_base64
+            print(f"{nome:<30} {formato:<9} {len(conteudo):>10} {tamanho_base64:>10} "
+                  f"{codificar:>9.2f}ms {decodificar:>10.2f}ms")
+    print("Total enviado em base64: " + " | ".join(f"{f}: {b} bytes" for f, b in totais.items()))
+
+# === BENCHMARK DE ARMAZENAMENTO ===
+async def _benchmark_armazenamento(edicoes, externas, documentos, github_falso):
+    inicio = time.perf_counter()
+    esperado = {nome: {} for nome in documentos}
+
+    async def editar(i):
+        nome = documentos[i % len(documentos)]
+        async with bot.store.editar(nome) as dados:
+            dados[f"bot-{i}"] = i
+        esperado[nome][f"bot-{i}"] = i
+
+    async def gravar_periodicamente():
+        while True:
+            await asyncio.sleep(0.05)
+            await bot.store.flush()
+
+    async def alterar_por_fora():
+        # Outro processo gravando os mesmos arquivos: força os caminhos de conflito/merge
+        for j in range(externas):
+            await asyncio.sleep(0.02)
+            nome = documentos[j % len(documentos)]
+            await asyncio.to_thread(github_falso.alterar, nome, lambda d, j=j: d.update({f"externo-{j}": j}))
+            esperado[nome][f"externo-{j}"] = j
+
+    gravador = asyncio.create_task(gravar_periodicamente())
+    tarefas = [editar(i) for i in range(edicoes)]
+    if github_falso:
+        tarefas.append(alterar_por_fora())
+    await asyncio.gather(*tarefas)
+    gravador.cancel()
+    await bot.store.flush()
+    duracao = time.perf_counter() - inicio
+
+    perdidas = 0
+    for nome in documentos:
+        final = github_falso.ler(nome) if github_falso else await asyncio.to_thread(bot.backend.carregar, nome)
+        faltando = set(esperado[nome]) - set(final or {})
+        perdidas += len(faltando)
+        print(f"{nome}: {len(final or {})} chaves no backend, {len(faltando)} perdidas")
+    return duracao, perdidas
+
+def benchmark_armazenamento(github_falso=None, edicoes=500, externas=20):
+    """Exercita a camada de armazenamento com edições concorrentes e mede o custo de I/O.
+
+    Só roda offline (GITHUB_FALSO=1 ou backend local) e só em documentos benchmark/*.
+    """
+    if bot.backend.nome == "github" and not github_falso:
+        print("ERRO: o benchmark não roda contra o GitHub real; use GITHUB_FALSO=1 ou STORAGE_BACKEND=arquivos/sqlite")
+        return False
+    documentos = [f"benchmark/doc_{n}.json" for n in range(4)]
+    print(f"Backend: {bot.backend.nome} | formato: {bot.STORAGE_FORMATO} | {edicoes} edições"
+          + (f", {externas} alterações externas" if github_falso else ""))
+    duracao, perdidas = asyncio.run(_benchmark_armazenamento(edicoes, externas, documentos, github_falso))
+    print(f"Duração: {duracao:.2f}s | atualizações perdidas: {perdidas}")
+    print(f"{'arquivo':<28} {'leituras':>8} {'escritas':>8} {'reqs':>6} {'bytes':>10} {'p50':>8} {'p99':>8}")
+    for nome, m in sorted(bot.metricas_storage.por_arquivo().items()):
+        print(f"{nome:<28} {m['leituras']:>8} {m['escritas']:>8} {m['requisicoes']:>6} {m['bytes']:>10} "
+              f"{m['p50_ms'] or 0:>6.1f}ms {m['p99_ms'] or 0:>6.1f}ms")
+    print(f"GitHub: {json.dumps(bot.agendador.metricas(), ensure_ascii=False)}")
+    if github_falso:
+        print(f"GitHub falso: {github_falso.requisicoes} requisições, {github_falso.conflitos} conflitos")
+    return perdidas == 0
+
+if __name__ == "__main__":
+    github_falso = iniciar_github_falso() if GITHUB_FALSO else None
+    if "--formatos" in sys.argv:
+        benchmark_formatos()
+    elif "--armazenamento" in sys.argv:
+        sys.exit(0 if benchmark_armazenamento(github_falso) else 1)
+    else:
+        print(__doc__)
@@ -1,7 +1,7 @@
 import discord
 from discord import app_commands
 from discord.ext import commands, tasks
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone, time as horario
 import json
 import os
 from flask import Flask
@@ -16,7 +16,21 @@ from discord.ui import View, Button
 import xml.etree.ElementTree as ET
 import unicodedata
 import math
+import copy
+import contextvars
+import heapq
+import itertools
+import hashlib
+import hmac
+import sqlite3
+import functools
+from collections import deque
+import zlib
+import gzip
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from wsgiref.simple_server import make_server
+from urllib.parse import parse_qs
 
 # === CONFIGURAÇÃO ===
 TOKEN = os.getenv("DISCORD_BOT_TOKEN")
@@ -27,7 +41,10 @@ ARQUIVO_YOUTUBE = "youtube.json"
 ARQUIVO_ATIVIDADE = "atividade.json"
 DIAS_INATIVIDADE = 3  # 🕒 define quantos dias sem roletar remove imunidade
 ARQUIVO_LOG_ATIVIDADE = "log_atividade.json"
-ARQUIVO_ATIVIDADE_6DIAS = "atividade_6dias.json"
+ARQUIVO_ATIVIDADE_6DIAS = "atividade_6dias.json"  # formato antigo {dia: {uid: nome}}, só lido na migração
+ARQUIVO_HISTORICO_ATIVIDADE = "historico_atividade.json"  # bitsets por dia (HistoricoAtividade)
+JANELA_ATIVIDADE_DIAS = int(os.getenv("JANELA_ATIVIDADE_DIAS", "6"))  # dias de histórico mantidos
+JANELAS_ATIVIDADE = (6, 30, 90)
 ARQUIVO_SERIES = "series.json"
 ARQUIVO_ISENCAO = "isencao_inatividade.json"
 
@@ -51,12 +68,196 @@ S2_CATEGORIA_SALAS_ID = None  # Será configurado
 S2_ROLL_PREFIXES = ("$w", "$wa", "$wg", "$h", "$ha", "$hg")
 S2_ROLL_FREE = ("$vote", "$daily")
 
-S2_SALAS_ATIVAS = {}  # Controle de salas ativas
+S2_SALAS_ATIVAS = {}  # uid -> sala ativa (cópia do registro em season2_salas.json)
+S2_CANAIS_SALAS = {}  # canal_id -> uid do dono da sala ativa
+S2_RODADAS_DIARIAS = 2
+MEIA_NOITE_BRASIL = horario(hour=3, tzinfo=timezone.utc)  # 00:00 em Brasília (UTC-3)
 
 # === CONFIG GITHUB ===
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 REPO = os.getenv("GITHUB_REPO")
 BRANCH = os.getenv("GITHUB_BRANCH", "main")
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+
+# === BACKEND DE ARMAZENAMENTO ===
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "github").lower()  # github | arquivos | sqlite
+STORAGE_DIR = os.getenv("STORAGE_DIR", "dados")
+STORAGE_SQLITE_PATH = os.getenv("STORAGE_SQLITE_PATH", "dados.db")
+STORAGE_FORMATO = os.getenv("STORAGE_FORMATO", "legivel").lower()  # legivel | compacto | gzip
+FORMATOS_ARMAZENAMENTO = ("legivel", "compacto", "gzip")
+DOCUMENTOS_POR_CHAVE = (ARQUIVO_ATIVIDADE, ARQUIVO_COOLDOWN, ARQ_S2_PLAYERS)  # uma linha por chave no SQLite
+STORAGE_WORKERS = 4  # threads do executor = conexões simultâneas ao backend
+# Threads só do tráfego de fundo (loops, flush): quando a cota acaba elas ficam esperando
+# o reset dentro do agendador, e isso não pode ocupar as threads das leituras interativas
+STORAGE_WORKERS_FUNDO = 2
+
+# === FRAGMENTAÇÃO (SHARDS) ===
+ARQUIVO_SHARDS = "shards.json"  # manifesto: documento -> nº de buckets em uso
+STORAGE_SHARDS = int(os.getenv("STORAGE_SHARDS", "8"))  # buckets usados na migração
+# Nível em que fica o id do usuário: 1 = {uid: ...}, 2 = {dia: {uid: ...}}.
+# O histórico em bitsets não entra: os bits de todos os usuários ficam juntos e o documento é pequeno.
+DOCUMENTOS_FRAGMENTAVEIS = {
+    ARQUIVO_ATIVIDADE: 1,
+    ARQUIVO_ATIVIDADE_6DIAS: 2,
+    ARQUIVO_COOLDOWN: 1,
+    ARQ_S2_PLAYERS: 1,
+}
+
+# Todo ARQUIVO_* / ARQ_S2_* guardado no backend (youtube.json é um arquivo local à parte)
+DOCUMENTOS_CONHECIDOS = tuple(sorted({
+    valor for chave, valor in list(globals().items())
+    if chave.startswith(("ARQUIVO_", "ARQ_S2_")) and isinstance(valor, str)
+} - {ARQUIVO_YOUTUBE}))
+
+# === COTA DA API DO GITHUB ===
+GITHUB_RESERVA_INTERATIVA = int(os.getenv("GITHUB_RESERVA_INTERATIVA", "300"))  # req. guardadas para comandos
+GITHUB_ESPERA_INTERATIVA = 10  # segundos que uma leitura interativa aceita esperar pela cota
+PRIORIDADE_INTERATIVA = 0
+PRIORIDADE_FUNDO = 1
+_prioridade_atual = contextvars.ContextVar("prioridade_storage", default=PRIORIDADE_INTERATIVA)
+_chamador_atual = contextvars.ContextVar("chamador_storage", default=None)
+_contexto_thread = threading.local()
+
+# === MÉTRICAS DE ARMAZENAMENTO ===
+METRICAS_AMOSTRAS = 1024  # latências guardadas por série para calcular os percentis
+METRICAS_TOKEN = os.getenv("METRICAS_TOKEN")  # exigido em GET /metricas; sem ele o endpoint fica desligado
+
+# === CACHE DE DOCUMENTOS ===
+CACHE_TTL = int(os.getenv("STORAGE_CACHE_TTL", "300"))  # segundos (0 = nunca expira)
+_cache_documentos = {}  # nome_arquivo -> (carregado_em, dados)
+_versoes_documentos = {}  # nome_arquivo -> nº de vezes que o cache foi escrito pelo event loop
+STORAGE_FLUSH_INTERVAL = float(os.getenv("STORAGE_FLUSH_INTERVAL", "15"))  # janela de gravação (s)
+_documentos_pendentes = set()  # arquivos alterados em memória ainda não gravados no GitHub
+_documentos_em_gravacao = set()  # arquivos saindo no flush atual, ainda sem resposta do backend
+
+class MetricasArmazenamento:
+    """Contadores por (operação, arquivo, função chamadora).
+
+    Operações: `cache` (leitura atendida ou não pela memória), `save`
+    (gravações em memória), `leitura` e `escrita` (idas ao backend, com
+    bytes, requisições HTTP, latência e códigos de erro).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()  # backends registram a partir das threads do executor
+        self._series = {}
+
+    def _serie(self, operacao, arquivo, chamador):
+        chave = (operacao, arquivo, chamador or "?")
+        serie = self._series.get(chave)
+        if serie is None:
+            serie = self._series[chave] = {
+                "chamadas": 0, "acertos": 0, "bytes": 0, "requisicoes": 0,
+                "erros": {}, "latencias": deque(maxlen=METRICAS_AMOSTRAS),
+            }
+        return serie
+
+    def registrar(self, operacao, arquivo, chamador, segundos=None, bytes_=0,
+                  requisicoes=0, erros=(), acerto=False):
+        with self._lock:
+            serie = self._serie(operacao, arquivo, chamador)
+            serie["chamadas"] += 1
+            serie["acertos"] += acerto
+            serie["bytes"] += bytes_
+            serie["requisicoes"] += requisicoes
+            for codigo in erros:
+                serie["erros"][codigo] = serie["erros"].get(codigo, 0) + 1
+            if segundos is not None:
+                serie["latencias"].append(segundos)
+
+    @staticmethod
+    def _percentis(latencias):
+        if not latencias:
+            return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+        ordenadas = sorted(latencias)
+        def p(q):
+            return round(ordenadas[min(len(ordenadas) - 1, math.ceil(q * len(ordenadas)) - 1)] * 1000, 1)
+        return {"p50_ms": p(0.50), "p95_ms": p(0.95), "p99_ms": p(0.99)}
+
+    def snapshot(self):
+        """Lista serializável em JSON de todas as séries."""
+        with self._lock:
+            series = [(chave, dict(serie, latencias=list(serie["latencias"]), erros=dict(serie["erros"])))
+                      for chave, serie in self._series.items()]
+        resultado = []
+        for (operacao, arquivo, chamador), serie in sorted(series):
+            item = {"operacao": operacao, "arquivo": arquivo, "chamador": chamador}
+            item.update({k: v for k, v in serie.items() if k != "latencias"})
+            item.update(self._percentis(serie["latencias"]))
+            resultado.append(item)
+        return resultado
+
+    def por_arquivo(self):
+        """Totais por arquivo, somando todos os chamadores."""
+        with self._lock:
+            series = [(chave, dict(serie, latencias=list(serie["latencias"])))
+                      for chave, serie in self._series.items()]
+        arquivos = {}
+        for (operacao, arquivo, _), serie in series:
+            total = arquivos.setdefault(arquivo, {
+                "leituras": 0, "escritas": 0, "bytes": 0, "requisicoes": 0,
+                "cache": 0, "acertos": 0, "erros": 0, "latencias": [],
+            })
+            if operacao == "cache":
+                total["cache"] += serie["chamadas"]
+                total["acertos"] += serie["acertos"]
+            elif operacao in ("leitura", "escrita"):
+                total["leituras" if operacao == "leitura" else "escritas"] += serie["chamadas"]
+                total["bytes"] += serie["bytes"]
+                total["requisicoes"] += serie["requisicoes"]
+                total["erros"] += sum(serie["erros"].values())
+                total["latencias"].extend(serie["latencias"])
+        for total in arquivos.values():
+            total.update(self._percentis(total.pop("latencias")))
+        return arquivos
+
+metricas_storage = MetricasArmazenamento()
+
+# Funções que só repassam para o `store`: o chamador registrado é quem chamou estas
+_FUNCOES_DE_ARMAZENAMENTO = {
+    "envolvido", "__aenter__", "__aexit__",
+    "carregar_atividade", "carregar_series", "carregar_isencao", "carregar_casamentos",
+    "s2_load", "s2_load_salas",
+}
+
+def _chamador():
+    """Nome da primeira função do bot, fora da camada de armazenamento, na pilha atual."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        nome = frame.f_code.co_name
+        if frame.f_code.co_filename == __file__ and nome not in _FUNCOES_DE_ARMAZENAMENTO:
+            return nome
+        frame = frame.f_back
+    return "?"
+
+def _rastrear_chamador(metodo):
+    """Registra em `_chamador_atual` quem iniciou a operação de armazenamento.
+    Tasks criadas dentro dela (gather) herdam o valor."""
+    @functools.wraps(metodo)
+    async def envolvido(*args, **kwargs):
+        if _chamador_atual.get() is not None:
+            return await metodo(*args, **kwargs)
+        token = _chamador_atual.set(_chamador())
+        try:
+            return await metodo(*args, **kwargs)
+        finally:
+            _chamador_atual.reset(token)
+    return envolvido
+
+def _iniciar_io():
+    """Zera o registro de I/O da thread atual (bytes por arquivo, requisições, erros)."""
+    _contexto_thread.io = io = {"bytes": {}, "requisicoes": 0, "erros": []}
+    return io
+
+def _contar_bytes(nome_arquivo, quantidade):
+    io = getattr(_contexto_thread, "io", None)
+    if io is not None:
+        io["bytes"][nome_arquivo] = io["bytes"].get(nome_arquivo, 0) + quantidade
+
+def _anotar_erro(codigo):
+    io = getattr(_contexto_thread, "io", None)
+    if io is not None:
+        io["erros"].append(str(codigo))
 
 def normalizar_texto(txt: str) -> str:
     """Remove acentuação e converte para minúsculas."""
@@ -65,9 +266,9 @@ def normalizar_texto(txt: str) -> str:
         if unicodedata.category(c) != 'Mn'
     ).lower().strip()
 
-def usuario_tem_imunidade(user_id, guild_id):
+async def usuario_tem_imunidade(user_id, guild_id):
     """Verifica se um usuário possui personagem imune."""
-    imunes = carregar_json(ARQUIVO_IMUNES)
+    imunes = await store.load(ARQUIVO_IMUNES)
     guild_id_str = str(guild_id)
     user_id_str = str(user_id)
     
@@ -88,116 +289,1437 @@ async def enviar_dm(usuario: discord.Member, embed: discord.Embed):
 def agora_brasil():
     return datetime.utcnow() - timedelta(hours=3)
 
+# Datas gravadas nos documentos são segundos epoch inteiros; só a exibição usa Brasília
+_EPOCH_BRASIL = datetime(1970, 1, 1) - timedelta(hours=3)
+
+def agora_epoch():
+    return int(time.time())
+
+def epoch_para_brasil(ts):
+    return _EPOCH_BRASIL + timedelta(seconds=ts)
+
+def brasil_para_epoch(data):
+    return int((data - _EPOCH_BRASIL).total_seconds())
+
+def formatar_epoch(ts, formato="%d/%m/%Y %H:%M"):
+    return epoch_para_brasil(ts).strftime(formato)
+
 # === FUNÇÕES GITHUB ===
+def _cache_valido(nome_arquivo):
+    """Retorna o documento em cache (sem copiar), ou None se ausente/expirado."""
+    entrada = _cache_documentos.get(nome_arquivo)
+    if entrada is None:
+        return None
+    carregado_em, dados = entrada
+    # Documentos com gravação pendente ou em andamento nunca expiram: a memória é a versão mais nova
+    if (CACHE_TTL > 0 and nome_arquivo not in _documentos_pendentes
+            and nome_arquivo not in _documentos_em_gravacao
+            and time.monotonic() - carregado_em > CACHE_TTL):
+        del _cache_documentos[nome_arquivo]
+        return None
+    return dados
+
+def _cache_obter(nome_arquivo):
+    """Retorna uma cópia do documento em cache, ou None se ausente/expirado."""
+    dados = _cache_valido(nome_arquivo)
+    return copy.deepcopy(dados) if dados is not None else None
+
+def _cache_guardar(nome_arquivo, dados, copiar=True):
+    _cache_documentos[nome_arquivo] = (time.monotonic(), copy.deepcopy(dados) if copiar else dados)
+    _versoes_documentos[nome_arquivo] = _versoes_documentos.get(nome_arquivo, 0) + 1
+
+def invalidar_cache(nome_arquivo=None):
+    """Descarta um documento do cache (ou todos) para forçar nova leitura do backend.
+
+    Documentos com gravação pendente ou em andamento são mantidos; use `store.flush()` antes.
+    """
+    if nome_arquivo is None:
+        nomes = list(_cache_documentos)
+    else:
+        # Um documento fragmentado leva junto todos os seus shards
+        prefixo = nome_arquivo[:-len(".json")] + "/"
+        nomes = [nome_arquivo] + [n for n in _cache_documentos if n.startswith(prefixo)]
+    for nome in nomes:
+        if nome not in _documentos_pendentes and nome not in _documentos_em_gravacao:
+            _cache_documentos.pop(nome, None)
+
 def carregar_json(nome_arquivo):
-    url = f"https://api.github.com/repos/{REPO}/contents/{nome_arquivo}?ref={BRANCH}"
-    headers = {"Authorization": f"token {GITHUB_TOKEN}"}
-    r = requests.get(url, headers=headers)
-    if r.status_code == 200:
-        content = base64.b64decode(r.json()["content"]).decode("utf-8")
+    """Lê um documento do backend (roda no executor). Retorna None se a leitura
+    falhou. Não escreve no cache: quem guarda é o event loop, em `store.load`."""
+    dados = _cache_obter(nome_arquivo)
+    if dados is not None:
+        return dados
+
+    io = _iniciar_io()
+    inicio = time.perf_counter()
+    try:
+        dados = backend.carregar(nome_arquivo)
+    except LimiteGitHubExcedido as e:
+        print(f"⚠️ Não foi possível carregar {nome_arquivo}: {e}")
+        _anotar_erro("cota")
+        dados = None
+    except Exception as e:
+        _anotar_erro(type(e).__name__)
+        raise
+    finally:
+        if dados is None and not io["erros"]:
+            _anotar_erro("falha")
+        metricas_storage.registrar(
+            "leitura", nome_arquivo, getattr(_contexto_thread, "chamador", None),
+            time.perf_counter() - inicio, io["bytes"].get(nome_arquivo, 0), io["requisicoes"], io["erros"]
+        )
+    return dados
+
+def gravar_documentos(documentos):
+    """`backend.salvar_varios` com métricas por arquivo. Roda no executor."""
+    io = _iniciar_io()
+    inicio = time.perf_counter()
+    ok = False
+    try:
+        ok = backend.salvar_varios(documentos)
+        return ok
+    except Exception as e:
+        _anotar_erro(type(e).__name__)
+        raise
+    finally:
+        if not ok and not io["erros"]:
+            _anotar_erro("falha")
+        segundos = time.perf_counter() - inicio
+        chamador = getattr(_contexto_thread, "chamador", None)
+        # Num commit com vários arquivos, tempo e requisições são do lote inteiro
+        for nome in documentos:
+            metricas_storage.registrar(
+                "escrita", nome, chamador, segundos, io["bytes"].get(nome, 0), io["requisicoes"], io["erros"]
+            )
+
+def _serializar(dados, formato=None):
+    """Codifica um documento em bytes no formato configurado (STORAGE_FORMATO).
+
+    legivel: JSON indentado; compacto: JSON sem espaços; gzip: compacto + gzip.
+    """
+    formato = formato or STORAGE_FORMATO
+    if formato == "legivel":
+        return json.dumps(dados, indent=4, ensure_ascii=False).encode("utf-8")
+    conteudo = json.dumps(dados, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if formato == "gzip":
+        # mtime fixo: o mesmo documento gera sempre os mesmos bytes (e o mesmo sha)
+        return gzip.compress(conteudo, mtime=0)
+    return conteudo
+
+def _desserializar(conteudo):
+    """Decodifica bytes de qualquer formato; o gzip é reconhecido pelo cabeçalho."""
+    if conteudo[:2] == b"\x1f\x8b":
+        conteudo = gzip.decompress(conteudo)
+    return json.loads(conteudo.decode("utf-8"))
+
+def _sha_blob(conteudo):
+    """Sha que o git atribui a um blob com estes bytes."""
+    return hashlib.sha1(b"blob %d\x00" % len(conteudo) + conteudo).hexdigest()
+
+def _mesclar_documentos(base, nosso, deles):
+    """Merge de três vias: o que mudamos em relação à base vence, o resto fica
+    como está no remoto. Desce recursivamente nos dicionários."""
+    if not (isinstance(base, dict) and isinstance(nosso, dict) and isinstance(deles, dict)):
+        return nosso
+    resultado = dict(deles)
+    for chave in set(base) | set(nosso):
+        if chave not in nosso:
+            resultado.pop(chave, None)  # removida por nós
+        elif chave not in base:
+            resultado[chave] = nosso[chave]  # criada por nós
+        elif nosso[chave] != base[chave]:
+            if chave in deles:
+                resultado[chave] = _mesclar_documentos(base[chave], nosso[chave], deles[chave])
+            else:
+                resultado[chave] = nosso[chave]
+    return resultado
+
+# === AGENDADOR DE REQUISIÇÕES AO GITHUB ===
+class LimiteGitHubExcedido(Exception):
+    """Cota do GitHub esgotada por mais tempo do que uma leitura interativa pode esperar."""
+
+def _com_contexto(prioridade, chamador, funcao, *args):
+    """Executa `funcao` numa thread do executor marcando a prioridade das requisições
+    dela e a função do bot que a originou (para as métricas)."""
+    _contexto_thread.prioridade = prioridade
+    _contexto_thread.chamador = chamador
+    return funcao(*args)
+
+def marcar_trafego_de_fundo():
+    """Marca as leituras/gravações da task atual (loops) como tráfego de fundo."""
+    _prioridade_atual.set(PRIORIDADE_FUNDO)
+
+class AgendadorGitHub:
+    """Uma sessão HTTP keep-alive compartilhada e um controle da cota da API.
+
+    Lê X-RateLimit-* e Retry-After de cada resposta, espera quando a cota acaba
+    ou um limite secundário é atingido e dá a vez às requisições interativas:
+    o tráfego de fundo para quando restam GITHUB_RESERVA_INTERATIVA requisições.
+    """
+
+    def __init__(self, conexoes=STORAGE_WORKERS, reserva=GITHUB_RESERVA_INTERATIVA):
+        self.sessao = requests.Session()
+        self.sessao.headers["Authorization"] = f"token {GITHUB_TOKEN}"
+        adaptador = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=conexoes)
+        self.sessao.mount("https://", adaptador)
+        self.sessao.mount("http://", adaptador)
+
+        self.reserva = reserva
+        self._cond = threading.Condition()
+        self._fila = []  # heap de (prioridade, ordem de chegada)
+        self._ordem = itertools.count()
+        self._livres = conexoes
+
+        self.limite = None
+        self.restante = None
+        self.reset_em = 0.0        # epoch em que a cota é renovada
+        self.bloqueado_ate = 0.0   # epoch até quando nada deve ser enviado
+        self.requisicoes = {PRIORIDADE_INTERATIVA: 0, PRIORIDADE_FUNDO: 0}
+        self.respostas_limitadas = 0
+        self.espera_total = 0.0
+
+    def _liberado_em(self, prioridade):
+        """Epoch a partir do qual uma requisição desta prioridade pode sair."""
+        liberado = self.bloqueado_ate
+        if (prioridade == PRIORIDADE_FUNDO and self.restante is not None
+                and self.restante <= self.reserva):
+            liberado = max(liberado, self.reset_em)
+        return liberado
+
+    def _entrar(self, prioridade):
+        ticket = (prioridade, next(self._ordem))
+        inicio = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._fila, ticket)
+            while True:
+                espera = self._liberado_em(prioridade) - time.time()
+                if espera <= 0 and self._livres > 0 and self._fila[0] == ticket:
+                    break
+                if prioridade == PRIORIDADE_INTERATIVA and espera > GITHUB_ESPERA_INTERATIVA:
+                    self._fila.remove(ticket)
+                    heapq.heapify(self._fila)
+                    self._cond.notify_all()
+                    raise LimiteGitHubExcedido(f"cota do GitHub bloqueada por mais {int(espera)}s")
+                self._cond.wait(timeout=min(max(espera, 0.05), 5.0))
+            heapq.heappop(self._fila)
+            self._livres -= 1
+            self._cond.notify_all()
+            self.espera_total += time.monotonic() - inicio
+
+    def _sair(self):
+        with self._cond:
+            self._livres += 1
+            self._cond.notify_all()
+
+    def _registrar(self, r, prioridade, tentativa):
+        """Atualiza a cota a partir dos headers. Retorna True se a resposta foi um limite."""
+        agora = time.time()
+        with self._cond:
+            self.requisicoes[prioridade] += 1
+            if "X-RateLimit-Limit" in r.headers:
+                self.limite = int(r.headers["X-RateLimit-Limit"])
+            if "X-RateLimit-Remaining" in r.headers:
+                self.restante = int(r.headers["X-RateLimit-Remaining"])
+            if "X-RateLimit-Reset" in r.headers:
+                self.reset_em = float(r.headers["X-RateLimit-Reset"])
+
+            limitada = r.status_code == 429 or (
+                r.status_code == 403 and (self.restante == 0 or "rate limit" in r.text.lower())
+            )
+            if not limitada:
+                return False
+
+            self.respostas_limitadas += 1
+            if "Retry-After" in r.headers:
+                self.bloqueado_ate = agora + int(r.headers["Retry-After"])
+            elif self.restante == 0:
+                self.bloqueado_ate = self.reset_em
+            else:
+                # Limite secundário sem Retry-After: pelo menos 1 minuto, dobrando a cada nova falha
+                self.bloqueado_ate = agora + 60 * 2 ** tentativa
+            self._cond.notify_all()
+        print(f"⏳ Limite do GitHub atingido ({r.status_code}); pausando até {datetime.fromtimestamp(self.bloqueado_ate):%H:%M:%S}")
+        return True
+
+    def requisitar(self, metodo, url, tentativas=3, **kwargs):
+        prioridade = getattr(_contexto_thread, "prioridade", PRIORIDADE_INTERATIVA)
+        for tentativa in range(tentativas):
+            self._entrar(prioridade)
+            try:
+                r = self.sessao.request(metodo, url, timeout=30, **kwargs)
+            finally:
+                self._sair()
+            io = getattr(_contexto_thread, "io", None)
+            if io is not None:
+                io["requisicoes"] += 1
+                if r.status_code >= 400:
+                    io["erros"].append(str(r.status_code))
+            if not self._registrar(r, prioridade, tentativa):
+                return r
+        return r
+
+    def metricas(self):
+        with self._cond:
+            return {
+                "limite": self.limite,
+                "restante": self.restante,
+                "reset_em": self.reset_em,
+                "bloqueado_por_s": max(0.0, round(self.bloqueado_ate - time.time(), 1)),
+                "em_fila": len(self._fila),
+                "requisicoes_interativas": self.requisicoes[PRIORIDADE_INTERATIVA],
+                "requisicoes_fundo": self.requisicoes[PRIORIDADE_FUNDO],
+                "respostas_limitadas": self.respostas_limitadas,
+                "espera_total_s": round(self.espera_total, 2),
+            }
+
+agendador = AgendadorGitHub()
+
+# === BACKENDS DE ARMAZENAMENTO ===
+class BackendArmazenamento:
+    """Interface dos backends. Os métodos são bloqueantes e rodam no executor do `store`.
+
+    carregar(nome) -> dict com o documento ({} se não existe, None em caso de erro)
+    salvar(nome, dados) -> bool
+    salvar_varios({nome: dados}) -> bool, atômico quando o backend permite
+    retirar_mesclados() -> {nome: dados} resolvidos em conflitos desde a última chamada
+    """
+    nome = "base"
+
+    def carregar(self, nome_arquivo):
+        raise NotImplementedError
+
+    def salvar(self, nome_arquivo, dados):
+        raise NotImplementedError
+
+    def salvar_varios(self, documentos):
+        return all([self.salvar(nome, dados) for nome, dados in documentos.items()])
+
+    def retirar_mesclados(self):
+        return {}
+
+class BackendGitHub(BackendArmazenamento):
+    """Arquivos JSON no repositório GITHUB_REPO (Contents API e Git Data API).
+
+    Guarda o sha do blob de cada leitura e gravação para que o PUT seguinte
+    não precise de um GET. Se o arquivo mudou no remoto nesse meio tempo, as
+    chaves alteradas localmente são mescladas sobre a versão remota. Um
+    arquivo que este processo nunca leu é mesclado com base vazia: as chaves
+    que só existem no remoto ficam.
+    """
+    nome = "github"
+
+    def __init__(self):
+        self._lock = threading.Lock()  # leituras e gravações chegam de várias threads do executor
+        self._shas = {}       # nome -> sha do blob da última versão lida/gravada (None = não existe)
+        self._bases = {}      # nome -> conteúdo dessa versão (base do merge de três vias)
+        self._mesclados = {}  # nome -> resultado de merges ainda não repassados ao cache
+
+    def _lembrar(self, nome_arquivo, sha, dados):
+        base = copy.deepcopy(dados)
+        with self._lock:
+            self._shas[nome_arquivo] = sha
+            self._bases[nome_arquivo] = base
+
+    def _versao(self, nome_arquivo):
+        """(conhecida, sha, base) da última versão lida/gravada por este processo."""
+        with self._lock:
+            if nome_arquivo not in self._shas:
+                return False, None, {}
+            return True, self._shas[nome_arquivo], self._bases[nome_arquivo]
+
+    def _mesclar(self, nome_arquivo, dados, remoto, sha_remoto):
+        """Mescla `dados` sobre a versão remota e passa a tomar essa versão como base."""
+        _, _, base = self._versao(nome_arquivo)
+        mesclado = _mesclar_documentos(base, dados, remoto)
+        with self._lock:
+            self._mesclados[nome_arquivo] = mesclado
+        self._lembrar(nome_arquivo, sha_remoto, remoto)
+        return mesclado
+
+    def retirar_mesclados(self):
+        with self._lock:
+            mesclados, self._mesclados = self._mesclados, {}
+        return mesclados
+
+    def _buscar(self, nome_arquivo):
+        """GET na Contents API. Retorna (status, dados, sha)."""
+        url = f"{GITHUB_API_URL}/repos/{REPO}/contents/{nome_arquivo}?ref={BRANCH}"
+        r = agendador.requisitar("GET", url)
+        if r.status_code != 200:
+            return r.status_code, None, None
+        corpo = r.json()
+        conteudo = base64.b64decode(corpo["content"])
+        _contar_bytes(nome_arquivo, len(conteudo))
         try:
-            return json.loads(content)
-        except json.JSONDecodeError:
+            return 200, _desserializar(conteudo), corpo["sha"]
+        except (json.JSONDecodeError, UnicodeDecodeError, OSError):
             print(f"⚠️ Erro ao decodificar {nome_arquivo}")
+            return 200, None, corpo["sha"]
+
+    def _ler_blob(self, sha, nome_arquivo):
+        r = agendador.requisitar("GET", f"{GITHUB_API_URL}/repos/{REPO}/git/blobs/{sha}")
+        if r.status_code != 200:
+            print(f"❌ Erro ao ler o blob {sha}: {r.status_code} - {r.text}")
+            return None
+        conteudo = base64.b64decode(r.json()["content"])
+        _contar_bytes(nome_arquivo, len(conteudo))
+        return _desserializar(conteudo)
+
+    def carregar(self, nome_arquivo):
+        status, dados, sha = self._buscar(nome_arquivo)
+        if status == 200:
+            if dados is not None:
+                self._lembrar(nome_arquivo, sha, dados)
+            return dados
+        elif status == 404:
+            # Arquivo ainda não existe: será criado no primeiro salvamento
+            self._lembrar(nome_arquivo, None, {})
             return {}
+        else:
+            print(f"⚠️ Não foi possível carregar {nome_arquivo}: {status}")
+            return None
+
+    def salvar(self, nome_arquivo, dados, tentativas=3):
+        conhecida, _, _ = self._versao(nome_arquivo)
+        if not conhecida:
+            # Nunca lido por este processo: descobre o sha atual antes do PUT e
+            # mescla o que já existe no remoto
+            status, remoto, sha = self._buscar(nome_arquivo)
+            if status == 200 and remoto is not None:
+                dados = self._mesclar(nome_arquivo, dados, remoto, sha)
+            elif status == 404:
+                self._lembrar(nome_arquivo, None, {})
+
+        url = f"{GITHUB_API_URL}/repos/{REPO}/contents/{nome_arquivo}"
+        for _ in range(tentativas):
+            conteudo = _serializar(dados)
+            _contar_bytes(nome_arquivo, len(conteudo))
+            base64_content = base64.b64encode(conteudo).decode()
+            data = {"message": f"Atualizando {nome_arquivo}", "content": base64_content, "branch": BRANCH}
+            _, sha_atual, _ = self._versao(nome_arquivo)
+            if sha_atual:
+                data["sha"] = sha_atual
+            r = agendador.requisitar("PUT", url, json=data)
+            if r.status_code in (200, 201):
+                self._lembrar(nome_arquivo, r.json()["content"]["sha"], dados)
+                return True
+            if r.status_code not in (409, 422):
+                print(f"❌ Erro ao salvar {nome_arquivo}: {r.status_code} - {r.text}")
+                return False
+
+            # Conflito: o arquivo mudou no remoto depois da nossa última leitura
+            status, remoto, sha = self._buscar(nome_arquivo)
+            if status == 404:
+                remoto, sha = {}, None
+            elif status != 200 or remoto is None:
+                print(f"❌ Conflito em {nome_arquivo} e não foi possível ler a versão remota: {status}")
+                return False
+            dados = self._mesclar(nome_arquivo, dados, remoto, sha)
+            print(f"🔀 Conflito em {nome_arquivo}: mudanças locais mescladas com a versão remota")
+
+        print(f"❌ Desistindo de salvar {nome_arquivo} após {tentativas} tentativas")
+        return False
+
+    def salvar_varios(self, documentos, tentativas=3):
+        """Publica vários arquivos num único commit pela Git Data API.
+
+        Cria uma tree sobre a tree atual, um commit e faz um único update da
+        ref: ou todos os arquivos mudam, ou nenhum muda.
+        """
+        if len(documentos) == 1:
+            [(nome_arquivo, dados)] = documentos.items()
+            return self.salvar(nome_arquivo, dados)
+
+        documentos = dict(documentos)
+        base = f"{GITHUB_API_URL}/repos/{REPO}/git"
+        mensagem = "Atualizando " + ", ".join(sorted(documentos))
+
+        for _ in range(tentativas):
+            r = agendador.requisitar("GET", f"{base}/ref/heads/{BRANCH}")
+            if r.status_code != 200:
+                print(f"❌ Erro ao ler a ref {BRANCH}: {r.status_code} - {r.text}")
+                return False
+            commit_pai = r.json()["object"]["sha"]
+
+            r = agendador.requisitar("GET", f"{base}/trees/{commit_pai}?recursive=1")
+            if r.status_code != 200:
+                print(f"❌ Erro ao ler a tree de {commit_pai}: {r.status_code} - {r.text}")
+                return False
+            tree_base = r.json()["sha"]
+            shas_remotos = {e["path"]: e["sha"] for e in r.json()["tree"] if e["type"] == "blob"}
+
+            # Arquivos que mudaram no remoto desde a nossa leitura (ou que nunca lemos
+            # e já existem lá): base e blob remoto são buscados e mesclados antes do commit
+            for nome_arquivo in documentos:
+                sha_remoto = shas_remotos.get(nome_arquivo)
+                _, sha, _ = self._versao(nome_arquivo)  # nunca lido: sha None, base vazia
+                if sha_remoto == sha:
+                    continue
+                remoto = self._ler_blob(sha_remoto, nome_arquivo) if sha_remoto else {}
+                if remoto is None:
+                    return False
+                documentos[nome_arquivo] = self._mesclar(nome_arquivo, documentos[nome_arquivo], remoto, sha_remoto)
+                print(f"🔀 {nome_arquivo} mudou no remoto: mudanças locais mescladas")
+
+            conteudos = {nome: _serializar(dados) for nome, dados in documentos.items()}
+            for nome, conteudo in conteudos.items():
+                _contar_bytes(nome, len(conteudo))
+            entradas = [self._entrada_tree(nome, conteudo) for nome, conteudo in conteudos.items()]
+            if None in entradas:
+                return False
+            r = agendador.requisitar("POST", f"{base}/trees", json={"base_tree": tree_base, "tree": entradas})
+            if r.status_code != 201:
+                print(f"❌ Erro ao criar tree: {r.status_code} - {r.text}")
+                return False
+            nova_tree = r.json()["sha"]
+
+            r = agendador.requisitar(
+                "POST",
+                f"{base}/commits",
+                json={"message": mensagem, "tree": nova_tree, "parents": [commit_pai]}
+            )
+            if r.status_code != 201:
+                print(f"❌ Erro ao criar commit: {r.status_code} - {r.text}")
+                return False
+            novo_commit = r.json()["sha"]
+
+            r = agendador.requisitar("PATCH", f"{base}/refs/heads/{BRANCH}", json={"sha": novo_commit, "force": False})
+            if r.status_code == 200:
+                for nome, conteudo in conteudos.items():
+                    self._lembrar(nome, _sha_blob(conteudo), documentos[nome])
+                return True
+            if r.status_code != 422:
+                print(f"❌ Erro ao atualizar a ref {BRANCH}: {r.status_code} - {r.text}")
+                return False
+            # 422: a branch andou desde a leitura da ref (não é fast-forward); refaz sobre a nova ponta
+            print(f"⚠️ {BRANCH} mudou durante o commit de {mensagem}; tentando novamente")
+
+        print(f"❌ Desistindo do commit após {tentativas} tentativas: {mensagem}")
+        return False
+
+    def _entrada_tree(self, nome_arquivo, conteudo):
+        """Entrada de tree para um arquivo. Texto vai inline; conteúdo binário
+        (gzip) precisa virar blob antes, em base64."""
+        if STORAGE_FORMATO != "gzip":
+            return {"path": nome_arquivo, "mode": "100644", "type": "blob", "content": conteudo.decode("utf-8")}
+        r = agendador.requisitar(
+            "POST",
+            f"{GITHUB_API_URL}/repos/{REPO}/git/blobs",
+            json={"content": base64.b64encode(conteudo).decode(), "encoding": "base64"}
+        )
+        if r.status_code != 201:
+            print(f"❌ Erro ao criar blob de {nome_arquivo}: {r.status_code} - {r.text}")
+            return None
+        return {"path": nome_arquivo, "mode": "100644", "type": "blob", "sha": r.json()["sha"]}
+
+class BackendArquivos(BackendArmazenamento):
+    """Arquivos JSON num diretório local (STORAGE_DIR)."""
+    nome = "arquivos"
+
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+
+    def _caminho(self, nome_arquivo):
+        return os.path.join(self.diretorio, nome_arquivo)
+
+    def carregar(self, nome_arquivo):
+        caminho = self._caminho(nome_arquivo)
+        if not os.path.exists(caminho):
+            return {}
+        try:
+            with open(caminho, "rb") as f:
+                conteudo = f.read()
+            _contar_bytes(nome_arquivo, len(conteudo))
+            return _desserializar(conteudo)
+        except (OSError, json.JSONDecodeError, UnicodeDecodeError) as e:
+            _anotar_erro(type(e).__name__)
+            print(f"⚠️ Erro ao ler {caminho}: {e}")
+            return None
+
+    def _escrever_temporario(self, nome_arquivo, dados):
+        caminho = self._caminho(nome_arquivo)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        temporario = caminho + ".tmp"
+        conteudo = _serializar(dados)
+        _contar_bytes(nome_arquivo, len(conteudo))
+        with open(temporario, "wb") as f:
+            f.write(conteudo)
+        return temporario, caminho
+
+    def salvar(self, nome_arquivo, dados):
+        return self.salvar_varios({nome_arquivo: dados})
+
+    def salvar_varios(self, documentos):
+        # Escreve todos os temporários antes de trocar qualquer arquivo; cada
+        # os.replace é atômico, então nenhum arquivo fica gravado pela metade
+        try:
+            trocas = [self._escrever_temporario(nome, dados) for nome, dados in documentos.items()]
+            for temporario, caminho in trocas:
+                os.replace(temporario, caminho)
+        except OSError as e:
+            _anotar_erro(type(e).__name__)
+            print(f"❌ Erro ao salvar {', '.join(documentos)} em {self.diretorio}: {e}")
+            return False
+        return True
+
+class BackendSQLite(BackendArmazenamento):
+    """Banco SQLite local (STORAGE_SQLITE_PATH).
+
+    Os mapas grandes (DOCUMENTOS_POR_CHAVE) ficam com uma linha por chave:
+    ler um usuário ou gravar uma alteração toca só a linha dele. Os demais
+    documentos ficam inteiros na tabela `documentos`.
+    """
+    nome = "sqlite"
+
+    def __init__(self, caminho):
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._linhas = {}  # documento -> {chave: valor serializado} como está no banco
+        with self._conexao:
+            self._conexao.execute(
+                "CREATE TABLE IF NOT EXISTS documentos (nome TEXT PRIMARY KEY, conteudo TEXT NOT NULL)"
+            )
+            self._conexao.execute(
+                "CREATE TABLE IF NOT EXISTS linhas ("
+                "documento TEXT NOT NULL, chave TEXT NOT NULL, valor TEXT NOT NULL, "
+                "PRIMARY KEY (documento, chave))"
+            )
+
+    def _ler_linhas(self, nome_arquivo):
+        cursor = self._conexao.execute("SELECT chave, valor FROM linhas WHERE documento = ?", (nome_arquivo,))
+        return dict(cursor.fetchall())
+
+    def carregar(self, nome_arquivo):
+        with self._lock:
+            if nome_arquivo in DOCUMENTOS_POR_CHAVE:
+                linhas = self._ler_linhas(nome_arquivo)
+                self._linhas[nome_arquivo] = linhas
+                _contar_bytes(nome_arquivo, sum(len(valor) for valor in linhas.values()))
+                return {chave: json.loads(valor) for chave, valor in linhas.items()}
+            linha = self._conexao.execute(
+                "SELECT conteudo FROM documentos WHERE nome = ?", (nome_arquivo,)
+            ).fetchone()
+            if not linha:
+                return {}
+            _contar_bytes(nome_arquivo, len(linha[0]))
+            return json.loads(linha[0])
+
+    def carregar_chave(self, nome_arquivo, chave):
+        """Lê uma única linha de um documento por chave (None se não existe)."""
+        with self._lock:
+            linha = self._conexao.execute(
+                "SELECT valor FROM linhas WHERE documento = ? AND chave = ?", (nome_arquivo, str(chave))
+            ).fetchone()
+        return json.loads(linha[0]) if linha else None
+
+    def salvar(self, nome_arquivo, dados):
+        return self.salvar_varios({nome_arquivo: dados})
+
+    def salvar_varios(self, documentos):
+        with self._lock:
+            try:
+                with self._conexao:  # uma transação SQL: tudo ou nada
+                    for nome_arquivo, dados in documentos.items():
+                        if nome_arquivo in DOCUMENTOS_POR_CHAVE:
+                            self._gravar_linhas(nome_arquivo, dados)
+                        else:
+                            conteudo = json.dumps(dados, ensure_ascii=False)
+                            _contar_bytes(nome_arquivo, len(conteudo))
+                            self._conexao.execute(
+                                "INSERT INTO documentos (nome, conteudo) VALUES (?, ?) "
+                                "ON CONFLICT(nome) DO UPDATE SET conteudo = excluded.conteudo",
+                                (nome_arquivo, conteudo)
+                            )
+            except sqlite3.Error as e:
+                _anotar_erro(type(e).__name__)
+                # Rollback: o retrato das linhas em memória não vale mais
+                for nome_arquivo in documentos:
+                    self._linhas.pop(nome_arquivo, None)
+                print(f"❌ Erro ao salvar {', '.join(documentos)} no SQLite: {e}")
+                return False
+        return True
+
+    def _gravar_linhas(self, nome_arquivo, dados):
+        """Grava só as chaves que mudaram desde a última leitura/gravação."""
+        anteriores = self._linhas.get(nome_arquivo)
+        if anteriores is None:
+            anteriores = self._ler_linhas(nome_arquivo)
+        atuais = {
+            str(chave): json.dumps(valor, ensure_ascii=False, sort_keys=True)
+            for chave, valor in dados.items()
+        }
+        removidas = [(nome_arquivo, chave) for chave in anteriores if chave not in atuais]
+        alteradas = [
+            (nome_arquivo, chave, valor)
+            for chave, valor in atuais.items()
+            if anteriores.get(chave) != valor
+        ]
+        if removidas:
+            self._conexao.executemany("DELETE FROM linhas WHERE documento = ? AND chave = ?", removidas)
+        _contar_bytes(nome_arquivo, sum(len(valor) for _, _, valor in alteradas))
+        if alteradas:
+            self._conexao.executemany(
+                "INSERT INTO linhas (documento, chave, valor) VALUES (?, ?, ?) "
+                "ON CONFLICT(documento, chave) DO UPDATE SET valor = excluded.valor",
+                alteradas
+            )
+        self._linhas[nome_arquivo] = atuais
+
+def criar_backend(tipo):
+    """Instancia o backend escolhido em STORAGE_BACKEND."""
+    if tipo == "github":
+        return BackendGitHub()
+    if tipo in ("arquivos", "local"):
+        return BackendArquivos(STORAGE_DIR)
+    if tipo == "sqlite":
+        return BackendSQLite(STORAGE_SQLITE_PATH)
+    raise ValueError(f"STORAGE_BACKEND desconhecido: {tipo!r} (use github, arquivos ou sqlite)")
+
+if STORAGE_FORMATO not in FORMATOS_ARMAZENAMENTO:
+    raise ValueError(f"STORAGE_FORMATO desconhecido: {STORAGE_FORMATO!r} (use {', '.join(FORMATOS_ARMAZENAMENTO)})")
+if JANELA_ATIVIDADE_DIAS not in JANELAS_ATIVIDADE:
+    raise ValueError(f"JANELA_ATIVIDADE_DIAS inválida: {JANELA_ATIVIDADE_DIAS} (use {', '.join(map(str, JANELAS_ATIVIDADE))})")
+backend = criar_backend(STORAGE_BACKEND)
+
+# === SHARDS ===
+def _bucket(chave, buckets):
+    """Bucket estável de um id de usuário (crc32, igual em qualquer processo)."""
+    return zlib.crc32(str(chave).encode()) % buckets
+
+def nome_shard(nome_arquivo, bucket):
+    """`atividade.json` -> `atividade/03.json`"""
+    return f"{nome_arquivo[:-len('.json')]}/{bucket:02d}.json"
+
+def dividir_em_shards(nome_arquivo, dados, buckets):
+    """Reparte um documento por id de usuário; retorna {nome_shard: dados}."""
+    shards = [{} for _ in range(buckets)]
+    if DOCUMENTOS_FRAGMENTAVEIS[nome_arquivo] == 1:
+        for uid, valor in dados.items():
+            shards[_bucket(uid, buckets)][uid] = valor
     else:
-        print(f"⚠️ Não foi possível carregar {nome_arquivo}: {r.status_code}")
-        return {}
+        for dia, usuarios in dados.items():
+            if not isinstance(usuarios, dict):
+                shards[0][dia] = usuarios
+                continue
+            for uid, valor in usuarios.items():
+                shards[_bucket(uid, buckets)].setdefault(dia, {})[uid] = valor
+    return {nome_shard(nome_arquivo, b): shard for b, shard in enumerate(shards)}
+
+def juntar_shards(nome_arquivo, shards):
+    """Operação inversa de `dividir_em_shards`."""
+    dados = {}
+    for shard in shards:
+        if DOCUMENTOS_FRAGMENTAVEIS[nome_arquivo] == 1:
+            dados.update(shard)
+            continue
+        for dia, usuarios in shard.items():
+            if isinstance(usuarios, dict):
+                dados.setdefault(dia, {}).update(usuarios)
+            else:
+                dados[dia] = usuarios
+    return dados
+
+# === ARMAZENAMENTO ASSÍNCRONO ===
+class Armazenamento:
+    """API awaitable sobre o backend: o I/O roda num executor dedicado, fora do event loop.
+
+    `save` só atualiza a memória e marca o arquivo como pendente; o loop
+    `gravar_pendentes` grava cada arquivo no máximo uma vez por janela.
+    Quando há vários arquivos pendentes eles saem juntos, num único commit.
+    Ciclos ler-alterar-gravar devem usar `editar`, que serializa por documento.
+    """
+
+    def __init__(self, max_workers=STORAGE_WORKERS, max_workers_fundo=STORAGE_WORKERS_FUNDO):
+        self._executores = {
+            PRIORIDADE_INTERATIVA: ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="storage"),
+            PRIORIDADE_FUNDO: ThreadPoolExecutor(max_workers=max_workers_fundo, thread_name_prefix="storage-fundo"),
+        }
+        self._leituras = {}  # (nome_arquivo, prioridade) -> Future de uma leitura em andamento
+        self._flush_lock = asyncio.Lock()
+        self._locks = {}  # nome_arquivo -> asyncio.Lock das edições
+
+    async def _executar(self, funcao, *args, prioridade=None):
+        if prioridade is None:
+            prioridade = _prioridade_atual.get()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executores[prioridade], _com_contexto, prioridade, _chamador_atual.get(), funcao, *args
+        )
+
+    async def _buckets(self, nome_arquivo):
+        """Nº de shards do documento segundo o manifesto (0 = arquivo único)."""
+        if nome_arquivo not in DOCUMENTOS_FRAGMENTAVEIS:
+            return 0
+        return (await self._load_arquivo(ARQUIVO_SHARDS)).get(nome_arquivo, 0)
+
+    async def _load_arquivo(self, nome_arquivo):
+        dados = _cache_obter(nome_arquivo)
+        metricas_storage.registrar("cache", nome_arquivo, _chamador_atual.get(), acerto=dados is not None)
+        if dados is not None:
+            return dados
+
+        # Leituras simultâneas do mesmo arquivo compartilham uma única requisição.
+        # Só dentro da mesma prioridade: um comando não pega carona numa leitura
+        # de fundo que pode estar parada esperando a cota renovar.
+        chave = (nome_arquivo, _prioridade_atual.get())
+        futuro = self._leituras.get(chave)
+        if futuro is None:
+            futuro = asyncio.ensure_future(self._buscar(nome_arquivo))
+            self._leituras[chave] = futuro
+            futuro.add_done_callback(lambda _: self._leituras.pop(chave, None))
+        dados = await asyncio.shield(futuro)
+        return copy.deepcopy(dados)
+
+    async def _buscar(self, nome_arquivo):
+        """Lê do backend e guarda no cache, a menos que o documento tenha sido
+        escrito enquanto a leitura esperava: aí a memória é a versão mais nova."""
+        versao = _versoes_documentos.get(nome_arquivo, 0)
+        dados = await self._executar(carregar_json, nome_arquivo)
+        if _versoes_documentos.get(nome_arquivo, 0) != versao or nome_arquivo in _documentos_pendentes:
+            atual = _cache_valido(nome_arquivo)
+            if atual is not None:
+                return atual
+        if dados is None:
+            return {}
+        # `dados` veio novo do backend e quem lê recebe cópias: dá para guardar sem copiar
+        _cache_guardar(nome_arquivo, dados, copiar=False)
+        return dados
+
+    @_rastrear_chamador
+    async def load(self, nome_arquivo):
+        buckets = await self._buckets(nome_arquivo)
+        if not buckets:
+            return await self._load_arquivo(nome_arquivo)
+        shards = await asyncio.gather(*(
+            self._load_arquivo(nome_shard(nome_arquivo, b)) for b in range(buckets)
+        ))
+        return juntar_shards(nome_arquivo, shards)
+
+    @_rastrear_chamador
+    async def load_key(self, nome_arquivo, chave):
+        """Lê uma única chave de um documento; no SQLite busca só a linha dela
+        e, se o documento estiver fragmentado, só o shard que a contém."""
+        buckets = await self._buckets(nome_arquivo)
+        if buckets:
+            if DOCUMENTOS_FRAGMENTAVEIS[nome_arquivo] != 1:
+                return (await self.load(nome_arquivo)).get(str(chave))
+            nome_arquivo = nome_shard(nome_arquivo, _bucket(chave, buckets))
+        dados = _cache_valido(nome_arquivo)
+        if dados is not None:
+            metricas_storage.registrar("cache", nome_arquivo, _chamador_atual.get(), acerto=True)
+            return copy.deepcopy(dados.get(str(chave)))
+        if nome_arquivo in DOCUMENTOS_POR_CHAVE and hasattr(backend, "carregar_chave"):
+            return await self._executar(backend.carregar_chave, nome_arquivo, chave)
+        return (await self._load_arquivo(nome_arquivo)).get(str(chave))
+
+    @_rastrear_chamador
+    async def save(self, nome_arquivo, dados):
+        self._aplicar(await self._arquivos_alterados(nome_arquivo, dados))
+
+    async def _arquivos_alterados(self, nome_arquivo, dados):
+        """Traduz um documento lógico nos arquivos físicos a gravar: num documento
+        fragmentado, só os shards cujo conteúdo mudou. Nada muda = nada a gravar."""
+        buckets = await self._buckets(nome_arquivo)
+        if not buckets:
+            return {} if _cache_valido(nome_arquivo) == dados else {nome_arquivo: dados}
+        return {
+            nome: shard
+            for nome, shard in dividir_em_shards(nome_arquivo, dados, buckets).items()
+            if _cache_valido(nome) != shard
+        }
 
-def salvar_json(nome_arquivo, dados):
-    url = f"https://api.github.com/repos/{REPO}/contents/{nome_arquivo}"
-    headers = {"Authorization": f"token {GITHUB_TOKEN}"}
-    conteudo = json.dumps(dados, indent=4, ensure_ascii=False)
-    base64_content = base64.b64encode(conteudo.encode()).decode()
-    r = requests.get(url, headers=headers)
-    sha = r.json().get("sha") if r.status_code == 200 else None
-    data = {"message": f"Atualizando {nome_arquivo}", "content": base64_content, "branch": BRANCH}
-    if sha:
-        data["sha"] = sha
-    r = requests.put(url, headers=headers, json=data)
-    if r.status_code not in [200, 201]:
-        print(f"❌ Erro ao salvar {nome_arquivo}: {r.status_code} - {r.text}")
+    def _aplicar(self, arquivos):
+        chamador = _chamador_atual.get() or _chamador()
+        for nome, dados in arquivos.items():
+            metricas_storage.registrar("save", nome, chamador)
+            _cache_guardar(nome, dados)
+        _documentos_pendentes.update(arquivos)
+
+    @_rastrear_chamador
+    async def aquecer(self, nomes=DOCUMENTOS_CONHECIDOS):
+        """Carrega todos os documentos em paralelo para o cache.
+
+        Melhor esforço: um documento que falhar fica no log e é lido de novo
+        no primeiro uso. Retorna {nome: segundos até o documento ficar pronto},
+        contados do início, só dos que carregaram.
+        """
+        inicio = time.perf_counter()
+
+        async def carregar(nome):
+            dados = await self.load(nome)
+            return nome, time.perf_counter() - inicio, len(dados)
+
+        resultados = await asyncio.gather(*(carregar(nome) for nome in nomes), return_exceptions=True)
+        prontos = []
+        for nome, resultado in zip(nomes, resultados):
+            if isinstance(resultado, Exception):
+                print(f"⚠️ {nome}: não foi possível aquecer ({type(resultado).__name__}: {resultado})")
+            else:
+                prontos.append(resultado)
+        for nome, segundos, chaves in sorted(prontos, key=lambda r: r[1]):
+            print(f"📥 {nome}: pronto em {segundos:.2f}s ({chaves} chaves)")
+        print(f"🔥 Cache aquecido: {len(prontos)}/{len(nomes)} documentos em {time.perf_counter() - inicio:.2f}s")
+        return {nome: segundos for nome, segundos, _ in prontos}
+
+    def transaction(self):
+        """Agrupa documentos que devem ser publicados juntos (`async with store.transaction() as tx`)."""
+        return Transacao(self)
+
+    def _lock(self, nome_arquivo):
+        return self._locks.setdefault(nome_arquivo, asyncio.Lock())
+
+    def editar(self, *nomes):
+        """Edição exclusiva de um ou mais documentos:
+
+            async with store.editar(ARQUIVO_COOLDOWN) as cooldowns: ...
+            async with store.editar(ARQ_S2_SALAS, ARQ_S2_PLAYERS) as (salas, players): ...
+
+        Edições do mesmo documento esperam umas pelas outras; documentos
+        diferentes continuam em paralelo.
+        """
+        return Edicao(self, nomes)
+
+    @_rastrear_chamador
+    async def flush(self):
+        """Grava no backend todos os arquivos pendentes: 1 arquivo = 1 PUT, vários = 1 commit."""
+        # Cancelar quem espera (ex.: um loop sendo parado) não interrompe uma gravação já
+        # iniciada: o lock só é solto quando o backend responde, e o próximo flush espera por ela.
+        await asyncio.shield(self._gravar_pendentes())
+
+    async def _gravar_pendentes(self):
+        async with self._flush_lock:
+            if not _documentos_pendentes:
+                return
+            # Desmarca antes de gravar: um save durante o envio volta a marcar.
+            # Enquanto o backend não responde os arquivos ficam "em gravação",
+            # e o cache deles não expira. O cache nunca é alterado no lugar
+            # (só substituído), então o executor pode ler estes objetos sem cópia.
+            nomes = list(_documentos_pendentes)
+            _documentos_pendentes.difference_update(nomes)
+            _documentos_em_gravacao.update(nomes)
+            documentos = {nome: _cache_documentos[nome][1] for nome in nomes}
+
+            try:
+                try:
+                    ok = await self._executar(gravar_documentos, documentos, prioridade=PRIORIDADE_FUNDO)
+                except Exception as e:
+                    print(f"❌ Erro ao gravar {', '.join(nomes)}: {e}")
+                    ok = False
+                if not ok:
+                    # A memória continua sendo a versão certa: volta para a fila como está
+                    _documentos_pendentes.update(nomes)
+
+                # Conflitos resolvidos pelo backend: o cache passa a refletir o merge
+                for nome, mesclado in backend.retirar_mesclados().items():
+                    if nome in _documentos_pendentes and nome in documentos:
+                        # Alterado de novo durante o envio: reaplica as mudanças locais
+                        mesclado = _mesclar_documentos(documentos[nome], _cache_documentos[nome][1], mesclado)
+                    _cache_guardar(nome, mesclado)
+            finally:
+                _documentos_em_gravacao.difference_update(nomes)
+
+class Transacao:
+    """Documentos preparados com `stage` entram no cache e na fila de gravação
+    ao mesmo tempo, no fim do bloco; o próximo flush os publica num único commit.
+    Se o bloco levantar exceção, nada é aplicado."""
+
+    def __init__(self, armazenamento):
+        self._armazenamento = armazenamento
+        self._documentos = {}
+
+    def stage(self, nome_arquivo, dados):
+        self._documentos[nome_arquivo] = dados
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, tipo, exc, tb):
+        if tipo is not None:
+            return False
+        arquivos = {}
+        for nome_arquivo, dados in self._documentos.items():
+            arquivos.update(await self._armazenamento._arquivos_alterados(nome_arquivo, dados))
+        self._armazenamento._aplicar(arquivos)
+        return False
+
+class Edicao(Transacao):
+    """Segura o lock de cada documento do load até a gravação. Os locks são
+    pegos em ordem alfabética, então duas edições com os mesmos arquivos
+    nunca se travam. Os dados devem ser alterados no lugar; ao sair sem
+    exceção tudo é gravado junto, como numa transação. Não é reentrante:
+    não edite de novo um documento dentro do próprio bloco."""
+
+    def __init__(self, armazenamento, nomes):
+        super().__init__(armazenamento)
+        self._nomes = nomes
+        self._locks = [armazenamento._lock(nome) for nome in sorted(set(nomes))]
+        self._adquiridos = 0
+
+    def _liberar(self):
+        for lock in reversed(self._locks[:self._adquiridos]):
+            lock.release()
+        self._adquiridos = 0
+
+    async def __aenter__(self):
+        try:
+            for lock in self._locks:
+                await lock.acquire()
+                self._adquiridos += 1
+            for nome in self._nomes:
+                self.stage(nome, await self._armazenamento.load(nome))
+        except BaseException:
+            self._liberar()
+            raise
+        dados = tuple(self._documentos[nome] for nome in self._nomes)
+        return dados[0] if len(dados) == 1 else dados
+
+    async def __aexit__(self, tipo, exc, tb):
+        try:
+            return await super().__aexit__(tipo, exc, tb)
+        finally:
+            self._liberar()
+
+store = Armazenamento()
 
 # 🆕 NOVO BLOCO – funções e loop de verificação de inatividade
-def carregar_atividade():
+async def carregar_atividade():
     """Carrega o arquivo de atividade do GitHub."""
-    dados = carregar_json(ARQUIVO_ATIVIDADE)
+    dados = await store.load(ARQUIVO_ATIVIDADE)
     return dados if dados else {}
 
-def salvar_atividade(dados):
-    """Salva o arquivo de atividade no GitHub."""
-    salvar_json(ARQUIVO_ATIVIDADE, dados)
+# === HISTÓRICO DE ATIVIDADE (BITSETS) ===
+class HistoricoAtividade:
+    """Dias em que cada usuário rolou, nos últimos `janela` dias.
+
+    Cada usuário recebe um índice fixo e cada dia guarda um inteiro em que o
+    bit i indica se o usuário de índice i esteve ativo. O resumo de cada
+    usuário (dias ativos, primeiro e último) é mantido a cada marcação, então
+    `resumo` é O(1); só a poda recalcula quem tinha bits nos dias descartados.
+    Persistido como {"janela", "usuarios": [uid, ...], "dias": {"AAAA-MM-DD": base64}}.
+    """
+
+    def __init__(self, janela=JANELA_ATIVIDADE_DIAS):
+        self.janela = janela
+        self.usuarios = []   # índice -> user_id
+        self._indices = {}   # user_id -> índice
+        self._dias = {}      # date.toordinal() -> bitset
+        self._resumos = {}   # user_id -> [dias ativos, primeiro ordinal, último ordinal]
+
+    def _indice(self, user_id):
+        indice = self._indices.get(user_id)
+        if indice is None:
+            indice = self._indices[user_id] = len(self.usuarios)
+            self.usuarios.append(user_id)
+        return indice
+
+    def marcar(self, user_id, dia):
+        """Marca `user_id` como ativo em `dia` (date ou "AAAA-MM-DD").
+        Retorna False se ele já estava marcado nesse dia."""
+        if isinstance(dia, str):
+            dia = datetime.strptime(dia, "%Y-%m-%d").date()
+        user_id = str(user_id)
+        ordinal = dia.toordinal()
+        bit = 1 << self._indice(user_id)
+        bits = self._dias.get(ordinal, 0)
+        if bits & bit:
+            return False
+        self._dias[ordinal] = bits | bit
+        resumo = self._resumos.setdefault(user_id, [0, ordinal, ordinal])
+        resumo[0] += 1
+        resumo[1] = min(resumo[1], ordinal)
+        resumo[2] = max(resumo[2], ordinal)
+        return True
+
+    def _recalcular(self, user_id):
+        dias = self.dias_ativos(user_id)
+        if dias:
+            self._resumos[user_id] = [len(dias), dias[0], dias[-1]]
+        else:
+            self._resumos.pop(user_id, None)
+
+    def podar(self, hoje):
+        """Descarta os dias fora da janela que termina em `hoje`. Retorna True se algo saiu."""
+        limite = hoje.toordinal() - self.janela
+        afetados = 0
+        for ordinal in [o for o in self._dias if o <= limite]:
+            afetados |= self._dias.pop(ordinal)
+        if not afetados:
+            return False
+        for indice in range(afetados.bit_length()):
+            if afetados >> indice & 1:
+                self._recalcular(self.usuarios[indice])
+        self._compactar()
+        return True
+
+    def _compactar(self):
+        # Usuários sem nenhum bit na janela só ocupam espaço; reindexa quando passam da metade
+        ativos = 0
+        for bits in self._dias.values():
+            ativos |= bits
+        if ativos.bit_count() * 2 >= len(self.usuarios):
+            return
+        mantidos = [i for i in range(len(self.usuarios)) if ativos >> i & 1]
+        novos_dias = {}
+        for ordinal, bits in self._dias.items():
+            novo = 0
+            for novo_indice, antigo in enumerate(mantidos):
+                if bits >> antigo & 1:
+                    novo |= 1 << novo_indice
+            novos_dias[ordinal] = novo
+        self.usuarios = [self.usuarios[i] for i in mantidos]
+        self._indices = {user_id: i for i, user_id in enumerate(self.usuarios)}
+        self._dias = novos_dias
+
+    def dias_ativos(self, user_id):
+        """Ordinais (date.toordinal) dos dias ativos do usuário, em ordem."""
+        indice = self._indices.get(str(user_id))
+        if indice is None:
+            return []
+        return [ordinal for ordinal in sorted(self._dias) if self._dias[ordinal] >> indice & 1]
+
+    def resumo(self, user_id):
+        """(dias ativos, espaçamento médio em dias entre eles)."""
+        resumo = self._resumos.get(str(user_id))
+        if resumo is None:
+            return 0, 0
+        dias, primeiro, ultimo = resumo
+        # A média dos intervalos entre dias consecutivos é (último - primeiro) / (n - 1)
+        return dias, (ultimo - primeiro) / (dias - 1) if dias > 1 else 0
+
+    def para_dados(self):
+        return {
+            "janela": self.janela,
+            "usuarios": list(self.usuarios),
+            "dias": {
+                datetime.fromordinal(ordinal).strftime("%Y-%m-%d"):
+                    base64.b64encode(bits.to_bytes((bits.bit_length() + 7) // 8, "little")).decode()
+                for ordinal, bits in sorted(self._dias.items())
+            },
+        }
+
+    @classmethod
+    def de_dados(cls, dados, janela=JANELA_ATIVIDADE_DIAS):
+        historico = cls(janela)
+        for user_id in dados.get("usuarios", []):
+            historico._indice(user_id)
+        for dia, codificado in dados.get("dias", {}).items():
+            ordinal = datetime.strptime(dia, "%Y-%m-%d").toordinal()
+            historico._dias[ordinal] = int.from_bytes(base64.b64decode(codificado), "little")
+        for user_id in historico.usuarios:
+            historico._recalcular(user_id)
+        return historico
+
+    @classmethod
+    def de_legado(cls, dados, janela=JANELA_ATIVIDADE_DIAS):
+        """Converte o formato antigo de atividade_6dias.json ({dia: {uid: nome}})."""
+        historico = cls(janela)
+        for dia, usuarios in sorted(dados.items()):
+            if isinstance(usuarios, dict) and re.match(r"\d{4}-\d{2}-\d{2}$", dia):
+                for user_id in usuarios:
+                    historico.marcar(user_id, dia)
+        return historico
+
+def classificar_atividade(dias_ativos, espacamento_medio, dias_sem_rolar):
+    """Categoria do relatório de atividade: ativo, irregular, baixa_frequencia,
+    inativo ou None (nada a relatar)."""
+    if dias_ativos >= 3 and dias_sem_rolar < 3 and espacamento_medio <= 1.2:
+        return "ativo"
+    if dias_ativos >= 3 and espacamento_medio > 1.2:
+        return "irregular"
+    if 1 < dias_ativos <= 2 and dias_sem_rolar < 3:
+        return "baixa_frequencia"
+    if dias_sem_rolar >= 3:
+        return "inativo"
+    return None
+
+# === ACUMULADOR DE ATIVIDADE (ROLLS) ===
+class AcumuladorAtividade:
+    """Rolls registrados só em memória, um por usuário por minuto.
+
+    `descarregar` leva o acumulado para `atividade.json` e para o histórico
+    em bitsets numa única edição; roda junto com `gravar_pendentes` e no
+    desligamento. `atividade()` e `historico()` devolvem o armazenado com o
+    que ainda está pendente por cima.
+
+    Os relatórios usam `classificacao()`: a última atividade de cada usuário
+    fica em memória (parseada uma vez) e é atualizada a cada roll, e o
+    histórico já guarda o resumo de cada um, então classificar não depende
+    do tamanho do histórico. O retrato é reaproveitado enquanto nada mudar
+    no mesmo minuto.
+    """
 
-def carregar_atividade_6dias():
-    return carregar_json(ARQUIVO_ATIVIDADE_6DIAS)
+    def __init__(self):
+        self._minutos = {}     # user_id -> último minuto registrado (epoch // 60)
+        self._atividade = {}   # user_id -> {"usuario", "data"} ainda não descarregado
+        self._dias = {}        # date -> {user_id: nome} ainda não descarregado
+        self._historico = None  # HistoricoAtividade já decodificado (None = ler do store)
+        self._ultimas = None    # user_id -> (epoch, nome) da última atividade (None = montar)
+        self._versao = 0        # muda a cada alteração que afeta a classificação
+        self._retrato = None    # (versao, minuto, classificação)
+
+    def registrar(self, user_id, nome, quando=None):
+        """Marca um roll no instante `quando` (epoch; padrão: agora).
+        Retorna False se o usuário já rolou neste minuto."""
+        user_id = str(user_id)
+        quando = agora_epoch() if quando is None else quando
+        if self._minutos.get(user_id) == quando // 60:
+            return False
+        self._minutos[user_id] = quando // 60
+        dia = epoch_para_brasil(quando).date()
+        self._atividade[user_id] = {"usuario": nome, "data": quando}
+        self._dias.setdefault(dia, {})[user_id] = nome
+        if self._ultimas is not None:
+            self._ultimas.pop(user_id, None)  # vai para o fim, como no dict de atividade
+            self._ultimas[user_id] = (quando, nome)
+        if self._historico is not None:
+            self._historico.marcar(user_id, dia)
+        self._versao += 1
+        return True
 
-def salvar_atividade_6dias(dados):
-    salvar_json(ARQUIVO_ATIVIDADE_6DIAS, dados)
+    async def descarregar(self):
+        if not self._atividade:
+            return
+        atividade_nova, self._atividade = self._atividade, {}
+        dias_novos, self._dias = self._dias, {}
+        try:
+            async with store.editar(ARQUIVO_ATIVIDADE, ARQUIVO_HISTORICO_ATIVIDADE) as (atividade, documento):
+                atividade.update(atividade_nova)
+                historico = await self._carregar_historico(documento)
+                self._aplicar_dias(historico, dias_novos)
+                documento.clear()
+                documento.update(historico.para_dados())
+        except Exception:
+            # Devolve o lote sem passar por cima do que chegou durante a tentativa
+            for user_id, registro in atividade_nova.items():
+                self._atividade.setdefault(user_id, registro)
+            for dia, usuarios in dias_novos.items():
+                for user_id, nome in usuarios.items():
+                    self._dias.setdefault(dia, {}).setdefault(user_id, nome)
+            raise
+        print(f"📆 Atividade de {len(atividade_nova)} usuário(s) gravada ({len(historico.para_dados()['dias'])} dias mantidos).")
+
+    async def _carregar_historico(self, documento=None):
+        """O histórico decodificado, lido uma vez por processo. Sem documento novo,
+        migra o atividade_6dias.json antigo."""
+        if self._historico is None:
+            if documento is None:
+                documento = await store.load(ARQUIVO_HISTORICO_ATIVIDADE)
+            if documento:
+                self._historico = HistoricoAtividade.de_dados(documento)
+            else:
+                self._historico = HistoricoAtividade.de_legado(await store.load(ARQUIVO_ATIVIDADE_6DIAS))
+                print(f"📦 Histórico de atividade migrado de {ARQUIVO_ATIVIDADE_6DIAS} "
+                      f"({len(self._historico.usuarios)} usuários)")
+        return self._historico
+
+    def _aplicar_dias(self, historico, dias):
+        for dia, usuarios in dias.items():
+            for user_id in usuarios:
+                historico.marcar(user_id, dia)
+        if historico.podar(agora_brasil().date()):
+            self._versao += 1
+
+    def invalidar(self):
+        """Esquece o que foi montado a partir do store (ex.: depois de /recarregar_dados)."""
+        self._historico = None
+        self._ultimas = None
+        self._retrato = None
+        self._versao += 1
+
+    async def _carregar_ultimas(self):
+        if self._ultimas is None:
+            self._ultimas = {
+                user_id: (info["data"], info.get("usuario", "Desconhecido"))
+                for user_id, info in (await self.atividade()).items()
+            }
+        return self._ultimas
+
+    async def classificacao(self):
+        """Um registro por usuário com atividade: user_id, usuario, data (epoch), dias_ativos,
+        espacamento, dias_sem_rolar, recente (< 3 dias) e categoria."""
+        historico = await self.historico()
+        ultimas = await self._carregar_ultimas()
+        agora = agora_epoch()
+        minuto = agora // 60
+        if self._retrato and self._retrato[:2] == (self._versao, minuto):
+            return self._retrato[2]
+
+        registros = []
+        for user_id, (ultima, nome) in ultimas.items():
+            dias_ativos, espacamento = historico.resumo(user_id)
+            dias_sem_rolar = (agora - ultima) // 86400
+            registros.append({
+                "user_id": user_id,
+                "usuario": nome,
+                "data": ultima,
+                "dias_ativos": dias_ativos,
+                "espacamento": espacamento,
+                "dias_sem_rolar": dias_sem_rolar,
+                "recente": dias_sem_rolar < 3,
+                "categoria": classificar_atividade(dias_ativos, espacamento, dias_sem_rolar),
+            })
+        self._retrato = (self._versao, minuto, registros)
+        return registros
+
+    async def atividade(self):
+        dados = await carregar_atividade()
+        dados.update(copy.deepcopy(self._atividade))
+        return dados
+
+    async def historico(self):
+        # Marcar é idempotente: os dias pendentes entram já e de novo no próximo descarregar
+        historico = await self._carregar_historico()
+        self._aplicar_dias(historico, self._dias)
+        return historico
+
+atividade_rolls = AcumuladorAtividade()
+
+# === MIGRAÇÃO DE DATAS PARA EPOCH ===
+# Campos de data de cada documento, em qualquer nível de dicts/listas
+CAMPOS_DE_DATA = {
+    ARQUIVO_ATIVIDADE: ("data",),
+    ARQUIVO_COOLDOWN: ("expira",),
+    ARQUIVO_IMUNES: ("data",),
+    ARQUIVO_ISENCAO: ("data_concessao",),
+    ARQUIVO_CASAMENTOS: ("data",),
+    ARQ_S2_PERSONAGENS: ("data",),
+    ARQ_S2_SALAS: ("aberta_em", "expira_em"),
+}
+# Documentos {uid: data} do formato mais antigo, em que o valor era só a string
+_FORMATO_ANTIGO = {ARQUIVO_ATIVIDADE: "data", ARQUIVO_COOLDOWN: "expira"}
+
+def _texto_para_epoch(valor):
+    for formato in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M"):
+        try:
+            return brasil_para_epoch(datetime.strptime(valor, formato))
+        except (TypeError, ValueError):
+            continue
+    return None
+
+def _converter_registros(valor, campos):
+    convertidos = 0
+    if isinstance(valor, list):
+        for item in valor:
+            convertidos += _converter_registros(item, campos)
+    elif isinstance(valor, dict):
+        for campo in campos:
+            if isinstance(valor.get(campo), str):
+                epoch = _texto_para_epoch(valor[campo])
+                if epoch is None:
+                    print(f"⚠️ Data ilegível descartada: {campo}={valor[campo]!r}")
+                    del valor[campo]
+                else:
+                    valor[campo] = epoch
+                convertidos += 1
+        for filho in valor.values():
+            if isinstance(filho, (dict, list)):
+                convertidos += _converter_registros(filho, campos)
+    return convertidos
+
+def migrar_datas_documento(nome_arquivo, dados):
+    """Troca, no lugar, as datas "AAAA-MM-DD HH:MM[:SS]" (Brasília) por epoch. Retorna quantas mudaram.
+
+    Entradas de atividade/cooldown sem data válida (ou que nem são registros) são removidas,
+    como os loops já faziam ao lê-las.
+    """
+    convertidos = 0
+    campo_antigo = _FORMATO_ANTIGO.get(nome_arquivo)
+    if campo_antigo:
+        for chave, valor in list(dados.items()):
+            if isinstance(valor, str):
+                dados[chave] = {campo_antigo: valor}
+                if nome_arquivo == ARQUIVO_ATIVIDADE:
+                    dados[chave]["usuario"] = "Desconhecido"
+    convertidos += _converter_registros(dados, CAMPOS_DE_DATA[nome_arquivo])
+    if campo_antigo:
+        invalidas = [c for c, v in dados.items()
+                     if not isinstance(v, dict) or not isinstance(v.get(campo_antigo), int)]
+        for chave in invalidas:
+            del dados[chave]
+            convertidos += 1
+    return convertidos
+
+async def migrar_timestamps():
+    """Regrava em epoch as datas ainda em texto, todos os documentos num único commit.
+
+    Idempotente: roda no início do bot antes dos loops; depois da primeira vez não muda nada.
+    """
+    nomes = tuple(CAMPOS_DE_DATA)
+    total = 0
+    async with store.editar(*nomes) as documentos:
+        for nome, dados in zip(nomes, documentos):
+            convertidos = migrar_datas_documento(nome, dados)
+            if convertidos:
+                print(f"🕒 {nome}: {convertidos} data(s) convertidas para epoch")
+            total += convertidos
+    return total
 
 # === FUNÇÕES AUXILIARES DE SÉRIES ===
-def carregar_series():
+async def carregar_series():
     """Carrega o arquivo de séries do GitHub."""
-    dados = carregar_json(ARQUIVO_SERIES)
+    dados = await store.load(ARQUIVO_SERIES)
     return dados if dados else {}
 
-def salvar_series(series):
-    """Salva o arquivo de séries no GitHub."""
-    salvar_json(ARQUIVO_SERIES, series)
-
-def carregar_isencao():
+async def carregar_isencao():
     """Carrega o arquivo de isenção de inatividade."""
-    dados = carregar_json(ARQUIVO_ISENCAO)
+    dados = await store.load(ARQUIVO_ISENCAO)
     return dados if dados else {}
 
-def salvar_isencao(dados):
-    """Salva o arquivo de isenção no GitHub."""
-    salvar_json(ARQUIVO_ISENCAO, dados)
-
-def usuario_tem_isencao(user_id):
+async def usuario_tem_isencao(user_id):
     """Verifica se um usuário tem isenção de inatividade."""
-    isencao = carregar_isencao()
+    isencao = await carregar_isencao()
     return str(user_id) in isencao
 
-def toggle_isencao(user_id, usuario_nome):
+async def toggle_isencao(user_id, usuario_nome):
     """Adiciona ou remove isenção de inatividade de um usuário."""
-    isencao = carregar_isencao()
     user_id_str = str(user_id)
-    
-    if user_id_str in isencao:
-        # Remove isenção
-        del isencao[user_id_str]
-        salvar_isencao(isencao)
-        return False  # Isenção removida
-    else:
-        # Adiciona isenção
-        isencao[user_id_str] = {
-            "usuario": usuario_nome,
-            "data_concessao": agora_brasil().strftime("%Y-%m-%d %H:%M:%S"),
-            "concedido_por": "Sistema"  # Será atualizado no comando
-        }
-        salvar_isencao(isencao)
-        return True  # Isenção concedida
+    async with store.editar(ARQUIVO_ISENCAO) as isencao:
+        if user_id_str in isencao:
+            # Remove isenção
+            del isencao[user_id_str]
+            return False  # Isenção removida
+        else:
+            # Adiciona isenção
+            isencao[user_id_str] = {
+                "usuario": usuario_nome,
+                "data_concessao": agora_epoch(),
+                "concedido_por": "Sistema"  # Será atualizado no comando
+            }
+            return True  # Isenção concedida
 
 # =============================
 # FUNÇÕES SEASON 2
 # =============================
-def carregar_casamentos():
-    return carregar_json(ARQUIVO_CASAMENTOS) or {}
+async def carregar_casamentos():
+    return await store.load(ARQUIVO_CASAMENTOS) or {}
 
-def salvar_casamentos(dados):
-    salvar_json(ARQUIVO_CASAMENTOS, dados)
+async def s2_load_salas():
+    return await store.load(ARQ_S2_SALAS) or {}
 
-def s2_load_salas():
-    return carregar_json(ARQ_S2_SALAS) or {}
+async def s2_load(arq):
+    return await store.load(arq) or {}
 
-def s2_save_salas(dados):
-    salvar_json(ARQ_S2_SALAS, dados)
+def s2_aplicar_reset_diario(jogador, hoje=None):
+    """Reset diário preguiçoso: na primeira leitura do dia o jogador volta a ter as rodadas diárias.
 
-def s2_load(arq):
-    return carregar_json(arq) or {}
+    Altera o registro no lugar e retorna True se mudou; dentro de `store.editar`
+    isso já é gravado, numa leitura simples fica só na cópia.
+    """
+    if not jogador:
+        return False
+    hoje = hoje or agora_brasil().strftime("%Y-%m-%d")
+    if jogador.get("ultimo_reset") == hoje:
+        return False
+    jogador["rodadas"] = S2_RODADAS_DIARIAS
+    jogador["ultimo_reset"] = hoje
+    jogador["sala_ativa"] = False
+    return True
 
-def s2_save(arq, dados):
-    salvar_json(arq, dados)
+async def s2_carregar_jogador(uid):
+    """Registro de um jogador (ou None) já com o reset diário aplicado."""
+    jogador = await store.load_key(ARQ_S2_PLAYERS, uid)
+    s2_aplicar_reset_diario(jogador)
+    return jogador
 
 def s2_extrair_personagem_do_embed(embed: discord.Embed):
     return embed.title.strip() if embed.title else None
@@ -206,36 +1728,55 @@ def s2_definir_tipo_personagem(embed: discord.Embed):
     desc = (embed.description or "").lower()
     return "wish_outro" if "wish" in desc else "livre"
 
-def s2_registro_automatico(uid, personagem, tipo):
-    chars = s2_load(ARQ_S2_PERSONAGENS)
-    chars.setdefault(uid, []).append({
-        "personagem": personagem,
-        "tipo": tipo,
-        "origem": "sala_privada",
-        "data": agora_brasil().strftime("%Y-%m-%d %H:%M")
-    })
-    s2_save(ARQ_S2_PERSONAGENS, chars)
+async def s2_registro_automatico(uid, personagem, tipo):
+    async with store.editar(ARQ_S2_PERSONAGENS) as chars:
+        chars.setdefault(uid, []).append({
+            "personagem": personagem,
+            "tipo": tipo,
+            "origem": "sala_privada",
+            "data": agora_epoch()
+        })
+
+# Índice em memória das salas ativas: abrir, reabrir, fechar e expirar o mantêm,
+# e o setup_hook o reconstrói a partir do arquivo. Consultas não vão ao armazenamento.
+def s2_indexar_sala(uid, sala):
+    uid = str(uid)
+    s2_desindexar_sala(uid)
+    if not sala or not sala.get("ativa", False):
+        return
+    S2_SALAS_ATIVAS[uid] = dict(sala)
+    S2_CANAIS_SALAS[sala["canal_id"]] = uid
+
+def s2_desindexar_sala(uid):
+    sala = S2_SALAS_ATIVAS.pop(str(uid), None)
+    if sala and S2_CANAIS_SALAS.get(sala["canal_id"]) == str(uid):
+        del S2_CANAIS_SALAS[sala["canal_id"]]
+
+def s2_reconstruir_indice(salas):
+    S2_SALAS_ATIVAS.clear()
+    S2_CANAIS_SALAS.clear()
+    for uid, sala in salas.items():
+        s2_indexar_sala(uid, sala)
+    print(f"🗂️ Índice de salas: {len(S2_SALAS_ATIVAS)} sala(s) ativa(s)")
+
+def s2_dono_do_canal(channel_id: int):
+    """uid do dono da sala ativa nesse canal, ou None."""
+    return S2_CANAIS_SALAS.get(channel_id)
 
 def canal_e_sala_privada_ativa(channel_id: int) -> bool:
-    salas = s2_load_salas()
-    for s in salas.values():
-        if s.get("ativa") and s.get("canal_id") == channel_id:
-            return True
-    return False
+    return channel_id in S2_CANAIS_SALAS
 
-def registrar_casamento(guild_id, user_id, usuario_nome, personagem):
-    dados = carregar_casamentos()
+async def registrar_casamento(guild_id, user_id, usuario_nome, personagem):
     gid = str(guild_id)
     uid = str(user_id)
 
-    dados.setdefault(gid, {}).setdefault(uid, []).append({
-        "usuario": usuario_nome,
-        "personagem": personagem,
-        "data": agora_brasil().strftime("%Y-%m-%d %H:%M"),
-        "origem": "sala_privada"
-    })
-
-    salvar_casamentos(dados)
+    async with store.editar(ARQUIVO_CASAMENTOS) as dados:
+        dados.setdefault(gid, {}).setdefault(uid, []).append({
+            "usuario": usuario_nome,
+            "personagem": personagem,
+            "data": agora_epoch(),
+            "origem": "sala_privada"
+        })
 
 # == PAINEL SEASON 2 ==
 class PainelSalaView(discord.ui.View):
@@ -251,40 +1792,40 @@ class PainelSalaView(discord.ui.View):
     )
     async def aplicar(self, interaction: discord.Interaction, button: discord.ui.Button):
         # Verifica se usuário tem imunidade
-        if usuario_tem_imunidade(interaction.user.id, interaction.guild.id):
+        if await usuario_tem_imunidade(interaction.user.id, interaction.guild.id):
             await interaction.response.send_message(
                 "⛔ Você não pode aplicar para Sala Privada porque possui um personagem imune. ",
                 ephemeral=True
             )
             return
         
-        players = s2_load(ARQ_S2_PLAYERS)
         uid = str(interaction.user.id)
-
-        # Verifica se já aplicou
-        if uid in players:
-            if players[uid]["status"] == "pendente":
+        async with store.editar(ARQ_S2_PLAYERS) as players:
+            aplicacao = players.get(uid)
+            if aplicacao is None:
+                # Cria aplicação
+                players[uid] = {
+                    "status": "pendente",
+                    "rodadas": 0,
+                    "bonus_evento": 0,
+                    "ultimo_reset": None,
+                    "sala_ativa": False
+                }
+
+        # Verifica se já aplicou (a resposta sai com o lock do arquivo já solto)
+        if aplicacao is not None:
+            if aplicacao["status"] == "pendente":
                 await interaction.response.send_message(
                     "⏳ Sua aplicação já está pendente de aprovação.", ephemeral=True
                 )
-            elif players[uid]["status"] == "aprovado":
+            elif aplicacao["status"] == "aprovado":
                 await interaction.response.send_message(
                     "✅ Você já foi aprovado para usar salas privadas.", ephemeral=True
                 )
             return
-
-        # Cria aplicação
-        players[uid] = {
-            "status": "pendente",
-            "rodadas": 0,
-            "bonus_evento": 0,
-            "ultimo_reset": None,
-            "sala_ativa": False
-        }
-        s2_save(ARQ_S2_PLAYERS, players)
         
         # Envia notificação no canal configurado
-        config = s2_load(ARQ_S2_CONFIG)
+        config = await s2_load(ARQ_S2_CONFIG)
         guild_id = str(interaction.guild.id)
         
         if "apply_channel" in config and guild_id in config["apply_channel"]:
@@ -313,7 +1854,7 @@ class PainelSalaView(discord.ui.View):
     )
     async def abrir(self, interaction: discord.Interaction, button: discord.ui.Button):
         # Verifica se usuário tem imunidade
-        if usuario_tem_imunidade(interaction.user.id, interaction.guild.id):
+        if await usuario_tem_imunidade(interaction.user.id, interaction.guild.id):
             await interaction.response.send_message(
                 "⛔ Você não pode abrir uma sala porque possui um personagem imune. ",
                 ephemeral=True
@@ -321,17 +1862,17 @@ class PainelSalaView(discord.ui.View):
             return
         
         # Verifica se usuário está aprovado
-        players = s2_load(ARQ_S2_PLAYERS)
         uid = str(interaction.user.id)
+        p = await s2_carregar_jogador(uid)
         
-        if uid not in players:
+        if p is None:
             await interaction.response.send_message(
                 "📝 Você precisa aplicar primeiro! Use o botão **'Aplicar'** acima.",
                 ephemeral=True
             )
             return
             
-        if players[uid]["status"] != "aprovado":
+        if p["status"] != "aprovado":
             await interaction.response.send_message(
                 "⏳ Sua aplicação ainda está pendente de aprovação.",
                 ephemeral=True
@@ -349,7 +1890,7 @@ class PainelSalaView(discord.ui.View):
     )
     async def reabrir(self, interaction: discord.Interaction, button: discord.ui.Button):
         # Verifica se usuário tem imunidade
-        if usuario_tem_imunidade(interaction.user.id, interaction.guild.id):
+        if await usuario_tem_imunidade(interaction.user.id, interaction.guild.id):
             await interaction.response.send_message(
                 "⛔ Você não pode reabrir uma sala porque possui um personagem imune. ",
                 ephemeral=True
@@ -357,7 +1898,7 @@ class PainelSalaView(discord.ui.View):
             return
         
         # Verifica se usuário está aprovado
-        players = s2_load(ARQ_S2_PLAYERS)
+        players = await s2_load(ARQ_S2_PLAYERS)
         uid = str(interaction.user.id)
         
         if uid not in players or players[uid]["status"] != "aprovado":
@@ -371,18 +1912,17 @@ class PainelSalaView(discord.ui.View):
         uid = str(interaction.user.id)
         guild = interaction.guild
 
-        players = s2_load(ARQ_S2_PLAYERS)
-        salas = s2_load_salas()
-
-        p = players.get(uid)
-        if not p or p["rodadas"] <= 0:
+        # Confere antes e dá o cargo fora do lock: chamadas ao Discord não seguram as salas
+        p = players[uid]
+        s2_aplicar_reset_diario(p)
+        if p["rodadas"] <= 0:
             await interaction.response.send_message(
                 "⛔ Você não possui rodadas disponíveis.",
                 ephemeral=True
             )
             return
 
-        sala = salas.get(uid)
+        sala = await store.load_key(ARQ_S2_SALAS, uid)
         if not sala or sala.get("ativa", False):
             await interaction.response.send_message(
                 "ℹ️ Você não possui uma sala para reabrir.",
@@ -402,18 +1942,38 @@ class PainelSalaView(discord.ui.View):
 
         await interaction.user.add_roles(cargo)
 
-        agora = agora_brasil()
-        expira_em = agora + timedelta(seconds=S2_TEMPO_SALA)
+        # Confere de novo sob o lock e só então grava (dois cliques gastariam duas rodadas)
+        async with store.editar(ARQ_S2_SALAS, ARQ_S2_PLAYERS) as (salas, players):
+            p = players.get(uid)
+            s2_aplicar_reset_diario(p)
+            sala = salas.get(uid)
+            reaberta = (
+                p and p["rodadas"] > 0
+                and sala and not sala.get("ativa", False) and sala["cargo_id"] == cargo.id
+            )
+            if reaberta:
+                agora = agora_epoch()
+                expira_em = agora + S2_TEMPO_SALA
 
-        sala["aberta_em"] = agora.strftime("%Y-%m-%d %H:%M:%S")
-        sala["expira_em"] = expira_em.strftime("%Y-%m-%d %H:%M:%S")
-        sala["ativa"] = True
+                sala["aberta_em"] = agora
+                sala["expira_em"] = expira_em
+                sala["ativa"] = True
 
-        players[uid]["rodadas"] -= 1
-        players[uid]["sala_ativa"] = True
+                p["rodadas"] -= 1
+                p["sala_ativa"] = True
 
-        s2_save_salas(salas)
-        s2_save(ARQ_S2_PLAYERS, players)
+        if not reaberta:
+            # Sala reaberta por outro clique: o cargo é o dela, fica
+            if not (sala and sala.get("ativa", False)):
+                await interaction.user.remove_roles(cargo)
+            await interaction.response.send_message(
+                "⛔ Não foi possível reabrir a sala agora.",
+                ephemeral=True
+            )
+            return
+
+        s2_indexar_sala(uid, sala)
+        temporizador_salas.armar(uid, guild.id, expira_em)
 
         embed_dm = discord.Embed(
             title="♻️ Sala Reaberta",
@@ -424,7 +1984,7 @@ class PainelSalaView(discord.ui.View):
         await enviar_dm(interaction.user, embed_dm)
 
         await interaction.response.send_message(
-            f"♻️ Sala reaberta! Novo tempo até `{expira_em.strftime('%H:%M:%S')}`",
+            f"♻️ Sala reaberta! Novo tempo até `{formatar_epoch(expira_em, '%H:%M:%S')}`",
             ephemeral=True
         )
 
@@ -439,7 +1999,7 @@ class PainelSalaView(discord.ui.View):
         uid = str(interaction.user.id)
         guild = interaction.guild
 
-        salas = s2_load_salas()
+        salas = await s2_load_salas()
         sala = salas.get(uid)
 
         if not sala or not sala.get("ativa", False):
@@ -465,7 +2025,7 @@ class PainelSalaView(discord.ui.View):
     )
     async def info(self, interaction: discord.Interaction, button: discord.ui.Button):
         uid = str(interaction.user.id)
-        salas = s2_load_salas()
+        salas = await s2_load_salas()
 
         sala = salas.get(uid)
         if not sala or not sala.get("ativa", False):
@@ -475,13 +2035,8 @@ class PainelSalaView(discord.ui.View):
             )
             return
 
-        expira = datetime.strptime(
-            sala["expira_em"], "%Y-%m-%d %H:%M:%S"
-        )
-
-        restante = expira - agora_brasil()
-        minutos = max(0, int(restante.total_seconds() // 60))
-        segundos = max(0, int(restante.total_seconds() % 60))
+        restante = max(0, sala["expira_em"] - agora_epoch())
+        minutos, segundos = divmod(restante, 60)
 
         await interaction.response.send_message(
             f"📊 **Status da Sala**\n"
@@ -521,24 +2076,24 @@ class AplicacaoView(discord.ui.View):
     )
     async def aprovar(self, interaction: discord.Interaction, button: discord.ui.Button):
         # Aprova o usuário
-        players = s2_load(ARQ_S2_PLAYERS)
         uid = str(self.user_id)
-        
-        if uid not in players:
+        async with store.editar(ARQ_S2_PLAYERS) as players:
+            encontrado = uid in players
+            if encontrado:
+                players[uid].update({
+                    "status": "aprovado",
+                    "rodadas": 2,
+                    "ultimo_reset": agora_brasil().strftime("%Y-%m-%d"),
+                    "sala_ativa": False
+                })
+
+        if not encontrado:
             await interaction.response.send_message(
                 "❌ Usuário não encontrado nas aplicações.",
                 ephemeral=True
             )
             return
         
-        players[uid].update({
-            "status": "aprovado",
-            "rodadas": 2,
-            "ultimo_reset": agora_brasil().strftime("%Y-%m-%d"),
-            "sala_ativa": False
-        })
-        s2_save(ARQ_S2_PLAYERS, players)
-        
         # Notifica o usuário
         usuario = interaction.guild.get_member(self.user_id)
         if usuario:
@@ -583,12 +2138,9 @@ class AplicacaoView(discord.ui.View):
     )
     async def recusar(self, interaction: discord.Interaction, button: discord.ui.Button):
         # Remove do arquivo de aplicações
-        players = s2_load(ARQ_S2_PLAYERS)
         uid = str(self.user_id)
-        
-        if uid in players:
-            del players[uid]
-            s2_save(ARQ_S2_PLAYERS, players)
+        async with store.editar(ARQ_S2_PLAYERS) as players:
+            players.pop(uid, None)
         
         # Notifica o usuário
         usuario = interaction.guild.get_member(self.user_id)
@@ -633,16 +2185,17 @@ class AplicacaoView(discord.ui.View):
     )
     async def info(self, interaction: discord.Interaction, button: discord.ui.Button):
         # Carrega informações do jogador
-        players = s2_load(ARQ_S2_PLAYERS)
+        players = await s2_load(ARQ_S2_PLAYERS)
         uid = str(self.user_id)
         
         if uid not in players:
             info_text = "Usuário não encontrado nas aplicações."
         else:
             player_data = players[uid]
+            s2_aplicar_reset_diario(player_data)
             
             # Verifica se tem imunidade
-            tem_imunidade = usuario_tem_imunidade(self.user_id, interaction.guild.id)
+            tem_imunidade = await usuario_tem_imunidade(self.user_id, interaction.guild.id)
             imunidade_text = "✅ Não tem" if not tem_imunidade else "⚠️ **TEM IMUNIDADE**"
             
             info_text = (
@@ -663,17 +2216,28 @@ class AplicacaoView(discord.ui.View):
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
 # ------ FECHAR SALA -------
-async def fechar_sala_automaticamente(uid: str, guild: discord.Guild):
-    salas = s2_load_salas()
-    players = s2_load(ARQ_S2_PLAYERS)
+async def fechar_sala_automaticamente(uid: str, guild: discord.Guild, expira=None):
+    # O lock cobre só os registros: duas chamadas simultâneas não fecham a mesma sala duas vezes,
+    # e a DM e a remoção do cargo (chamadas ao Discord) acontecem depois, sem segurar ninguém
+    async with store.editar(ARQ_S2_SALAS, ARQ_S2_PLAYERS) as (salas, players):
+        sala = salas.get(uid)
+        if not sala or not sala.get("ativa", False):  # Adicionar verificação
+            return
+        # Timer antigo de uma sala que foi reaberta depois: o prazo dele não vale mais
+        if expira is not None and sala.get("expira_em") != expira:
+            return
 
-    sala = salas.get(uid)
-    if not sala or not sala.get("ativa", False):  # Adicionar verificação
-        return
+        # Atualiza status
+        if uid in players:
+            players[uid]["sala_ativa"] = False
+
+        # Marca como inativa no arquivo
+        sala["ativa"] = False
+        cargo_id = sala["cargo_id"]
+        s2_desindexar_sala(uid)
 
     membro = guild.get_member(int(uid))
-    cargo = guild.get_role(sala["cargo_id"])
-    canal = guild.get_channel(sala["canal_id"])
+    cargo = guild.get_role(cargo_id)
 
     # === DM ===
     if membro:
@@ -690,19 +2254,56 @@ async def fechar_sala_automaticamente(uid: str, guild: discord.Guild):
         await enviar_dm(membro, embed_dm)
 
     # === REMOVE APENAS O ACESSO ===
-    if membro and cargo:
+    # (a não ser que a sala já tenha sido reaberta enquanto a DM saía)
+    if membro and cargo and uid not in S2_SALAS_ATIVAS:
         await membro.remove_roles(cargo)
 
-    # Atualiza status
-    if uid in players:
-        players[uid]["sala_ativa"] = False
-        s2_save(ARQ_S2_PLAYERS, players)
+    print(f"✅ Sala fechada para usuário ")
 
-    # Marca como inativa no arquivo
-    salas[uid]["ativa"] = False
-    s2_save_salas(salas)
 
-    print(f"✅ Sala fechada para usuário ")
+class TemporizadorSalas:
+    """Um timer por sala ativa, que fecha a sala exatamente no `expira_em`.
+
+    Abrir ou reabrir rearma o timer do dono; no início do bot os timers são
+    reconstruídos a partir do arquivo de salas (as já vencidas fecham na hora).
+    """
+
+    def __init__(self):
+        self._timers = {}  # uid -> Task
+
+    def armar(self, uid, guild_id, expira):
+        uid = str(uid)
+        anterior = self._timers.get(uid)
+        if anterior and not anterior.done():
+            anterior.cancel()
+        self._timers[uid] = asyncio.create_task(self._expirar(uid, int(guild_id), expira))
+
+    async def _expirar(self, uid, guild_id, expira):
+        await asyncio.sleep(max(0, expira - time.time()))
+        await bot.wait_until_ready()
+        marcar_trafego_de_fundo()
+        try:
+            guild = bot.get_guild(guild_id)
+            if guild:
+                await fechar_sala_automaticamente(uid, guild, expira=expira)
+        except Exception as e:
+            print(f"⚠️ Erro ao fechar sala de {uid}: {e}")
+        finally:
+            if self._timers.get(uid) is asyncio.current_task():
+                del self._timers[uid]
+
+    def cancelar(self, uid):
+        timer = self._timers.pop(str(uid), None)
+        if timer and not timer.done():
+            timer.cancel()
+
+    def reidratar(self, salas):
+        for uid, sala in salas.items():
+            if sala.get("ativa", False) and sala.get("expira_em") is not None:
+                self.armar(uid, sala["guild_id"], sala["expira_em"])
+        print(f"⏳ Timers de sala: {len(self._timers)} sala(s) ativa(s)")
+
+temporizador_salas = TemporizadorSalas()
 
 
 # === BOT ===
@@ -720,35 +2321,55 @@ class ImuneBot(commands.Bot):
         # View persistente
         self.add_view(PainelSalaView())
 
-        # Sincroniza slash commands
-        await self.tree.sync()
+        # Sincroniza slash commands enquanto carrega todos os documentos no cache:
+        # o gateway só conecta depois, então o primeiro comando já encontra tudo em memória.
+        # O aquecimento nunca levanta; a sincronização tem o próprio tratamento de erro.
+        sincronizacao = asyncio.create_task(self.tree.sync())
+        await store.aquecer()
+        try:
+            await sincronizacao
+        except discord.HTTPException as e:
+            print(f"⚠️ Erro ao sincronizar slash commands: {e}")
+        # Datas antigas em texto viram epoch antes de qualquer loop ler os documentos.
+        # Uma falha aqui fica no log, mas não impede o bot de subir.
+        try:
+            await migrar_timestamps()
+        except Exception as e:
+            print(f"⚠️ Erro na migração de timestamps: {e}")
 
         # Inicia tasks
         verificar_imunidades.start()
         verificar_youtube.start()
-        verificar_cooldowns.start()
+        agenda_cooldowns.iniciar(await store.load(ARQUIVO_COOLDOWN))
         verificar_inatividade.start()
 
         checar_atividade.before_loop(self.wait_until_ready)
         checar_atividade.start()
 
-        s2_reset.before_loop(self.wait_until_ready)
-        s2_reset.start()
-
-        verificar_salas_expiradas.start()
-
-        # Executa uma vez ao iniciar
-        await checar_atividade()
+        s2_relatorio_diario.start()
+        salas = await s2_load_salas()
+        s2_reconstruir_indice(salas)
+        temporizador_salas.reidratar(salas)
+        gravar_pendentes.start()
 
         print("✅ Bot totalmente inicializado.")
 
+    async def close(self):
+        # Grava o que ainda está só em memória antes de desligar
+        try:
+            await atividade_rolls.descarregar()
+        except Exception as e:
+            print(f"⚠️ Erro ao gravar atividade: {e}")
+        await store.flush()
+        await super().close()
+
 bot = ImuneBot()
 
 # === CANAL DE IMUNIDADE ===
 def canal_imunidade():
     async def predicate(interaction: discord.Interaction) -> bool:
         guild_id = str(interaction.guild.id)
-        config = carregar_json(ARQUIVO_CONFIG)
+        config = await store.load(ARQUIVO_CONFIG)
         canal_id = config.get(guild_id)
         if not canal_id:
             await interaction.response.send_message(
@@ -798,98 +2419,94 @@ class ListaImunesView(View):
             await i.response.edit_message(embed=self.gerar_embed(), view=self)
 
 # === LOOP DE VERIFICAÇÃO DE INATIVIDADE ===
+def _mensagens_em_blocos(cabecalho, linhas, limite=2000):
+    """Junta as linhas em mensagens que cabem no limite do Discord; o cabeçalho vai só na primeira."""
+    mensagens, atual = [], cabecalho
+    for linha in linhas:
+        if len(atual) + 1 + len(linha) > limite:
+            mensagens.append(atual)
+            atual = linha
+        else:
+            atual = f"{atual}\n{linha}" if atual else linha
+    if atual:
+        mensagens.append(atual)
+    return mensagens
+
 @tasks.loop(hours=1)
 async def verificar_inatividade():
-    agora = agora_brasil()
-    imunes = carregar_json(ARQUIVO_IMUNES)
-    atividade = carregar_atividade()
-    config = carregar_json(ARQUIVO_CONFIG)
-
-    for guild in bot.guilds:
-        guild_id = str(guild.id)
-        if guild_id not in imunes:
-            continue
-
-        canal_id = config.get(guild_id)
-        canal = guild.get_channel(canal_id) if canal_id else None
-        remover_lista = []
-
-        for user_id, dados in imunes[guild_id].items():
-            # 🔒 VERIFICA SE O USUÁRIO TEM ISENÇÃO
-            if usuario_tem_isencao(user_id):
-                print(f"🛡️ Usuário {user_id} tem isenção - ignorando verificação de inatividade")
-                continue
-
-            # Verifica se existe registro de atividade para este usuário
-            user_activity = atividade.get(user_id)
-            if not user_activity:
-                print(f"⚠️ Usuário {user_id} não tem registro de atividade")
-                continue
-
-            # Extrai a string da data (suporta ambos os formatos)
-            ultima_str = None
-            if isinstance(user_activity, dict):
-                ultima_str = user_activity.get("data")
-            else:
-                ultima_str = user_activity
+    """Remove, em lote, a imunidade de quem não rola há DIAS_INATIVIDADE+ dias.
+
+    Um retrato de atividade, isenções e config; todas as remoções (e os
+    cooldowns de 7 dias) calculadas em memória e gravadas num único commit;
+    um aviso consolidado por servidor.
+    """
+    marcar_trafego_de_fundo()
+    agora = agora_epoch()
+    atividade = await atividade_rolls.atividade()
+    isencao = await carregar_isencao()
+    config = await store.load(ARQUIVO_CONFIG)
+
+    removidos = {}  # guild_id -> [(user_id, dados da imunidade)]
+    isentos = sem_registro = 0
+    async with store.editar(ARQUIVO_IMUNES, ARQUIVO_COOLDOWN) as (imunes, cooldowns):
+        for guild in bot.guilds:
+            guild_id = str(guild.id)
+            for user_id, dados in list(imunes.get(guild_id, {}).items()):
+                # 🔒 Usuários com isenção nunca perdem a imunidade por inatividade
+                if user_id in isencao:
+                    isentos += 1
+                    continue
 
-            if not ultima_str:
-                print(f"⚠️ Usuário {user_id} tem atividade mas sem data")
-                continue
+                user_activity = atividade.get(user_id)
+                if not user_activity:
+                    sem_registro += 1
+                    continue
 
-            try:
-                ultima_data = datetime.strptime(ultima_str, "%Y-%m-%d %H:%M:%S")
-            except Exception as e:
-                print(f"⚠️ Erro ao ler data de {user_id}: {e} - Data: {ultima_str}")
-                continue
+                dias_inativos = (agora - user_activity["data"]) // 86400
+                if dias_inativos >= DIAS_INATIVIDADE:
+                    print(f"🔴 Usuário {user_id} inativo há {dias_inativos} dias - REMOVENDO")
+                    del imunes[guild_id][user_id]
+                    aplicar_cooldown_em(cooldowns, user_id, dias=7)
+                    removidos.setdefault(guild_id, []).append((user_id, dados))
 
-            # Verifica se passou o limite de inatividade
-            dias_inativos = (agora - ultima_data).days
-            print(f"👤 Usuário {user_id} - Última atividade: {ultima_str} - Dias inativos: {dias_inativos}")
+    total = sum(len(lista) for lista in removidos.values())
+    print(f"🕵️ Inatividade verificada: {total} removido(s), {isentos} isento(s), {sem_registro} sem registro de atividade")
 
-            if dias_inativos >= DIAS_INATIVIDADE:
-                print(f"🔴 Usuário {user_id} inativo há {dias_inativos} dias - REMOVENDO")
-                remover_lista.append(user_id)
+    # Aviso consolidado no canal configurado de cada servidor
+    for guild_id, lista in removidos.items():
+        guild = bot.get_guild(int(guild_id))
+        canal_id = config.get(guild_id)
+        canal = guild.get_channel(canal_id) if guild and canal_id else None
+        if not canal:
+            continue
 
-        # Processa remoções
-        for user_id in remover_lista:
+        linhas = []
+        for user_id, dados in lista:
             usuario = guild.get_member(int(user_id))
-            if not usuario:
-                usuario_mention = "Usuário desconhecido"
-            else:
-                usuario_mention = usuario.mention
-
-            # Pega personagem e origem antes de remover
-            personagem = imunes[guild_id][user_id]["personagem"]
-            origem = imunes[guild_id][user_id]["origem"]
-
-            # Remove imunidade
-            del imunes[guild_id][user_id]
-            salvar_json(ARQUIVO_IMUNES, imunes)
-
-            # Aplica cooldown de 7 dias por inatividade
-            definir_cooldown(user_id, dias=7)
-
-            # Envia aviso no canal configurado
-            if canal:
-                await canal.send(
-                    f"⚠️ {usuario_mention} perdeu a imunidade de **{personagem} ({origem})** "
-                    f"por inatividade (sem roletar há {DIAS_INATIVIDADE}+ dias). "
-                    f"Você não poderá adicionar outro personagem imune por 7 dias."
-                )
-                print(f"✅ Imunidade removida de {usuario_mention}")
+            usuario_mention = usuario.mention if usuario else "Usuário desconhecido"
+            linhas.append(f"• {usuario_mention} — **{dados['personagem']} ({dados['origem']})**")
+        cabecalho = (
+            f"⚠️ **{len(lista)} imunidade(s) removida(s) por inatividade** "
+            f"(sem roletar há {DIAS_INATIVIDADE}+ dias). "
+            f"Esses jogadores não poderão adicionar outro personagem imune por 7 dias:"
+        )
+        try:
+            for mensagem in _mensagens_em_blocos(cabecalho, linhas):
+                await canal.send(mensagem)
+            print(f"✅ Aviso de {len(lista)} remoção(ões) enviado em {canal.name}")
+        except Exception as e:
+            print(f"⚠️ Erro ao avisar remoções por inatividade em {canal_id}: {e}")
 
 
 # === LOOP DE CHECAGEM DE ATIVIDADE MELHORADO ===
 @tasks.loop(hours=3)
 async def checar_atividade():
     print("🔄 Executando checar_atividade()...")
-    """Analisa o histórico dos últimos 6 dias + última atividade para detectar inatividade real e padrão suspeito."""
+    """Analisa o histórico dos últimos dias (JANELA_ATIVIDADE_DIAS) + última atividade para detectar inatividade real e padrão suspeito."""
+    marcar_trafego_de_fundo()
     try:
-        logs = carregar_json(ARQUIVO_LOG_ATIVIDADE)
-        atividades = carregar_atividade()
-        historico = carregar_json(ARQUIVO_ATIVIDADE_6DIAS)
-        agora = agora_brasil()
+        logs = await store.load(ARQUIVO_LOG_ATIVIDADE)
+        classificacao = await atividade_rolls.classificacao()
 
         for guild in bot.guilds:
             guild_id = str(guild.id)
@@ -905,58 +2522,31 @@ async def checar_atividade():
             irregulares = []
             inativos = []
 
-            for user_id, valor in atividades.items():
-                if isinstance(valor, dict):
-                    ultima_str = valor.get("data")
-                else:
-                    ultima_str = valor
-
-                if not ultima_str:
-                    continue
-
-                try:
-                    ultima_atividade = datetime.strptime(ultima_str, "%Y-%m-%d %H:%M:%S")
-                except ValueError:
+            # Classificação já calculada pelo acumulador; aqui só se monta o texto
+            for registro in classificacao:
+                categoria = registro["categoria"]
+                if categoria is None:
                     continue
-
-                delta = agora - ultima_atividade
+                user_id = registro["user_id"]
                 membro = guild.get_member(int(user_id))
                 nome = membro.mention if membro else f"Usuário ({user_id})"
-
-                # === Análise com base no histórico ===
-                dias_ativos = []
-                for dia, registros in historico.items():
-                    if isinstance(registros, dict) and user_id in registros:
-                        dias_ativos.append(dia)
-
-                dias_ativos = sorted(dias_ativos)
-                dias_ativos_count = len(dias_ativos)
-
-                # Calcula espaçamento médio entre dias ativos
-                espacamentos = []
-                for i in range(1, len(dias_ativos)):
-                    d1 = datetime.strptime(dias_ativos[i - 1], "%Y-%m-%d")
-                    d2 = datetime.strptime(dias_ativos[i], "%Y-%m-%d")
-                    espacamentos.append((d2 - d1).days)
-
-                espacamento_medio = sum(espacamentos) / len(espacamentos) if espacamentos else 0
-
-                # === Classificação ===
-                if dias_ativos_count >= 3 and delta.days < 3 and espacamento_medio <= 1.2:
-                    ativos.append(f"🟢 {nome} — ativo {dias_ativos_count}/6 dias")
-                elif dias_ativos_count >= 3 and espacamento_medio > 1.2:
-                    irregulares.append(f"🟡 {nome} — ativo {dias_ativos_count}/6 dias (padrão 1 dia sim, 1 dia não)")
-                elif 1 < dias_ativos_count <= 2 and delta.days < 3:
-                    ativos.append(f"🟠 {nome} — ativo {dias_ativos_count}/6 dias (baixa frequência)")
-                elif delta.days >= 3:
-                    inativos.append(f"🔴 {nome} — {delta.days} dias sem roletar")
+                dias = f"{registro['dias_ativos']}/{JANELA_ATIVIDADE_DIAS} dias"
+
+                if categoria == "ativo":
+                    ativos.append(f"🟢 {nome} — ativo {dias}")
+                elif categoria == "irregular":
+                    irregulares.append(f"🟡 {nome} — ativo {dias} (padrão 1 dia sim, 1 dia não)")
+                elif categoria == "baixa_frequencia":
+                    ativos.append(f"🟠 {nome} — ativo {dias} (baixa frequência)")
+                else:
+                    inativos.append(f"🔴 {nome} — {registro['dias_sem_rolar']} dias sem roletar")
 
             # === Se nada pra reportar, pula ===
             if not (ativos or irregulares or inativos):
                 continue
 
             embed = discord.Embed(
-                title="📊 Relatório de Atividade da Mudae (Últimos 6 dias)",
+                title=f"📊 Relatório de Atividade da Mudae (Últimos {JANELA_ATIVIDADE_DIAS} dias)",
                 color=discord.Color.blurple(),
             )
 
@@ -988,54 +2578,28 @@ async def checar_atividade():
         print(f"[ERRO] checar_atividade: {e}")
 
 # === COOLDOWN ===
-def esta_em_cooldown(user_id):
-    cooldowns = carregar_json(ARQUIVO_COOLDOWN)
-    agora = agora_brasil()
-    cooldown_data = cooldowns.get(str(user_id))
-    
+async def esta_em_cooldown(user_id):
+    # Só leitura: quem apaga o cooldown vencido (e avisa o usuário) é a agenda_cooldowns
+    cooldown_data = await store.load_key(ARQUIVO_COOLDOWN, user_id)
+
     if not cooldown_data:
         return False
-    
-    # Verifica se é formato antigo (string) ou novo (dicionário)
-    if isinstance(cooldown_data, dict):
-        expira_str = cooldown_data.get("expira")
-    else:
-        expira_str = cooldown_data
-    
-    if not expira_str:
-        # Dado inválido, remove
-        del cooldowns[str(user_id)]
-        salvar_json(ARQUIVO_COOLDOWN, cooldowns)
-        return False
-    
-    try:
-        expira_em = datetime.strptime(expira_str, "%Y-%m-%d %H:%M:%S")
-    except ValueError:
-        # Formato inválido, remove
-        del cooldowns[str(user_id)]
-        salvar_json(ARQUIVO_COOLDOWN, cooldowns)
-        return False
-    
-    if agora >= expira_em:
-        # Remove cooldown expirado
-        del cooldowns[str(user_id)]
-        salvar_json(ARQUIVO_COOLDOWN, cooldowns)
-        return False
-    
-    return True
 
-def definir_cooldown(user_id, dias=3):
-    """Define um cooldown para um usuário no formato dicionário."""
-    cooldowns = carregar_json(ARQUIVO_COOLDOWN)
-    expira_em = agora_brasil() + timedelta(days=dias)
-    
-    # Formato dicionário com campo de aviso
+    return agora_epoch() < cooldown_data["expira"]
+
+def aplicar_cooldown_em(cooldowns, user_id, dias=3):
+    """Registra o cooldown no dicionário já carregado (para uso dentro de transações)."""
+    expira = agora_epoch() + dias * 86400
     cooldowns[str(user_id)] = {
-        "expira": expira_em.strftime("%Y-%m-%d %H:%M:%S"),
+        "expira": expira,
         "avisado": False
     }
-    
-    salvar_json(ARQUIVO_COOLDOWN, cooldowns)
+    agenda_cooldowns.agendar(user_id, expira)
+
+async def definir_cooldown(user_id, dias=3):
+    """Define um cooldown para um usuário no formato dicionário."""
+    async with store.editar(ARQUIVO_COOLDOWN) as cooldowns:
+        aplicar_cooldown_em(cooldowns, user_id, dias)
 
 # === YOUTUBE ===
 CANAL_YOUTUBE = "UCcMSONDJxb18PW5B8cxYdzQ"  # ID do canal
@@ -1136,7 +2700,7 @@ async def painel_sala(interaction: discord.Interaction):
 )
 @app_commands.checks.has_permissions(administrator=True)
 async def lista_casamentos(interaction: discord.Interaction):
-    dados = carregar_casamentos()
+    dados = await carregar_casamentos()
     guild_id = str(interaction.guild.id)
 
     if guild_id not in dados or not dados[guild_id]:
@@ -1186,7 +2750,7 @@ async def lista_casamentos(interaction: discord.Interaction):
                     name=f"👤 {nome}",
                     value=(
                         f"💖 **{r['personagem']}**\n"
-                        f"📅 `{r['data']}`"
+                        f"📅 `{formatar_epoch(r['data'], '%Y-%m-%d %H:%M')}`"
                     ),
                     inline=False
                 )
@@ -1233,44 +2797,42 @@ async def isencao_inatividade(interaction: discord.Interaction, usuario: discord
     """Comando para conceder ou remover isenção de penalidade por inatividade."""
     
     # Atualiza os dados da isenção com quem concediu
-    isencao = carregar_isencao()
-    user_id_str = str(usuario.id)
+    async with store.editar(ARQUIVO_ISENCAO) as isencao:
+        user_id_str = str(usuario.id)
     
-    if user_id_str in isencao:
-        # Remove isenção
-        del isencao[user_id_str]
-        salvar_isencao(isencao)
+        if user_id_str in isencao:
+            # Remove isenção
+            del isencao[user_id_str]
         
-        embed = discord.Embed(
-            title="🛡️ Isenção Removida",
-            description=f"A isenção de penalidade por inatividade foi **removida** de {usuario.mention}.",
-            color=discord.Color.orange()
-        )
-        embed.add_field(name="Usuário", value=f"{usuario.display_name} (`{usuario.id}`)", inline=True)
-        embed.add_field(name="Ação", value="Removida por " + interaction.user.mention, inline=True)
-        embed.set_footer(text="O usuário agora está sujeito à verificação de inatividade normal.")
+            embed = discord.Embed(
+                title="🛡️ Isenção Removida",
+                description=f"A isenção de penalidade por inatividade foi **removida** de {usuario.mention}.",
+                color=discord.Color.orange()
+            )
+            embed.add_field(name="Usuário", value=f"{usuario.display_name} (`{usuario.id}`)", inline=True)
+            embed.add_field(name="Ação", value="Removida por " + interaction.user.mention, inline=True)
+            embed.set_footer(text="O usuário agora está sujeito à verificação de inatividade normal.")
         
-    else:
-        # Adiciona isenção
-        isencao[user_id_str] = {
-            "usuario": usuario.name,
-            "display_name": usuario.display_name,
-            "data_concessao": agora_brasil().strftime("%Y-%m-%d %H:%M:%S"),
-            "concedido_por": interaction.user.name,
-            "concedido_por_id": interaction.user.id
-        }
-        salvar_isencao(isencao)
+        else:
+            # Adiciona isenção
+            isencao[user_id_str] = {
+                "usuario": usuario.name,
+                "display_name": usuario.display_name,
+                "data_concessao": agora_epoch(),
+                "concedido_por": interaction.user.name,
+                "concedido_por_id": interaction.user.id
+            }
         
-        embed = discord.Embed(
-            title="🛡️ Isenção Concedida",
-            description=f"A isenção de penalidade por inatividade foi **concedida** a {usuario.mention}.",
-            color=discord.Color.green()
-        )
-        embed.add_field(name="Usuário", value=f"{usuario.display_name} (`{usuario.id}`)", inline=True)
-        embed.add_field(name="Concedido por", value=interaction.user.mention, inline=True)
-        embed.add_field(name="Data", value=agora_brasil().strftime("%d/%m/%Y %H:%M"), inline=True)
-        embed.set_footer(text="O usuário não perderá imunidade por inatividade.")
-    
+            embed = discord.Embed(
+                title="🛡️ Isenção Concedida",
+                description=f"A isenção de penalidade por inatividade foi **concedida** a {usuario.mention}.",
+                color=discord.Color.green()
+            )
+            embed.add_field(name="Usuário", value=f"{usuario.display_name} (`{usuario.id}`)", inline=True)
+            embed.add_field(name="Concedido por", value=interaction.user.mention, inline=True)
+            embed.add_field(name="Data", value=agora_brasil().strftime("%d/%m/%Y %H:%M"), inline=True)
+            embed.set_footer(text="O usuário não perderá imunidade por inatividade.")
+
     # 🔒 MENSAGEM PRIVADA (somente o administrador vê)
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
@@ -1279,7 +2841,7 @@ async def isencao_inatividade(interaction: discord.Interaction, usuario: discord
 async def lista_isencao(interaction: discord.Interaction):
     """Lista todos os usuários que possuem isenção de penalidade por inatividade."""
     
-    isencao = carregar_isencao()
+    isencao = await carregar_isencao()
     
     if not isencao:
         embed = discord.Embed(
@@ -1306,7 +2868,7 @@ async def lista_isencao(interaction: discord.Interaction):
             nome = dados.get('usuario', 'Usuário não encontrado')
         
         concedido_por = dados.get('concedido_por', 'Sistema')
-        data_concessao = dados.get('data_concessao', 'Data desconhecida')
+        data_concessao = formatar_epoch(dados["data_concessao"]) if "data_concessao" in dados else "Data desconhecida"
         
         embed.add_field(
             name=f"👤 {nome}",
@@ -1330,8 +2892,8 @@ async def zerar_series(interaction: discord.Interaction):
 
     try:
         # Zera o conteúdo
-        series_vazio = {}
-        salvar_json("series.json", series_vazio)
+        async with store.editar("series.json") as series:
+            series.clear()
         await interaction.response.send_message("🧹 O arquivo **series.json** foi zerado com sucesso!", ephemeral=True)
         print(f"✅ {interaction.user.name} ({interaction.user.id}) zerou o series.json.")
 
@@ -1349,49 +2911,162 @@ async def add_serie(interaction: discord.Interaction, nome_serie: str):
         return
 
     nome_serie = nome_serie.lower().strip()
-    series = carregar_json("series.json")
+    async with store.editar("series.json") as series:
+        ja_existe = nome_serie in series
+        if not ja_existe:
+            series[nome_serie] = {}
 
-    if nome_serie in series:
+    # As respostas saem depois do bloco: o lock do arquivo não espera pelo Discord
+    if ja_existe:
         await interaction.response.send_message(
             f" A série **{nome_serie.title()}** já existe na lista.", ephemeral=True
         )
         return
-
-    series[nome_serie] = {}
-    salvar_json("series.json", series)
     await interaction.response.send_message(
         f" Série **{nome_serie.title()}** adicionada com sucesso!", ephemeral=True
     )
 
+@bot.tree.command(name="recarregar_dados", description="Descarta o cache e força nova leitura dos arquivos do GitHub (admin).")
+@app_commands.describe(arquivo="Arquivo específico (ex: imunidades.json). Vazio = todos.")
+@app_commands.checks.has_permissions(administrator=True)
+async def recarregar_dados(interaction: discord.Interaction, arquivo: str = None):
+    # O flush e a releitura podem esperar pela cota do GitHub: responde antes do prazo de 3s
+    await interaction.response.defer(ephemeral=True)
+    await store.flush()
+    invalidar_cache(arquivo)
+    if arquivo in (None, ARQUIVO_ATIVIDADE, ARQUIVO_HISTORICO_ATIVIDADE):
+        # O acumulador monta o histórico e as últimas atividades a partir destes dois
+        atividade_rolls.invalidar()
+    if arquivo in (None, ARQ_S2_SALAS):
+        # Salas editadas à mão no repositório: índice e timers passam a seguir o arquivo
+        salas = await s2_load_salas()
+        s2_reconstruir_indice(salas)
+        temporizador_salas.reidratar(salas)
+    if arquivo in (None, ARQUIVO_COOLDOWN):
+        # Vencimentos do arquivo antigo saem da agenda; os do novo entram
+        agenda_cooldowns.iniciar(await store.load(ARQUIVO_COOLDOWN))
+    alvo = f"`{arquivo}`" if arquivo else "todos os arquivos"
+    await interaction.followup.send(f"🔄 Cache descartado para {alvo}.", ephemeral=True)
+    print(f"🔄 {interaction.user} invalidou o cache de {arquivo or 'todos os arquivos'}")
+
+@bot.tree.command(name="migrar_shards", description="Divide os arquivos grandes em shards por usuário (admin).")
+@app_commands.describe(buckets="Quantidade de shards por arquivo (padrão: STORAGE_SHARDS).")
+@app_commands.checks.has_permissions(administrator=True)
+async def migrar_shards(interaction: discord.Interaction, buckets: app_commands.Range[int, 2, 64] = STORAGE_SHARDS):
+    await interaction.response.defer(ephemeral=True)
+    await store.flush()
+    manifesto = await store.load(ARQUIVO_SHARDS)
+    pendentes = [nome for nome in DOCUMENTOS_FRAGMENTAVEIS if not manifesto.get(nome)]
+    if not pendentes:
+        await interaction.followup.send("✅ Todos os arquivos já estão fragmentados.", ephemeral=True)
+        return
+
+    # Shards e manifesto saem no mesmo commit: ninguém lê o manifesto novo sem os shards.
+    # O arquivo original fica intacto no repositório como backup. A edição segura o lock
+    # dos documentos do load até o stage: nenhuma alteração entre os dois se perde.
+    linhas = []
+    edicao = store.editar(ARQUIVO_SHARDS, *pendentes)
+    async with edicao as (manifesto, *documentos):
+        for nome, dados in zip(pendentes, documentos):
+            if manifesto.get(nome):
+                continue  # outra migração terminou enquanto esperávamos o lock
+            for arquivo, shard in dividir_em_shards(nome, dados, buckets).items():
+                edicao.stage(arquivo, shard)
+            manifesto[nome] = buckets
+            linhas.append(f"`{nome}` → {buckets} shards ({len(dados)} chaves)")
+    await store.flush()
+    if not linhas:
+        await interaction.followup.send("✅ Todos os arquivos já estão fragmentados.", ephemeral=True)
+        return
+
+    await interaction.followup.send("🧩 Migração concluída:\n" + "\n".join(linhas), ephemeral=True)
+    print(f"🧩 {interaction.user} fragmentou {', '.join(pendentes)} em {buckets} shards")
+
+@bot.tree.command(name="github_cota", description="Mostra o uso da cota da API do GitHub pelo bot (admin).")
+@app_commands.checks.has_permissions(administrator=True)
+async def github_cota(interaction: discord.Interaction):
+    m = agendador.metricas()
+    embed = discord.Embed(title="📡 Cota da API do GitHub", color=discord.Color.blurple())
+    if m["limite"] is None:
+        embed.description = "Nenhuma resposta do GitHub registrada ainda."
+    else:
+        reset = datetime.fromtimestamp(m["reset_em"]) - datetime.now()
+        embed.add_field(name="Restante", value=f"{m['restante']}/{m['limite']}", inline=True)
+        embed.add_field(name="Renova em", value=f"{max(0, int(reset.total_seconds() // 60))} min", inline=True)
+        embed.add_field(name="Pausado por", value=f"{m['bloqueado_por_s']}s", inline=True)
+    embed.add_field(name="Interativas", value=str(m["requisicoes_interativas"]), inline=True)
+    embed.add_field(name="Fundo (loops)", value=str(m["requisicoes_fundo"]), inline=True)
+    embed.add_field(name="Na fila", value=str(m["em_fila"]), inline=True)
+    embed.add_field(name="Respostas de limite", value=str(m["respostas_limitadas"]), inline=True)
+    embed.add_field(name="Tempo total em espera", value=f"{m['espera_total_s']}s", inline=True)
+    embed.set_footer(text=f"Backend: {backend.nome}")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="metricas_armazenamento", description="Leituras, gravações e latência por arquivo (admin).")
+@app_commands.checks.has_permissions(administrator=True)
+async def metricas_armazenamento(interaction: discord.Interaction):
+    por_arquivo = metricas_storage.por_arquivo()
+    if not por_arquivo:
+        await interaction.response.send_message("📊 Nenhuma operação de armazenamento registrada ainda.", ephemeral=True)
+        return
+
+    # Quem mais vai ao backend primeiro
+    ordenados = sorted(por_arquivo.items(), key=lambda item: -(item[1]["requisicoes"] or item[1]["leituras"] + item[1]["escritas"]))
+    linhas = [f"{'arquivo':<24}{'lei':>5}{'esc':>5}{'req':>6}{'KB':>8}{'p95ms':>8}{'cache':>7}{'err':>5}"]
+    for nome, m in ordenados[:25]:
+        cache = f"{100 * m['acertos'] // m['cache']}%" if m["cache"] else "-"
+        p95 = m["p95_ms"] if m["p95_ms"] is not None else "-"
+        linhas.append(
+            f"{nome[:23]:<24}{m['leituras']:>5}{m['escritas']:>5}{m['requisicoes']:>6}"
+            f"{m['bytes'] / 1024:>8.1f}{p95:>8}{cache:>7}{m['erros']:>5}"
+        )
+
+    # Chamadores que mais geram idas ao backend
+    chamadores = {}
+    for serie in metricas_storage.snapshot():
+        if serie["operacao"] in ("leitura", "escrita"):
+            chamadores[serie["chamador"]] = chamadores.get(serie["chamador"], 0) + serie["chamadas"]
+    top = sorted(chamadores.items(), key=lambda item: -item[1])[:5]
+
+    embed = discord.Embed(
+        title="📊 Métricas de armazenamento",
+        description="```\n" + "\n".join(linhas) + "\n```",
+        color=discord.Color.blurple()
+    )
+    if top:
+        embed.add_field(
+            name="Chamadores com mais idas ao backend",
+            value="\n".join(f"`{nome}`: {total}" for nome, total in top),
+            inline=False
+        )
+    embed.set_footer(text=f"Backend: {backend.nome} • JSON completo em /metricas no servidor web (METRICAS_TOKEN)")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
 @bot.tree.command(name="set_log", description="Define o canal de log de atividade (apenas administradores).")
 @app_commands.checks.has_permissions(administrator=True)
 async def set_log(interaction: discord.Interaction):
     guild_id = str(interaction.guild.id)
     canal = interaction.channel  # ✅ define o canal atual onde o comando foi usado
-    logs = carregar_json(ARQUIVO_LOG_ATIVIDADE)
-    logs[guild_id] = canal.id
-    salvar_json(ARQUIVO_LOG_ATIVIDADE, logs)
+    async with store.editar(ARQUIVO_LOG_ATIVIDADE) as logs:
+        logs[guild_id] = canal.id
     await interaction.response.send_message(f"✅ Canal de log definido para {canal.mention}.", ephemeral=True)
 
 @bot.tree.command(name="set_canal_imune", description="Define o canal onde os comandos de imunidade funcionarão.")
 @app_commands.checks.has_permissions(administrator=True)
 async def set_canal_imune(interaction: discord.Interaction):
-    config = carregar_json(ARQUIVO_CONFIG)
-    config[str(interaction.guild.id)] = interaction.channel.id
-    salvar_json(ARQUIVO_CONFIG, config)
+    async with store.editar(ARQUIVO_CONFIG) as config:
+        config[str(interaction.guild.id)] = interaction.channel.id
     await interaction.response.send_message(f"✅ Canal de imunidade definido: {interaction.channel.mention}")
 
 @bot.tree.command(name="set_canal_youtube", description="Define o canal onde serão enviadas notificações do YouTube.")
 @app_commands.checks.has_permissions(administrator=True)
 async def set_canal_youtube(interaction: discord.Interaction):
-    config = carregar_json(ARQUIVO_CONFIG)
     guild_id = str(interaction.guild.id)
-
-    # Cria a chave "youtube" se não existir
-    if "youtube" not in config:
-        config["youtube"] = {}
-    config["youtube"][guild_id] = interaction.channel.id
-    salvar_json(ARQUIVO_CONFIG, config)
+    async with store.editar(ARQUIVO_CONFIG) as config:
+        # Cria a chave "youtube" se não existir
+        if "youtube" not in config:
+            config["youtube"] = {}
+        config["youtube"][guild_id] = interaction.channel.id
 
     await interaction.response.send_message(
         f"✅ Canal do YouTube definido: {interaction.channel.mention}"
@@ -1401,14 +3076,12 @@ async def set_canal_youtube(interaction: discord.Interaction):
 @app_commands.checks.has_permissions(administrator=True)
 async def set_canal_apply(interaction: discord.Interaction):
     """Define o canal para notificações de aplicações de Sala Privada."""
-    config = s2_load(ARQ_S2_CONFIG)
     guild_id = str(interaction.guild.id)
-    
-    if "apply_channel" not in config:
-        config["apply_channel"] = {}
-    
-    config["apply_channel"][guild_id] = interaction.channel.id
-    s2_save(ARQ_S2_CONFIG, config)
+    async with store.editar(ARQ_S2_CONFIG) as config:
+        if "apply_channel" not in config:
+            config["apply_channel"] = {}
+
+        config["apply_channel"][guild_id] = interaction.channel.id
     
     embed = discord.Embed(
         title="✅ Canal de Aplicações Configurado",
@@ -1424,14 +3097,12 @@ async def set_categoria_salas(interaction: discord.Interaction, categoria: disco
     global S2_CATEGORIA_SALAS_ID
     S2_CATEGORIA_SALAS_ID = categoria.id
     
-    config = s2_load(ARQ_S2_CONFIG)
     guild_id = str(interaction.guild.id)
-    
-    if "categoria_salas" not in config:
-        config["categoria_salas"] = {}
-    
-    config["categoria_salas"][guild_id] = categoria.id
-    s2_save(ARQ_S2_CONFIG, config)
+    async with store.editar(ARQ_S2_CONFIG) as config:
+        if "categoria_salas" not in config:
+            config["categoria_salas"] = {}
+
+        config["categoria_salas"][guild_id] = categoria.id
     
     await interaction.response.send_message(
         f"✅ Categoria para salas privadas definida: {categoria.mention}"
@@ -1440,15 +3111,16 @@ async def set_categoria_salas(interaction: discord.Interaction, categoria: disco
 @bot.tree.command(name="remover_canal_youtube", description="Remove o canal configurado para notificações do YouTube.")
 @app_commands.checks.has_permissions(administrator=True)
 async def remover_canal_youtube(interaction: discord.Interaction):
-    config = carregar_json(ARQUIVO_CONFIG)
     guild_id = str(interaction.guild.id)
-
-    if "youtube" in config and guild_id in config["youtube"]:
-        del config["youtube"][guild_id]
-        # Se o objeto youtube ficar vazio, podemos remover a chave para manter o JSON limpo
-        if not config["youtube"]:
-            del config["youtube"]
-        salvar_json(ARQUIVO_CONFIG, config)
+    async with store.editar(ARQUIVO_CONFIG) as config:
+        removido = "youtube" in config and guild_id in config["youtube"]
+        if removido:
+            del config["youtube"][guild_id]
+            # Se o objeto youtube ficar vazio, podemos remover a chave para manter o JSON limpo
+            if not config["youtube"]:
+                del config["youtube"]
+
+    if removido:
         await interaction.response.send_message("🗑️ Canal de notificações do YouTube removido com sucesso.")
     else:
         await interaction.response.send_message("⚙️ Nenhum canal do YouTube configurado para este servidor.")
@@ -1456,7 +3128,7 @@ async def remover_canal_youtube(interaction: discord.Interaction):
 @bot.tree.command(name="ver_canal_imune", description="Mostra qual canal está configurado para imunidade.")
 @app_commands.checks.has_permissions(administrator=True)
 async def ver_canal_imune(interaction: discord.Interaction):
-    config = carregar_json(ARQUIVO_CONFIG)
+    config = await store.load(ARQUIVO_CONFIG)
     canal_id = config.get(str(interaction.guild.id))
     if not canal_id:
         await interaction.response.send_message("⚙️ Nenhum canal de imunidade configurado.")
@@ -1467,10 +3139,10 @@ async def ver_canal_imune(interaction: discord.Interaction):
 @bot.tree.command(name="remover_canal_imune", description="Remove o canal configurado para imunidade.")
 @app_commands.checks.has_permissions(administrator=True)
 async def remover_canal_imune(interaction: discord.Interaction):
-    config = carregar_json(ARQUIVO_CONFIG)
-    if str(interaction.guild.id) in config:
-        del config[str(interaction.guild.id)]
-        salvar_json(ARQUIVO_CONFIG, config)
+    async with store.editar(ARQUIVO_CONFIG) as config:
+        removido = config.pop(str(interaction.guild.id), None) is not None
+
+    if removido:
         await interaction.response.send_message("🗑️ Canal de imunidade removido com sucesso.")
     else:
         await interaction.response.send_message("⚙️ Nenhum canal de imunidade configurado.")
@@ -1480,34 +3152,32 @@ async def remover_canal_imune(interaction: discord.Interaction):
 @app_commands.checks.has_permissions(administrator=True)
 @canal_imunidade()
 async def imune_remover(interaction: discord.Interaction, usuario: discord.Member):
-    imunes = carregar_json(ARQUIVO_IMUNES)
     guild_id = str(interaction.guild.id)
-    if guild_id not in imunes or str(usuario.id) not in imunes[guild_id]:
+    async with store.editar(ARQUIVO_IMUNES) as imunes:
+        removido = imunes.get(guild_id, {}).pop(str(usuario.id), None)
+
+    if removido is None:
         await interaction.response.send_message(f"⚠️ {usuario.mention} não possui personagem imune.")
         return
-    personagem = imunes[guild_id][str(usuario.id)]["personagem"]
-    origem = imunes[guild_id][str(usuario.id)]["origem"]
-    del imunes[guild_id][str(usuario.id)]
-    salvar_json(ARQUIVO_IMUNES, imunes)
+    personagem, origem = removido["personagem"], removido["origem"]
     await interaction.response.send_message(f"🗑️ {interaction.user.mention} removeu a imunidade de **{personagem} ({origem})** de {usuario.mention}.")
 
 @bot.tree.command(name="resetar_cooldown", description="Zera o cooldown de um usuário específico.")
 @app_commands.describe(usuario="Usuário que terá o cooldown resetado")
 @app_commands.checks.has_permissions(administrator=True)
 async def resetar_cooldown(interaction: discord.Interaction, usuario: discord.Member):
-    cooldowns = carregar_json(ARQUIVO_COOLDOWN)
     user_id = str(usuario.id)
+    async with store.editar(ARQUIVO_COOLDOWN) as cooldowns:
+        # Remove cooldown
+        tinha_cooldown = cooldowns.pop(user_id, None) is not None
 
-    if user_id not in cooldowns:
+    if not tinha_cooldown:
         await interaction.response.send_message(
             f"⚙️ {usuario.mention} não possui cooldown ativo.",
             ephemeral=True
         )
         return
-
-    # Remove cooldown
-    del cooldowns[user_id]
-    salvar_json(ARQUIVO_COOLDOWN, cooldowns)
+    agenda_cooldowns.cancelar(user_id)
 
     await interaction.response.send_message(
         f"✅ Cooldown de {usuario.mention} foi resetado com sucesso!"
@@ -1520,7 +3190,7 @@ async def resetar_cooldown(interaction: discord.Interaction, usuario: discord.Me
 async def rank_serie(interaction: discord.Interaction, nome: str):
     await interaction.response.defer(thinking=True)
 
-    series = carregar_json("series.json")
+    series = await store.load("series.json")
     nome = nome.lower().strip()
 
     if nome not in series:
@@ -1563,7 +3233,7 @@ async def atividade_status(interaction: discord.Interaction, pagina: int = 1):
         return
 
     # --- Verifica canal configurado ---
-    logs = carregar_json(ARQUIVO_LOG_ATIVIDADE)
+    logs = await store.load(ARQUIVO_LOG_ATIVIDADE)
     canal_log_id = logs.get(str(interaction.guild.id))
 
     if canal_log_id is None or interaction.channel.id != canal_log_id:
@@ -1571,32 +3241,17 @@ async def atividade_status(interaction: discord.Interaction, pagina: int = 1):
         return
 
     # === Função auxiliar para gerar embed ===
-    def gerar_embed(pagina_atual: int):
-        atividades = carregar_atividade()
-        if not atividades:
-            return discord.Embed(description="📭 Nenhum registro de atividade encontrado.", color=discord.Color.red())
+    async def gerar_embed(pagina_atual: int):
+        classificacao = await atividade_rolls.classificacao()
+        if not classificacao:
+            return discord.Embed(description="📭 Nenhum registro de atividade encontrado.", color=discord.Color.red()), 1
 
-        agora = agora_brasil()
         ativos, inativos = [], []
-
-        for user_id, info in atividades.items():
-            if isinstance(info, dict):
-                ultima_str = info.get("data")
-                nome_usuario = info.get("usuario", "Desconhecido")
-            else:
-                ultima_str = info
-                nome_usuario = "Desconhecido"
-
-            try:
-                ultima_atividade = datetime.strptime(ultima_str, "%Y-%m-%d %H:%M:%S")
-            except ValueError:
-                continue
-
-            delta = agora - ultima_atividade
-            if delta < timedelta(days=3):
-                ativos.append(("🟢 Ativo", user_id, nome_usuario, ultima_str))
+        for registro in classificacao:
+            if registro["recente"]:
+                ativos.append(("🟢 Ativo", registro["user_id"], registro["usuario"], registro["data"]))
             else:
-                inativos.append(("🔴 Inativo", user_id, nome_usuario, ultima_str))
+                inativos.append(("🔴 Inativo", registro["user_id"], registro["usuario"], registro["data"]))
 
         todos = ativos + inativos
         total_paginas = max(1, math.ceil(len(todos) / 10))
@@ -1616,20 +3271,20 @@ async def atividade_status(interaction: discord.Interaction, pagina: int = 1):
                 nome_display = membro.display_name if membro else nome_usuario
                 embed.add_field(
                     name=f"{status} — {nome_display}",
-                    value=f"Última atividade: `{tempo}`",
+                    value=f"Última atividade: `{formatar_epoch(tempo, '%Y-%m-%d %H:%M:%S')}`",
                     inline=False
                 )
         return embed, total_paginas
 
     # === VIEW COM BOTÕES ===
     class AtividadeView(View):
-        def __init__(self, pagina_atual):
+        def __init__(self, pagina_atual, total_paginas):
             super().__init__(timeout=120)
             self.pagina = pagina_atual
-            self.total_paginas = gerar_embed(self.pagina)[1]
+            self.total_paginas = total_paginas
 
         async def atualizar(self, interaction_btn):
-            novo_embed, _ = gerar_embed(self.pagina)
+            novo_embed, self.total_paginas = await gerar_embed(self.pagina)
             await interaction_btn.response.edit_message(embed=novo_embed, view=self)
 
         @discord.ui.button(label="⬅️", style=discord.ButtonStyle.gray)
@@ -1650,8 +3305,8 @@ async def atividade_status(interaction: discord.Interaction, pagina: int = 1):
             await self.atualizar(interaction_btn)
 
     # === Envia a primeira página ===
-    embed, total_paginas = gerar_embed(pagina)
-    view = AtividadeView(pagina)
+    embed, total_paginas = await gerar_embed(pagina)
+    view = AtividadeView(pagina, total_paginas)
     await interaction.response.send_message(embed=embed, view=view)
 
 # === COMANDOS DE COOLDOWN PERSONALIZADO ===
@@ -1660,19 +3315,18 @@ async def atividade_status(interaction: discord.Interaction, pagina: int = 1):
 @app_commands.checks.has_permissions(administrator=True)
 async def remover_cooldown(interaction: discord.Interaction, usuario: discord.Member):
     """Remove o cooldown de um usuário específico."""
-    cooldowns = carregar_json(ARQUIVO_COOLDOWN)
     user_id_str = str(usuario.id)
-    
-    if user_id_str not in cooldowns:
+    async with store.editar(ARQUIVO_COOLDOWN) as cooldowns:
+        # Remove o cooldown
+        tinha_cooldown = cooldowns.pop(user_id_str, None) is not None
+
+    if not tinha_cooldown:
         await interaction.response.send_message(
             f"⚙️ {usuario.mention} não possui cooldown ativo.",
             ephemeral=True
         )
         return
-    
-    # Remove o cooldown
-    del cooldowns[user_id_str]
-    salvar_json(ARQUIVO_COOLDOWN, cooldowns)
+    agenda_cooldowns.cancelar(user_id_str)
     
     embed = discord.Embed(
         title="⏳ Cooldown Removido",
@@ -1707,7 +3361,7 @@ async def aplicar_cooldown(interaction: discord.Interaction, usuario: discord.Me
         return
     
     # ✅ CORREÇÃO: Use str(usuario.id) em vez de user_id
-    definir_cooldown(str(usuario.id), dias=dias)
+    await definir_cooldown(str(usuario.id), dias=dias)
     
     # Calcula a data de expiração
     expira_em = agora_brasil() + timedelta(days=dias)
@@ -1726,7 +3380,7 @@ async def aplicar_cooldown(interaction: discord.Interaction, usuario: discord.Me
     await interaction.response.send_message(embed=embed, ephemeral=True)
     
     # 🔔 NOTIFICAÇÃO PÚBLICA (opcional)
-    config = carregar_json(ARQUIVO_CONFIG)
+    config = await store.load(ARQUIVO_CONFIG)
     guild_id = str(interaction.guild.id)
     canal_id = config.get(guild_id)
     
@@ -1745,24 +3399,23 @@ async def aplicar_cooldown(interaction: discord.Interaction, usuario: discord.Me
 async def testar_mudae_embed(interaction: discord.Interaction):
     await interaction.response.defer(thinking=True, ephemeral=False)
 
-    # Busca as últimas 10 mensagens do canal
-    async for msg in interaction.channel.history(limit=10):
-        if msg.author.bot and msg.author.name.lower() == "mudae" and msg.embeds:
-            embed = msg.embeds[0]
-            titulo = embed.title or "(sem título)"
-            descricao = embed.description or "(sem descrição)"
-            autor = embed.author.name if embed.author and embed.author.name else "(sem autor)"
-            footer = embed.footer.text if embed.footer and embed.footer.text else "(sem footer)"
-
-            await interaction.followup.send(
-                f"📦 **Embed da Mudae detectada!**\n"
-                f"**Autor:** {autor}\n"
-                f"**Título:** {titulo}\n"
-                f"**Descrição:** {descricao[:900]}\n"
-                f"**Footer:** {footer}",
-                ephemeral=False
-            )
-            return
+    # Última embed da Mudae do canal (buffer em memória; histórico só com o canal frio)
+    entrada = await embeds_mudae.ultima(interaction.channel)
+    if entrada:
+        titulo = entrada["titulo"] or "(sem título)"
+        descricao = entrada["descricao"] or "(sem descrição)"
+        autor = entrada["autor"] or "(sem autor)"
+        footer = entrada["footer"] or "(sem footer)"
+
+        await interaction.followup.send(
+            f"📦 **Embed da Mudae detectada!**\n"
+            f"**Autor:** {autor}\n"
+            f"**Título:** {titulo}\n"
+            f"**Descrição:** {descricao[:900]}\n"
+            f"**Footer:** {footer}",
+            ephemeral=False
+        )
+        return
 
     await interaction.followup.send("⚠️ Nenhuma embed recente da Mudae encontrada neste canal.", ephemeral=True)
 
@@ -1770,47 +3423,47 @@ async def testar_mudae_embed(interaction: discord.Interaction):
 @canal_imunidade()
 @app_commands.describe(nome_personagem="Nome do personagem", jogo_anime="Nome do jogo/anime")
 async def imune_add(interaction: discord.Interaction, nome_personagem: str, jogo_anime: str):
-    imunes = carregar_json(ARQUIVO_IMUNES)
     guild_id, user_id = str(interaction.guild.id), str(interaction.user.id)
-    imunes.setdefault(guild_id, {})
 
-    if esta_em_cooldown(user_id):
+    # Checado antes da edição dos imunes: é só uma leitura, não segura lock nenhum
+    if await esta_em_cooldown(user_id):
         await interaction.response.send_message(
             f"⏳ {interaction.user.mention}, você está em cooldown. Aguarde o cooldown acabar.",
             ephemeral=True
         )
         return
 
-    if user_id in imunes[guild_id]:
-        await interaction.response.send_message(
-            "⚠️ Você já possui um personagem imune.",
-            ephemeral=True
-        )
-        return
+    # Só decide dentro da edição; a resposta sai depois, com o lock já solto
+    aviso = None
+    async with store.editar(ARQUIVO_IMUNES) as imunes:
+        imunes.setdefault(guild_id, {})
 
-    # Normaliza os textos para comparação
-    nome_normalizado = normalizar_texto(nome_personagem)
-    origem_normalizada = normalizar_texto(jogo_anime)
+        # Normaliza os textos para comparação
+        nome_normalizado = normalizar_texto(nome_personagem)
+        origem_normalizada = normalizar_texto(jogo_anime)
 
-    # 🔒 Impede nomes iguais com mesma origem (ignorando acentos e maiúsculas)
-    for uid, d in imunes[guild_id].items():
-        if (normalizar_texto(d["personagem"]) == nome_normalizado and
-            normalizar_texto(d["origem"]) == origem_normalizada):
-            await interaction.response.send_message(
-                f"⚠️ O personagem **{nome_personagem} ({jogo_anime})** já está imune por {d['usuario']}.",
-                ephemeral=True
-            )
-            return
+        if user_id in imunes[guild_id]:
+            aviso = "⚠️ Você já possui um personagem imune."
+        else:
+            # 🔒 Impede nomes iguais com mesma origem (ignorando acentos e maiúsculas)
+            for uid, d in imunes[guild_id].items():
+                if (normalizar_texto(d["personagem"]) == nome_normalizado and
+                    normalizar_texto(d["origem"]) == origem_normalizada):
+                    aviso = f"⚠️ O personagem **{nome_personagem} ({jogo_anime})** já está imune por {d['usuario']}."
+                    break
 
-    # ✅ Adiciona o personagem normalmente
-    imunes[guild_id][user_id] = {
-        "usuario": interaction.user.name,
-        "personagem": nome_personagem,
-        "origem": jogo_anime,
-        "data": agora_brasil().strftime("%Y-%m-%d %H:%M:%S")
-    }
+        if aviso is None:
+            # ✅ Adiciona o personagem normalmente
+            imunes[guild_id][user_id] = {
+                "usuario": interaction.user.name,
+                "personagem": nome_personagem,
+                "origem": jogo_anime,
+                "data": agora_epoch()
+            }
 
-    salvar_json(ARQUIVO_IMUNES, imunes)
+    if aviso:
+        await interaction.response.send_message(aviso, ephemeral=True)
+        return
     await interaction.response.send_message(
         f"🔒 {interaction.user.mention} definiu **{nome_personagem} ({jogo_anime})** como imune!"
     )
@@ -1818,7 +3471,7 @@ async def imune_add(interaction: discord.Interaction, nome_personagem: str, jogo
 @bot.tree.command(name="imune_lista", description="Mostra a lista de personagens imunes.")
 @canal_imunidade()
 async def imune_lista(interaction: discord.Interaction):
-    imunes = carregar_json(ARQUIVO_IMUNES)
+    imunes = await store.load(ARQUIVO_IMUNES)
     guild_id = str(interaction.guild.id)
     if guild_id not in imunes or not imunes[guild_id]:
         await interaction.response.send_message("📭 Nenhum personagem imune.")
@@ -1835,66 +3488,192 @@ async def imune_lista(interaction: discord.Interaction):
 @canal_imunidade()
 async def imune_status(interaction: discord.Interaction):
     user_id, guild_id = str(interaction.user.id), str(interaction.guild.id)
-    imunes, cooldowns = carregar_json(ARQUIVO_IMUNES), carregar_json(ARQUIVO_COOLDOWN)
+    imunes, cooldowns = await store.load(ARQUIVO_IMUNES), await store.load(ARQUIVO_COOLDOWN)
     
     embed = discord.Embed(title=f"📊 Status de {interaction.user.display_name}", color=0x00B0F4)
     
     # Seção de imunidade
     if guild_id in imunes and user_id in imunes[guild_id]:
         p = imunes[guild_id][user_id]
-        embed.add_field(name="🔒 Personagem Imune", value=f"**{p['personagem']}** — {p['origem']}\n📅 Desde: `{p['data']}`", inline=False)
+        desde = formatar_epoch(p["data"], "%Y-%m-%d %H:%M:%S") if "data" in p else "?"
+        embed.add_field(name="🔒 Personagem Imune", value=f"**{p['personagem']}** — {p['origem']}\n📅 Desde: `{desde}`", inline=False)
     else:
         embed.add_field(name="🔒 Personagem Imune", value="Nenhum ativo.", inline=False)
     
-    # Seção de cooldown (corrigida para lidar com ambos os formatos)
-    if user_id in cooldowns:
-        cooldown_data = cooldowns[user_id]
-        
-        # 🔹 Verifica se é formato novo (dicionário) ou antigo (string)
-        if isinstance(cooldown_data, dict):
-            expira_str = cooldown_data.get("expira")
-        else:
-            expira_str = cooldown_data
+    # Seção de cooldown
+    expira = cooldowns[user_id]["expira"] if user_id in cooldowns else 0
+    restante = expira - agora_epoch()
+    if restante > 0:
+        dias, resto = divmod(restante, 86400)
+        horas, resto = divmod(resto, 3600)
+        minutos = resto // 60
         
-        if expira_str:
-            try:
-                expira = datetime.strptime(expira_str, "%Y-%m-%d %H:%M:%S")
-                agora = agora_brasil()
-                
-                if expira > agora:
-                    restante = expira - agora
-                    dias, resto = divmod(restante.total_seconds(), 86400)
-                    horas, resto = divmod(resto, 3600)
-                    minutos = (resto % 3600) // 60
-                    
-                    embed.add_field(name="⏳ Cooldown", 
-                                  value=f"Em andamento — {int(dias)}d {int(horas)}h {int(minutos)}min restantes.\n⏰ Expira: {expira.strftime('%d/%m/%Y %H:%M')}", 
-                                  inline=False)
-                else:
-                    embed.add_field(name="⏳ Cooldown", value="Nenhum cooldown ativo.", inline=False)
-            except (ValueError, TypeError) as e:
-                embed.add_field(name="⏳ Cooldown", value=f"Erro ao ler cooldown: {e}", inline=False)
+        embed.add_field(name="⏳ Cooldown", 
+                      value=f"Em andamento — {dias}d {horas}h {minutos}min restantes.\n⏰ Expira: {formatar_epoch(expira)}", 
+                      inline=False)
     else:
         embed.add_field(name="⏳ Cooldown", value="Nenhum cooldown ativo.", inline=False)
     
     await interaction.response.send_message(embed=embed)
 
 # === FUNÇÃO AUXILIAR ===
-async def obter_ultima_embed_mudae(channel: discord.TextChannel):
-    """Retorna (autor, footer, descricao) da última embed da Mudae no canal."""
-    async for msg in channel.history(limit=10):
-        if msg.author.bot and msg.author.name.lower() == "mudae" and msg.embeds:
-            embed = msg.embeds[0]
-            autor = embed.author.name if embed.author and embed.author.name else None
-            footer = embed.footer.text if embed.footer and embed.footer.text else None
-            descricao = embed.description or ""
-            return autor, footer, descricao
-    return None, None, None
+def dados_embed_mudae(embed: discord.Embed):
+    """(autor, footer, descricao) de uma embed da Mudae."""
+    autor = embed.author.name if embed.author and embed.author.name else None
+    footer = embed.footer.text if embed.footer and embed.footer.text else None
+    descricao = embed.description or ""
+    return autor, footer, descricao
 
-async def detectar_casamento_mudae(message: discord.Message):
+MUDAE_BUFFER_TAMANHO = 20  # embeds da Mudae guardadas por canal
 
-    if not canal_e_sala_privada_ativa(message.channel.id):
-        return
+class BufferEmbedsMudae:
+    """Últimas embeds da Mudae de cada canal, já extraídas, alimentadas pelo gateway.
+
+    on_message e on_message_edit registram cada embed da Mudae (uma edição,
+    como a troca de página do $imao, atualiza a entrada da mesma mensagem).
+    Canal que ainda não apareceu desde o início do bot está frio: a primeira
+    consulta lê o histórico uma vez e dali em diante tudo sai da memória.
+    """
+
+    def __init__(self):
+        self._canais = {}  # channel_id -> deque de entradas, da mais antiga à mais nova
+
+    @staticmethod
+    def _entrada(message):
+        embed = message.embeds[0]
+        autor, footer, descricao = dados_embed_mudae(embed)
+        return {
+            "message_id": message.id,
+            "titulo": embed.title,
+            "autor": autor,
+            "footer": footer,
+            "descricao": descricao,
+        }
+
+    def registrar(self, message):
+        entradas = self._canais.get(message.channel.id)
+        if entradas is None:
+            entradas = self._canais[message.channel.id] = deque(maxlen=MUDAE_BUFFER_TAMANHO)
+        entrada = self._entrada(message)
+        for i, existente in enumerate(entradas):
+            if existente["message_id"] == message.id:
+                entradas[i] = entrada
+                return
+        entradas.append(entrada)
+
+    async def ultima(self, channel):
+        """Entrada da embed mais recente da Mudae no canal, ou None."""
+        if channel.id not in self._canais:
+            # Canal frio: uma leitura do histórico (vem da mais nova para a mais antiga)
+            historico = [
+                self._entrada(msg) async for msg in channel.history(limit=10)
+                if msg.author.id == MUDAE_BOT_ID and msg.embeds
+            ]
+            # O que o gateway registrou durante a leitura é mais novo e prevalece
+            recentes = self._canais.get(channel.id, ())
+            vistos = {entrada["message_id"] for entrada in recentes}
+            antigas = [entrada for entrada in reversed(historico) if entrada["message_id"] not in vistos]
+            self._canais[channel.id] = deque(antigas + list(recentes), maxlen=MUDAE_BUFFER_TAMANHO)
+        entradas = self._canais[channel.id]
+        return entradas[-1] if entradas else None
+
+embeds_mudae = BufferEmbedsMudae()
+
+MUDAE_RESPOSTA_TIMEOUT = 10  # segundos esperando a embed da Mudae depois de um $im
+
+class CorrelacaoMudae:
+    """Liga um comando à próxima embed da Mudae no mesmo canal.
+
+    Quem espera registra um future na fila do canal antes da Mudae responder;
+    a rota de embeds da Mudae entrega cada embed ao primeiro da fila. Vários
+    `$im` seguidos no mesmo canal recebem as respostas na ordem em que foram
+    enviados. Sem ninguém esperando, entregar custa uma consulta ao dict.
+    """
+
+    def __init__(self):
+        self._pendentes = {}  # channel_id -> deque de futures
+
+    def registrar(self, channel_id):
+        future = asyncio.get_running_loop().create_future()
+        self._pendentes.setdefault(channel_id, deque()).append(future)
+        return future
+
+    async def esperar(self, future, channel_id, timeout=MUDAE_RESPOSTA_TIMEOUT):
+        """Resultado do future, ou None se a Mudae não respondeu a tempo."""
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            fila = self._pendentes.get(channel_id)
+            if fila is not None:
+                if future in fila:
+                    fila.remove(future)
+                if not fila:
+                    del self._pendentes[channel_id]
+
+    def entregar(self, message):
+        fila = self._pendentes.get(message.channel.id)
+        while fila:
+            future = fila.popleft()
+            if not future.done():
+                future.set_result(message)
+                break
+        if fila is not None and not fila:
+            del self._pendentes[message.channel.id]
+
+correlacao_mudae = CorrelacaoMudae()
+
+class IndiceMembros:
+    """Nome normalizado -> ids de membros, por guild.
+
+    Indexa apelido no servidor, nome de exibição global e username de cada
+    membro, para resolver o dono que a Mudae escreve no footer sem percorrer
+    `guild.members`. Montado no on_ready e mantido pelos eventos de membro.
+    """
+
+    def __init__(self):
+        self._por_guild = {}  # guild_id -> {nome: {member_id, ...}}
+        self._nomes = {}      # (guild_id, member_id) -> nomes indexados
+
+    @staticmethod
+    def _chaves(membro):
+        nomes = {membro.display_name, membro.name, getattr(membro, "global_name", None)}
+        return {normalizar_texto(nome) for nome in nomes if nome}
+
+    def adicionar(self, membro):
+        self.remover(membro.guild.id, membro.id)
+        chaves = self._chaves(membro)
+        nomes = self._por_guild.setdefault(membro.guild.id, {})
+        for chave in chaves:
+            nomes.setdefault(chave, set()).add(membro.id)
+        self._nomes[(membro.guild.id, membro.id)] = chaves
+
+    def remover(self, guild_id, member_id):
+        nomes = self._por_guild.get(guild_id, {})
+        for chave in self._nomes.pop((guild_id, member_id), ()):
+            ids = nomes.get(chave)
+            if ids:
+                ids.discard(member_id)
+                if not ids:
+                    del nomes[chave]
+
+    def indexar_guild(self, guild):
+        for member_id in [m for g, m in self._nomes if g == guild.id]:
+            self.remover(guild.id, member_id)
+        for membro in guild.members:
+            self.adicionar(membro)
+
+    def resolver(self, guild_id, nome):
+        """id do único membro com esse nome; None se ninguém ou se for ambíguo."""
+        ids = self._por_guild.get(guild_id, {}).get(normalizar_texto(nome))
+        if ids and len(ids) == 1:
+            return next(iter(ids))
+        return None
+
+indice_membros = IndiceMembros()
+
+async def detectar_casamento_mudae(message: discord.Message):
 
     embed = message.embeds[0]
 
@@ -1924,25 +3703,23 @@ async def detectar_casamento_mudae(message: discord.Message):
     if not any(p in texto for p in palavras_casamento):
         return
 
-    # 🔹 extrai nome do usuário do footer
-    import re
-    m = re.search(r"pertence a (.+)", texto)
+    if not canal_e_sala_privada_ativa(message.channel.id):
+        return
+
+    # 🔹 extrai nome do usuário do footer ("Pertence a fulano ~~ 2/5")
+    m = re.search(r"(?:pertence a|belongs to) ([^~\n]+)", texto)
     if not m:
         return
 
     usuario_nome = m.group(1).strip()
 
     # tenta resolver ID
-    usuario_id = None
-    for mbr in message.guild.members:
-        if mbr.display_name.lower() == usuario_nome.lower():
-            usuario_id = mbr.id
-            break
+    usuario_id = indice_membros.resolver(message.guild.id, usuario_nome)
 
     if not usuario_id:
         return
 
-    registrar_casamento(
+    await registrar_casamento(
         message.guild.id,
         usuario_id,
         usuario_nome,
@@ -1962,39 +3739,39 @@ async def detectar_casamento_mudae(message: discord.Message):
 @bot.tree.command(name="sala_privada_aplicar", description="Aplique para ter acesso a sala privada.")
 async def sala_privada_apply(interaction: discord.Interaction):
     # Verifica se usuário tem imunidade
-    if usuario_tem_imunidade(interaction.user.id, interaction.guild.id):
+    if await usuario_tem_imunidade(interaction.user.id, interaction.guild.id):
         await interaction.response.send_message(
             "⛔ Você não pode aplicar para Sala Privada porque possui um personagem imune. ",
             ephemeral=True
         )
         return
     
-    players = s2_load(ARQ_S2_PLAYERS)
     uid = str(interaction.user.id)
+    async with store.editar(ARQ_S2_PLAYERS) as players:
+        aplicacao = players.get(uid)
+        if aplicacao is None:
+            players[uid] = {
+                "status": "pendente",
+                "rodadas": 0,
+                "bonus_evento": 0,
+                "ultimo_reset": None,
+                "sala_ativa": False
+            }
 
-    # Verifica se já aplicou
-    if uid in players:
-        if players[uid]["status"] == "pendente":
+    # Verifica se já aplicou (a resposta sai com o lock do arquivo já solto)
+    if aplicacao is not None:
+        if aplicacao["status"] == "pendente":
             await interaction.response.send_message(
                 "⏳ Sua aplicação já está pendente de aprovação.", ephemeral=True
             )
-        elif players[uid]["status"] == "aprovado":
+        elif aplicacao["status"] == "aprovado":
             await interaction.response.send_message(
                 "✅ Você já foi aprovado para usar salas privadas.", ephemeral=True
             )
         return
-
-    players[uid] = {
-        "status": "pendente",
-        "rodadas": 0,
-        "bonus_evento": 0,
-        "ultimo_reset": None,
-        "sala_ativa": False
-    }
-    s2_save(ARQ_S2_PLAYERS, players)
     
     # Envia notificação no canal configurado COM BOTÕES
-    config = s2_load(ARQ_S2_CONFIG)
+    config = await s2_load(ARQ_S2_CONFIG)
     guild_id = str(interaction.guild.id)
     
     if "apply_channel" in config and guild_id in config["apply_channel"]:
@@ -2049,11 +3826,10 @@ async def sala_remover_acesso(
     """Remove completamente o acesso de um usuário às salas privadas."""
     
     uid = str(usuario.id)
-    players = s2_load(ARQ_S2_PLAYERS)
-    salas = s2_load_salas()
+    jogador = await s2_carregar_jogador(uid)
     
     # Verifica se o usuário está no sistema
-    if uid not in players:
+    if jogador is None:
         await interaction.response.send_message(
             f"❌ {usuario.mention} não está no sistema de salas privadas.",
             ephemeral=True
@@ -2061,18 +3837,18 @@ async def sala_remover_acesso(
         return
     
     # Se o usuário tem uma sala ativa e remover_sala_ativa é True
-    if remover_sala_ativa and players[uid].get("sala_ativa", False):
-        if uid in salas and salas[uid].get("ativa", False):
-            await fechar_sala_automaticamente(uid, interaction.guild)
+    # (antes da edição abaixo: fechar_sala_automaticamente edita os mesmos arquivos)
+    if remover_sala_ativa and jogador.get("sala_ativa", False):
+        await fechar_sala_automaticamente(uid, interaction.guild)
     
-    # Remove o usuário do sistema
-    del players[uid]
+    # Remove o usuário do sistema e a sala do usuário (se existir)
+    async with store.editar(ARQ_S2_PLAYERS, ARQ_S2_SALAS) as (players, salas):
+        players.pop(uid, None)
+        sala_info = salas.pop(uid, None)
+    s2_desindexar_sala(uid)
+    temporizador_salas.cancelar(uid)
     
-    # Remove a sala do usuário (se existir)
-    if uid in salas:
-        # Tenta remover o cargo e canal
-        sala_info = salas[uid]
-        
+    if sala_info:
         # Remove cargo
         cargo = interaction.guild.get_role(sala_info.get("cargo_id"))
         if cargo:
@@ -2088,13 +3864,6 @@ async def sala_remover_acesso(
                 await canal.delete(reason=f"Acesso removido por {interaction.user}")
             except:
                 pass
-        
-        # Remove do arquivo de salas
-        del salas[uid]
-    
-    # Salva as alterações
-    s2_save(ARQ_S2_PLAYERS, players)
-    s2_save_salas(salas)
     
     # Envia DM para o usuário
     try:
@@ -2142,27 +3911,27 @@ async def sala_recusar_aplicacao(
     """Recusa manualmente a aplicação de um usuário."""
     
     uid = str(usuario.id)
-    players = s2_load(ARQ_S2_PLAYERS)
-    
-    # Verifica se o usuário tem uma aplicação pendente
-    if uid not in players:
+    async with store.editar(ARQ_S2_PLAYERS) as players:
+        aplicacao = players.get(uid)
+        if aplicacao is not None and aplicacao["status"] == "pendente":
+            # Remove a aplicação
+            del players[uid]
+
+    # Verifica se o usuário tinha uma aplicação pendente (respostas fora do lock)
+    if aplicacao is None:
         await interaction.response.send_message(
             f"❌ {usuario.mention} não possui uma aplicação pendente.",
             ephemeral=True
         )
         return
-    
-    if players[uid]["status"] != "pendente":
+
+    if aplicacao["status"] != "pendente":
         await interaction.response.send_message(
-            f"❌ {usuario.mention} não tem uma aplicação pendente. Status atual: {players[uid]['status']}",
+            f"❌ {usuario.mention} não tem uma aplicação pendente. Status atual: {aplicacao['status']}",
             ephemeral=True
         )
         return
     
-    # Remove a aplicação
-    del players[uid]
-    s2_save(ARQ_S2_PLAYERS, players)
-    
     # Envia DM para o usuário
     try:
         embed_dm = discord.Embed(
@@ -2204,7 +3973,7 @@ async def sala_recusar_aplicacao(
 async def sala_aplicacoes_pendentes(interaction: discord.Interaction):
     """Mostra todas as aplicações pendentes."""
     
-    players = s2_load(ARQ_S2_PLAYERS)
+    players = await s2_load(ARQ_S2_PLAYERS)
     
     # Filtra apenas aplicações pendentes
     pendentes = {uid: data for uid, data in players.items() if data.get("status") == "pendente"}
@@ -2225,7 +3994,7 @@ async def sala_aplicacoes_pendentes(interaction: discord.Interaction):
             self.per_page = 5
             self.total_pages = (len(self.aplicacoes) - 1) // self.per_page + 1
         
-        def gerar_embed(self):
+        async def gerar_embed(self):
             inicio = self.page * self.per_page
             fim = inicio + self.per_page
             pagina = self.aplicacoes[inicio:fim]
@@ -2242,7 +4011,7 @@ async def sala_aplicacoes_pendentes(interaction: discord.Interaction):
                 mencao_usuario = usuario.mention if usuario else f"`{uid}`"
                 
                 # Verifica se tem imunidade
-                tem_imunidade = usuario_tem_imunidade(int(uid), interaction.guild.id)
+                tem_imunidade = await usuario_tem_imunidade(int(uid), interaction.guild.id)
                 
                 embed.add_field(
                     name=f"👤 {nome_usuario}",
@@ -2264,7 +4033,7 @@ async def sala_aplicacoes_pendentes(interaction: discord.Interaction):
             if self.page > 0:
                 self.page -= 1
                 await interaction_btn.response.edit_message(
-                    embed=self.gerar_embed(),
+                    embed=await self.gerar_embed(),
                     view=self
                 )
         
@@ -2273,27 +4042,27 @@ async def sala_aplicacoes_pendentes(interaction: discord.Interaction):
             if self.page < self.total_pages - 1:
                 self.page += 1
                 await interaction_btn.response.edit_message(
-                    embed=self.gerar_embed(),
+                    embed=await self.gerar_embed(),
                     view=self
                 )
         
         @discord.ui.button(label="🔄 Atualizar", style=discord.ButtonStyle.green)
         async def atualizar(self, interaction_btn: discord.Interaction, button: discord.ui.Button):
             # Recarrega os dados
-            players = s2_load(ARQ_S2_PLAYERS)
+            players = await s2_load(ARQ_S2_PLAYERS)
             self.aplicacoes = [(uid, data) for uid, data in players.items() if data.get("status") == "pendente"]
             self.total_pages = (len(self.aplicacoes) - 1) // self.per_page + 1
             if self.page >= self.total_pages:
                 self.page = max(0, self.total_pages - 1)
             
             await interaction_btn.response.edit_message(
-                embed=self.gerar_embed(),
+                embed=await self.gerar_embed(),
                 view=self
             )
     
     view = AplicacoesPendentesView(pendentes)
     await interaction.response.send_message(
-        embed=view.gerar_embed(),
+        embed=await view.gerar_embed(),
         view=view,
         ephemeral=True
     )
@@ -2304,20 +4073,20 @@ async def sala_privada_aprovar(
     interaction: discord.Interaction,
     usuario: discord.Member
 ):
-    players = s2_load(ARQ_S2_PLAYERS)
     uid = str(usuario.id)
+    async with store.editar(ARQ_S2_PLAYERS) as players:
+        encontrado = uid in players
+        if encontrado:
+            players[uid].update({
+                "status": "aprovado",
+                "rodadas": 3,
+                "ultimo_reset": agora_brasil().strftime("%Y-%m-%d"),
+                "sala_ativa": False
+            })
 
-    if uid not in players:
+    if not encontrado:
         await interaction.response.send_message("❌ Usuário não aplicou.", ephemeral=True)
         return
-
-    players[uid].update({
-        "status": "aprovado",
-        "rodadas": 3,
-        "ultimo_reset": agora_brasil().strftime("%Y-%m-%d"),
-        "sala_ativa": False
-    })
-    s2_save(ARQ_S2_PLAYERS, players)
     
     # Notifica o usuário
     try:
@@ -2343,7 +4112,7 @@ async def sala_privada_aprovar(
 )
 async def sala_privada_abrir(interaction: discord.Interaction):
     # Verifica se usuário tem imunidade
-    if usuario_tem_imunidade(interaction.user.id, interaction.guild.id):
+    if await usuario_tem_imunidade(interaction.user.id, interaction.guild.id):
         await interaction.response.send_message(
             "⛔ Você não pode abrir uma sala porque possui um personagem imune. ",
             ephemeral=True
@@ -2352,24 +4121,26 @@ async def sala_privada_abrir(interaction: discord.Interaction):
     
     uid = str(interaction.user.id)
     guild = interaction.guild
-    agora = agora_brasil()
+    agora = agora_epoch()
+
+    config = await s2_load(ARQ_S2_CONFIG)
 
-    players = s2_load(ARQ_S2_PLAYERS)
-    salas = s2_load_salas()
-    config = s2_load(ARQ_S2_CONFIG)
+    def pode_abrir(p):
+        return p and p["status"] == "aprovado" and p["rodadas"] > 0
 
-    p = players.get(uid)
-    if not p or p["status"] != "aprovado" or p["rodadas"] <= 0:
+    if not pode_abrir(await s2_carregar_jogador(uid)):
         await interaction.response.send_message(
             "⛔ Você não pode abrir uma sala agora.",
             ephemeral=True
         )
         return
 
-    # Fecha sala antiga (se existir)
-    if uid in salas:
+    # Fecha sala antiga (se existir) antes da edição: fechar_sala_automaticamente edita os mesmos arquivos
+    if await store.load_key(ARQ_S2_SALAS, uid) is not None:
         await fechar_sala_automaticamente(uid, guild)
 
+    # Cargo e canal são criados fora do lock: chamadas ao Discord podem levar segundos
+    # e, enquanto isso, todas as outras aberturas e fechamentos ficariam na fila
     categoria = guild.get_channel(
         config["categoria_salas"][str(guild.id)]
     )
@@ -2412,23 +4183,42 @@ async def sala_privada_abrir(interaction: discord.Interaction):
 
     await interaction.user.add_roles(cargo)
 
-    expira_em = agora + timedelta(seconds=S2_TEMPO_SALA)
-
-    # === SALVA NO GITHUB ===
-    salas[uid] = {
-        "guild_id": str(guild.id),
-        "cargo_id": cargo.id,
-        "canal_id": canal.id,
-        "aberta_em": agora.strftime("%Y-%m-%d %H:%M:%S"),
-        "expira_em": expira_em.strftime("%Y-%m-%d %H:%M:%S"),
-        "usuario_nome": interaction.user.display_name,
-        "ativa": True
-    }
-    s2_save_salas(salas)
+    expira_em = agora + S2_TEMPO_SALA
+
+    async with store.editar(ARQ_S2_SALAS, ARQ_S2_PLAYERS) as (salas, players):
+        # Confere de novo sob o lock: dois cliques simultâneos gastariam a mesma rodada
+        p = players.get(uid)
+        s2_aplicar_reset_diario(p)
+        aberta = pode_abrir(p) and not salas.get(uid, {}).get("ativa", False)
+        if aberta:
+            # === SALVA NO GITHUB ===
+            salas[uid] = {
+                "guild_id": str(guild.id),
+                "cargo_id": cargo.id,
+                "canal_id": canal.id,
+                "aberta_em": agora,
+                "expira_em": expira_em,
+                "usuario_nome": interaction.user.display_name,
+                "ativa": True
+            }
+            p["rodadas"] -= 1
+            p["sala_ativa"] = True
+
+    if not aberta:
+        # Outro clique abriu primeiro (ou a rodada acabou): desfaz o que foi criado
+        for objeto in (canal, cargo):
+            try:
+                await objeto.delete(reason="Sala privada não aberta")
+            except discord.HTTPException:
+                pass
+        await interaction.response.send_message(
+            "⛔ Você não pode abrir uma sala agora.",
+            ephemeral=True
+        )
+        return
 
-    p["rodadas"] -= 1
-    p["sala_ativa"] = True
-    s2_save(ARQ_S2_PLAYERS, players)
+    s2_indexar_sala(uid, salas[uid])
+    temporizador_salas.armar(uid, guild.id, expira_em)
 
     # === DM ===
     embed_dm = discord.Embed(
@@ -2447,14 +4237,14 @@ async def sala_privada_abrir(interaction: discord.Interaction):
     )
     embed_dm.add_field(
         name="⏰ Expira em",
-        value=expira_em.strftime("%H:%M:%S"),
+        value=formatar_epoch(expira_em, "%H:%M:%S"),
         inline=True
     )
 
     await enviar_dm(interaction.user, embed_dm)
 
     await interaction.response.send_message(
-        f"🔓 Sala aberta! Expira às `{expira_em.strftime('%H:%M:%S')}`",
+        f"🔓 Sala aberta! Expira às `{formatar_epoch(expira_em, '%H:%M:%S')}`",
         ephemeral=True
     )
 #------- ADD RODADAS ---------
@@ -2475,19 +4265,19 @@ async def sala_add_rodadas(
         )
         return
 
-    players = s2_load(ARQ_S2_PLAYERS)
     uid = str(usuario.id)
+    async with store.editar(ARQ_S2_PLAYERS) as players:
+        # Cria o player se não existir
+        if uid not in players:
+            players[uid] = {
+                "status": "aprovado",
+                "rodadas": 0,
+                "sala_ativa": False
+            }
 
-    # Cria o player se não existir
-    if uid not in players:
-        players[uid] = {
-            "status": "aprovado",
-            "rodadas": 0,
-            "sala_ativa": False
-        }
-
-    players[uid]["rodadas"] += quantidade
-    s2_save(ARQ_S2_PLAYERS, players)
+        # Reset do dia primeiro: senão a próxima leitura trocaria as rodadas extras pelas diárias
+        s2_aplicar_reset_diario(players[uid])
+        players[uid]["rodadas"] += quantidade
 
     await interaction.response.send_message(
         f"✅ {quantidade} rodada(s) adicionada(s) para {usuario.mention}.\n"
@@ -2508,20 +4298,20 @@ async def sala_privada_fechar(interaction: discord.Interaction):
         return
     
     sala_info = S2_SALAS_ATIVAS[uid]
-    cargo = sala_info.get("cargo")
-    canal = sala_info.get("canal")
+    cargo = interaction.guild.get_role(sala_info["cargo_id"])
+    canal = interaction.guild.get_channel(sala_info["canal_id"])
     
     if cargo and cargo in interaction.user.roles:
         await interaction.user.remove_roles(cargo)
         
-        # Remove do controle
-        del S2_SALAS_ATIVAS[uid]
-        
-        # Atualiza status
-        players = s2_load(ARQ_S2_PLAYERS)
-        if uid in players:
-            players[uid]["sala_ativa"] = False
-            s2_save(ARQ_S2_PLAYERS, players)
+        # Remove do controle e atualiza status
+        async with store.editar(ARQ_S2_SALAS, ARQ_S2_PLAYERS) as (salas, players):
+            if uid in salas:
+                salas[uid]["ativa"] = False
+            if uid in players:
+                players[uid]["sala_ativa"] = False
+        s2_desindexar_sala(uid)
+        temporizador_salas.cancelar(uid)
         
         embed = discord.Embed(
             title="🔒 Sala Privada Fechada",
@@ -2540,68 +4330,24 @@ async def sala_privada_fechar(interaction: discord.Interaction):
         )
 
 # ---------- RESET DIÁRIO ----------
-@tasks.loop(minutes=5)
-async def s2_reset():
-    agora = agora_brasil()
-    hoje = agora.strftime("%Y-%m-%d")
-
-    players = s2_load(ARQ_S2_PLAYERS)
-    alterou = False
-
-    for uid, dados in players.items():
-        ultimo_reset = dados.get("ultimo_reset")
-
-        if ultimo_reset != hoje:
-            dados["rodadas"] = 2
-            dados["ultimo_reset"] = hoje
-            dados["sala_ativa"] = False
-            alterou = True
-            print(f"🔄 Reset diário aplicado para {uid}")
-
-    if alterou:
-        s2_save(ARQ_S2_PLAYERS, players)
-        print("✅ Reset diário da Season 2 concluído.")
-
-
-
-# ---------- VERIFICAR SALAS EXPIRADAS ----------
-@tasks.loop(minutes=1)
-async def verificar_salas_expiradas():
-    await bot.wait_until_ready()
-
-    salas = s2_load_salas()
-    players = s2_load(ARQ_S2_PLAYERS)
+# O reset em si é preguiçoso (s2_aplicar_reset_diario, na leitura de cada jogador);
+# à meia-noite de Brasília só sai o resumo do dia.
+@tasks.loop(time=MEIA_NOITE_BRASIL)
+async def s2_relatorio_diario():
+    marcar_trafego_de_fundo()
+    hoje = agora_brasil().strftime("%Y-%m-%d")
 
-    agora = agora_brasil()
-    alterado = False
-
-    for uid, sala in salas.items():
-        # ⚠️ IGNORA SALAS JÁ FECHADAS
-        if not sala.get("ativa", False):
-            continue
-
-        expira_str = sala.get("expira_em")
-        if not expira_str:
-            continue
-            
-        try:
-            expira = datetime.strptime(expira_str, "%Y-%m-%d %H:%M:%S")
-        except ValueError:
-            continue
-
-        if expira > agora:
-            continue
-
-        guild = bot.get_guild(int(sala["guild_id"]))
-        if not guild:
-            continue
+    players = await s2_load(ARQ_S2_PLAYERS)
+    salas = await s2_load_salas()
 
-        # Fecha UMA ÚNICA VEZ
-        await fechar_sala_automaticamente(uid, guild)
-        alterado = True
+    aprovados = sum(1 for dados in players.values() if dados.get("status") == "aprovado")
+    pendentes = sum(1 for dados in players.values() if dados.get("ultimo_reset") != hoje)
+    ativas = sum(1 for sala in salas.values() if sala.get("ativa", False))
 
-    if alterado:
-        print(f"✅ {agora.strftime('%H:%M:%S')} - Salas expiradas verificadas")
+    print(
+        f"📅 Season 2 {hoje}: {len(players)} jogador(es), {aprovados} aprovado(s), "
+        f"{pendentes} a resetar na próxima leitura, {ativas} sala(s) ativa(s)"
+    )
 
 
 
@@ -2609,10 +4355,9 @@ async def verificar_salas_expiradas():
 @bot.tree.command(name="sala_status", description="Mostra seu status atual da Sala Privada.")
 async def sala_status(interaction: discord.Interaction):
     uid = str(interaction.user.id)
-    players = s2_load(ARQ_S2_PLAYERS)
+    p = await s2_carregar_jogador(uid)
     agora = agora_brasil()
     
-    p = players.get(uid)
     if not p:
         embed = discord.Embed(
             title="📊 Status da Sala Privada",
@@ -2646,7 +4391,7 @@ async def sala_status(interaction: discord.Interaction):
     embed.add_field(name="Último reset", value=ultimo_reset, inline=True)
     
     # Verifica se usuário tem imunidade
-    if usuario_tem_imunidade(interaction.user.id, interaction.guild.id):
+    if await usuario_tem_imunidade(interaction.user.id, interaction.guild.id):
         embed.add_field(
             name="⚠️ Restrição",
             value="Você possui um personagem imune e não pode usar salas privadas até removê-lo.",
@@ -2663,22 +4408,15 @@ async def sala_status(interaction: discord.Interaction):
             # Mostra informação da sala ativa
             if uid in S2_SALAS_ATIVAS:
                 sala_info = S2_SALAS_ATIVAS[uid]
-                canal = sala_info.get("canal")
+                canal = interaction.guild.get_channel(sala_info["canal_id"])
                 if canal:
                     embed.add_field(name="Sala atual", value=f"{canal.mention}", inline=False)
                     
-                    # Calcula tempo restante usando horário de Brasília
-                    tempo_passado = (agora - sala_info["aberta_em"]).total_seconds()
-                    tempo_restante = max(0, S2_TEMPO_SALA - tempo_passado)
-                    minutos = int(tempo_restante // 60)
-                    segundos = int(tempo_restante % 60)
-                    
-                    # Horário de expiração
-                    if "expira_em" in sala_info:
-                        expira_str = sala_info["expira_em"].strftime("%H:%M:%S")
-                    else:
-                        expira_em = sala_info["aberta_em"] + timedelta(seconds=S2_TEMPO_SALA)
-                        expira_str = expira_em.strftime("%H:%M:%S")
+                    # Tempo restante até o expira_em (epoch)
+                    expira_em = sala_info.get("expira_em") or sala_info["aberta_em"] + S2_TEMPO_SALA
+                    tempo_restante = max(0, expira_em - agora_epoch())
+                    minutos, segundos = divmod(tempo_restante, 60)
+                    expira_str = formatar_epoch(expira_em, "%H:%M:%S")
                     
                     embed.add_field(name="⏰ Tempo restante", value=f"{minutos}m {segundos}s", inline=True)
                     embed.add_field(name="⏳ Expira em (BR)", value=expira_str, inline=True)
@@ -2710,29 +4448,20 @@ async def debug_salas(interaction: discord.Interaction):
         nome_usuario = usuario.display_name if usuario else "Desconhecido"
         
         if "aberta_em" in info:
-            tempo_passado = (agora - info["aberta_em"]).total_seconds()
-            minutos_passados = int(tempo_passado // 60)
-            segundos_passados = int(tempo_passado % 60)
-            
-            tempo_restante = max(0, S2_TEMPO_SALA - tempo_passado)
-            minutos_restantes = int(tempo_restante // 60)
-            segundos_restantes = int(tempo_restante % 60)
-            
-            # Horário de expiração
-            if "expira_em" in info:
-                expira_str = info["expira_em"].strftime("%H:%M:%S")
-            else:
-                expira_em = info["aberta_em"] + timedelta(seconds=S2_TEMPO_SALA)
-                expira_str = expira_em.strftime("%H:%M:%S")
+            expira_em = info.get("expira_em") or info["aberta_em"] + S2_TEMPO_SALA
+            tempo_restante = expira_em - agora_epoch()
+            minutos_restantes, segundos_restantes = divmod(abs(tempo_restante), 60)
             
-            status = f"✅ Ativa ({minutos_restantes}m {segundos_restantes}s restantes)" if tempo_restante > 0 else f"⚠️ Expirada há {abs(minutos_restantes)}m"
-            detalhes = f"Abertura: {info['aberta_em'].strftime('%H:%M:%S')}\nExpira: {expira_str}"
+            status = f"✅ Ativa ({minutos_restantes}m {segundos_restantes}s restantes)" if tempo_restante > 0 else f"⚠️ Expirada há {minutos_restantes}m"
+            detalhes = f"Abertura: {formatar_epoch(info['aberta_em'], '%H:%M:%S')}\nExpira: {formatar_epoch(expira_em, '%H:%M:%S')}"
         else:
             status = "❌ Sem horário de abertura"
             detalhes = "Informação incompleta"
         
-        cargo_nome = info.get("cargo", "Cargo não encontrado").name if hasattr(info.get("cargo"), 'name') else "N/A"
-        canal_nome = info.get("canal", "Canal não encontrado").name if hasattr(info.get("canal"), 'name') else "N/A"
+        cargo = interaction.guild.get_role(info["cargo_id"])
+        canal = interaction.guild.get_channel(info["canal_id"])
+        cargo_nome = cargo.name if cargo else "N/A"
+        canal_nome = canal.name if canal else "N/A"
         
         embed.add_field(
             name=f"👤 {nome_usuario}",
@@ -2743,218 +4472,339 @@ async def debug_salas(interaction: discord.Interaction):
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
 # === EVENTOS === 
-@bot.event
-async def on_message(message: discord.Message):
+# === ROTEADOR DE MENSAGENS ===
+AUTORES_HUMANOS = "humanos"
+AUTORES_BOTS = "bots"
+
+class RoteadorMensagens:
+    """Tabela de rotas do on_message: trie de prefixos + filtro de canal + filtro de autor.
+
+    Cada rota tem um ou mais prefixos (o prefixo "" casa qualquer mensagem),
+    `canais` (conjunto de ids ou None para todos) e `autores` (AUTORES_HUMANOS,
+    AUTORES_BOTS, um id ou None). Uma mensagem que não casa nada só percorre a
+    trie até o primeiro caractere sem filho: nenhuma alocação, nenhuma ida ao
+    armazenamento. As rotas casadas rodam na ordem de registro, e cada uma
+    tem seu próprio contador de chamadas, erros e latência. O erro de uma
+    rota fica no log e não impede as seguintes; rotas com
+    `em_segundo_plano=True` (as que esperam a Mudae) viram tasks próprias.
+    """
 
-    # ===============================
-    # === MENSAGENS DE BOT (MUDAE)
-    # ===============================
-    if message.author.bot:
+    def __init__(self):
+        self._trie = {}          # prefixos exatos
+        self._trie_caixa = {}    # prefixos em minúsculas, casados sem diferenciar caixa
+        self._rotas = []
+        self._metricas = {}
+        self._lock = threading.Lock()  # o snapshot é lido pela thread do servidor web
+        self._tarefas = set()  # rotas em segundo plano ainda rodando (referência contra o GC)
+
+    def rota(self, *prefixos, canais=None, autores=AUTORES_HUMANOS, ignorar_caixa=False, em_segundo_plano=False):
+        def registrar(funcao):
+            rota = {
+                "nome": funcao.__name__,
+                "funcao": funcao,
+                "ordem": len(self._rotas),
+                "canais": frozenset(canais) if canais is not None else None,
+                "autores": autores,
+                "em_segundo_plano": em_segundo_plano,
+            }
+            self._rotas.append(rota)
+            self._metricas[rota["nome"]] = {
+                "chamadas": 0, "erros": 0, "latencias": deque(maxlen=METRICAS_AMOSTRAS),
+            }
+            trie = self._trie_caixa if ignorar_caixa else self._trie
+            for prefixo in prefixos:
+                no = trie
+                for ch in (prefixo.lower() if ignorar_caixa else prefixo):
+                    no = no.setdefault(ch, {})
+                no.setdefault(None, []).append(rota)  # chave None guarda as rotas do nó
+            return funcao
+        return registrar
+
+    @staticmethod
+    def _aceita(rota, message):
+        autores = rota["autores"]
+        if autores == AUTORES_HUMANOS:
+            if message.author.bot:
+                return False
+        elif autores == AUTORES_BOTS:
+            if not message.author.bot:
+                return False
+        elif autores is not None and message.author.id != autores:
+            return False
+        return rota["canais"] is None or message.channel.id in rota["canais"]
+
+    def _coletar(self, trie, texto, message, casadas, minusculas):
+        no = trie
+        i = 0
+        while True:
+            rotas = no.get(None)
+            if rotas:
+                for rota in rotas:
+                    if self._aceita(rota, message) and (casadas is None or rota not in casadas):
+                        if casadas is None:
+                            casadas = []
+                        casadas.append(rota)
+            if i == len(texto):
+                return casadas
+            ch = texto[i]
+            no = no.get(ch.lower() if minusculas else ch)
+            if no is None:
+                return casadas
+            i += 1
+
+    def rotas_para(self, message):
+        texto = message.content
+        casadas = self._coletar(self._trie, texto, message, None, False)
+        casadas = self._coletar(self._trie_caixa, texto, message, casadas, True)
+        if casadas and len(casadas) > 1:
+            casadas.sort(key=lambda rota: rota["ordem"])
+        return casadas
+
+    async def despachar(self, message):
+        casadas = self.rotas_para(message)
+        if not casadas:
+            return
+        for rota in casadas:
+            if rota["em_segundo_plano"]:
+                tarefa = asyncio.create_task(self._executar(rota, message))
+                self._tarefas.add(tarefa)
+                tarefa.add_done_callback(self._tarefas.discard)
+            else:
+                await self._executar(rota, message)
 
-        if message.author.id == MUDAE_BOT_ID and message.embeds:
+    async def _executar(self, rota, message):
+        metricas = self._metricas[rota["nome"]]
+        inicio = time.perf_counter()
+        try:
+            await rota["funcao"](message)
+        except Exception as e:
+            # Cada rota é independente: o erro é contado e as próximas rodam normalmente
+            with self._lock:
+                metricas["erros"] += 1
+            print(f"❌ Erro na rota {rota['nome']}: {type(e).__name__}: {e}")
+        finally:
+            with self._lock:
+                metricas["chamadas"] += 1
+                metricas["latencias"].append(time.perf_counter() - inicio)
+
+    def snapshot(self):
+        """Contadores por rota, serializáveis em JSON."""
+        with self._lock:
+            series = [(nome, metricas["chamadas"], metricas["erros"], list(metricas["latencias"]))
+                      for nome, metricas in self._metricas.items()]
+        resultado = []
+        for nome, chamadas, erros, latencias in series:
+            item = {"rota": nome, "chamadas": chamadas, "erros": erros}
+            item.update(MetricasArmazenamento._percentis(latencias))
+            resultado.append(item)
+        return resultado
+
+roteador = RoteadorMensagens()
+
+CANAL_IMAO = 1430256427967975526
+CANAL_IM_DETECTOR = 1430091793529180201
 
-            # 🔹 1) REGISTRO AUTOMÁTICO S2 (SEU CÓDIGO ATUAL)
-            for uid, info in S2_SALAS_ATIVAS.items():
-                if info.get("canal") and message.channel.id == info["canal"].id:
-                    personagem = s2_extrair_personagem_do_embed(message.embeds[0])
-                    if personagem:
-                        tipo = s2_definir_tipo_personagem(message.embeds[0])
-                        s2_registro_automatico(uid, personagem, tipo)
-                    break
+@bot.event
+async def on_message(message: discord.Message):
+    await roteador.despachar(message)
+
+# ===============================
+# === MENSAGENS DE BOT (MUDAE)
+# ===============================
+@roteador.rota("", autores=MUDAE_BOT_ID)
+async def rota_embed_mudae(message: discord.Message):
+    if not message.embeds:
+        return
 
-            # 🔹 2) DETECTOR DE CASAMENTO (NOVO)
-            await detectar_casamento_mudae(message)
+    embeds_mudae.registrar(message)
+    # Quem estiver esperando a resposta da Mudae neste canal ($im) recebe esta embed
+    correlacao_mudae.entregar(message)
 
+    # Fora das salas privadas não há nada a fazer aqui (consulta só ao índice em memória)
+    uid = s2_dono_do_canal(message.channel.id)
+    if uid is None:
         return
 
-    if message.content.lower().startswith("$imao "):
-        canais_permitidos = [1430256427967975526]
-        if message.channel.id not in canais_permitidos:
-            return
+    # 🔹 1) REGISTRO AUTOMÁTICO S2
+    personagem = s2_extrair_personagem_do_embed(message.embeds[0])
+    if personagem:
+        tipo = s2_definir_tipo_personagem(message.embeds[0])
+        await s2_registro_automatico(uid, personagem, tipo)
 
-        partes = message.content.split(" ", 1)
-        if len(partes) < 2:
-            return
-        nome_serie = partes[1].strip().lower()
+    # 🔹 2) DETECTOR DE CASAMENTO
+    await detectar_casamento_mudae(message)
 
-        series = carregar_json("series.json")
-        if nome_serie not in series:
-            series[nome_serie] = {}
+@bot.event
+async def on_message_edit(before: discord.Message, after: discord.Message):
+    # Troca de página e afins: a entrada da mesma mensagem é atualizada no buffer
+    if after.author.id == MUDAE_BOT_ID and after.embeds:
+        embeds_mudae.registrar(after)
+
+# ===============================
+# === COLETA DE SÉRIE ($imao)
+# ===============================
+@roteador.rota("$imao ", canais={CANAL_IMAO}, ignorar_caixa=True, em_segundo_plano=True)
+async def rota_imao(message: discord.Message):
+    partes = message.content.split(" ", 1)
+    if len(partes) < 2:
+        return
+    nome_serie = partes[1].strip().lower()
 
-        await message.channel.send(f"🔍 Iniciando coleta da série `{nome_serie}`... aguardando páginas da Mudae.")
+    # Retrato só para deduplicar; as novidades são gravadas no fim, sob o lock,
+    # para não segurar series.json durante a coleta inteira
+    series = await store.load("series.json")
+    if nome_serie not in series:
+        series[nome_serie] = {}
+    novos = []
 
-        paginas_coletadas = 0
-        personagens_total = 0
-        ultima_mensagem_mudae = None
+    await message.channel.send(f"🔍 Iniciando coleta da série `{nome_serie}`... aguardando páginas da Mudae.")
 
-        def eh_mudae_edit(before, after):
-            return (
-                after.author.bot
-                and after.author.name.lower() == "mudae"
-                and after.embeds
-                and after.channel == message.channel
-            )
+    paginas_coletadas = 0
+    personagens_total = 0
 
-        try:
-            # Primeiro tenta achar mensagem da Mudae já existente
-            async for msg in message.channel.history(limit=10):
-                if msg.author.bot and msg.author.name.lower() == "mudae" and msg.embeds:
-                    ultima_mensagem_mudae = msg
-                    print(f"[DEBUG] Mensagem da Mudae encontrada no histórico ({msg.id})")
-                    break
+    def eh_mudae_edit(before, after):
+        return (
+            after.author.id == MUDAE_BOT_ID
+            and after.embeds
+            and after.channel == message.channel
+        )
 
+    try:
+        # Primeiro tenta achar mensagem da Mudae já existente
+        ultima = await embeds_mudae.ultima(message.channel)
+        if ultima:
+            descricao = ultima["descricao"]
+            print(f"[DEBUG] Mensagem da Mudae encontrada no buffer ({ultima['message_id']})")
+        else:
             # Se não achou, espera uma nova mensagem
-            if not ultima_mensagem_mudae:
-                ultima_mensagem_mudae = await bot.wait_for(
-                    "message",
-                    check=lambda m: m.author.bot and m.author.name.lower() == "mudae" and m.embeds,
-                    timeout=30,
-                )
-                print(f"[DEBUG] Mensagem da Mudae recebida ({ultima_mensagem_mudae.id})")
-
-            while True:
-                await asyncio.sleep(1)
-
-                embed = ultima_mensagem_mudae.embeds[0]
-                descricao = embed.description or ""
-                linhas = descricao.split("\n")
-
-                personagens_encontrados = 0
-                for linha in linhas:
-                    match = re.search(r"(.+?)\s*💞?\s*=>\s*(.+)", linha)
-                    if match:
-                        personagem, usuario = match.groups()
-                        usuario = usuario.strip().replace("@", "").replace("<", "").replace(">", "")
-                        if usuario not in series[nome_serie]:
-                            series[nome_serie][usuario] = []
-                        if personagem not in series[nome_serie][usuario]:
-                            series[nome_serie][usuario].append(personagem)
-                            personagens_encontrados += 1
-                            personagens_total += 1
-
-                if personagens_encontrados > 0:
-                    paginas_coletadas += 1
-                    await message.channel.send(
-                        f"📄 Página {paginas_coletadas} coletada ({personagens_encontrados} personagens)."
-                    )
-
-                # Aguarda nova edição (mudança de página)
-                try:
-                    before, after = await bot.wait_for("message_edit", check=eh_mudae_edit, timeout=20)
-                    ultima_mensagem_mudae = after
-                    print(f"[DEBUG] Nova edição detectada ({after.id})")
-                except asyncio.TimeoutError:
-                    print("[DEBUG] Timeout sem novas edições — encerrando coleta.")
-                    break
-
-            salvar_json("series.json", series)
-            await message.channel.send(
-                f"✅ Coleta finalizada! Série: `{nome_serie}` — **{paginas_coletadas} páginas** e **{personagens_total} personagens** processados."
-            )
-
-        except asyncio.TimeoutError:
-            await message.channel.send("⚠️ Nenhuma resposta da Mudae após 30s. Tente novamente.")
-
-            
-    # ====================================
-    # === ATUALIZAÇÃO DE ATIVIDADE
-    # ====================================
-    roll_prefixes = ("$w", "$wg", "$wa", "$ha", "$hg", "$h")
-    if message.content.startswith(roll_prefixes):
-        try:
-            # === Atualiza atividade individual ===
-            atividade = carregar_json(ARQUIVO_ATIVIDADE)
-            atividade[str(message.author.id)] = {
-                "usuario": message.author.name,
-                "data": agora_brasil().strftime("%Y-%m-%d %H:%M:%S")
-            }
-            salvar_json(ARQUIVO_ATIVIDADE, atividade)
-
-            # === Atualiza histórico dos últimos 6 dias ===
-            historico = carregar_json(ARQUIVO_ATIVIDADE_6DIAS)
-            hoje = agora_brasil().strftime("%Y-%m-%d")
-
-            # Se o dia ainda não existe, cria
-            if hoje not in historico:
-                historico[hoje] = {}
-
-            # Marca o usuário como ativo hoje
-            historico[hoje][str(message.author.id)] = message.author.name
-
-            # Mantém apenas os últimos 6 dias
-            dias_validos = sorted(
-                [d for d in historico.keys() if re.match(r"\d{4}-\d{2}-\d{2}", d)]
+            ultima_mensagem_mudae = await bot.wait_for(
+                "message",
+                check=lambda m: m.author.id == MUDAE_BOT_ID and m.embeds,
+                timeout=30,
             )
-            if len(dias_validos) > 6:
-                for dia_antigo in dias_validos[:-6]:
-                    del historico[dia_antigo]
+            descricao = ultima_mensagem_mudae.embeds[0].description or ""
+            print(f"[DEBUG] Mensagem da Mudae recebida ({ultima_mensagem_mudae.id})")
+
+        while True:
+            await asyncio.sleep(1)
+
+            linhas = descricao.split("\n")
+
+            personagens_encontrados = 0
+            for linha in linhas:
+                match = re.search(r"(.+?)\s*💞?\s*=>\s*(.+)", linha)
+                if match:
+                    personagem, usuario = match.groups()
+                    usuario = usuario.strip().replace("@", "").replace("<", "").replace(">", "")
+                    if usuario not in series[nome_serie]:
+                        series[nome_serie][usuario] = []
+                    if personagem not in series[nome_serie][usuario]:
+                        series[nome_serie][usuario].append(personagem)
+                        novos.append((usuario, personagem))
+                        personagens_encontrados += 1
+                        personagens_total += 1
+
+            if personagens_encontrados > 0:
+                paginas_coletadas += 1
+                await message.channel.send(
+                    f"📄 Página {paginas_coletadas} coletada ({personagens_encontrados} personagens)."
+                )
 
-            salvar_json(ARQUIVO_ATIVIDADE_6DIAS, historico)
-            print(f"📆 Histórico de 6 dias atualizado ({len(historico)} dias mantidos).")
+            # Aguarda nova edição (mudança de página)
+            try:
+                before, after = await bot.wait_for("message_edit", check=eh_mudae_edit, timeout=20)
+                descricao = after.embeds[0].description or ""
+                print(f"[DEBUG] Nova edição detectada ({after.id})")
+            except asyncio.TimeoutError:
+                print("[DEBUG] Timeout sem novas edições — encerrando coleta.")
+                break
 
-        except Exception as e:
-            print(f"⚠️ Erro ao atualizar histórico: {e}")
+        async with store.editar("series.json") as series_atual:
+            serie = series_atual.setdefault(nome_serie, {})
+            for usuario, personagem in novos:
+                if personagem not in serie.setdefault(usuario, []):
+                    serie[usuario].append(personagem)
+        await message.channel.send(
+            f"✅ Coleta finalizada! Série: `{nome_serie}` — **{paginas_coletadas} páginas** e **{personagens_total} personagens** processados."
+        )
 
-                        
+    except asyncio.TimeoutError:
+        await message.channel.send("⚠️ Nenhuma resposta da Mudae após 30s. Tente novamente.")
+
+
+# ====================================
+# === ATUALIZAÇÃO DE ATIVIDADE
+# ====================================
+# "$w" e "$h" já cobrem $wg/$wa e $ha/$hg
+@roteador.rota("$w", "$h")
+async def rota_rolls(message: discord.Message):
+    # Só em memória: o acumulador grava atividade e histórico junto com os pendentes
+    atividade_rolls.registrar(message.author.id, message.author.name)
+
+# ====================================
+# === DETECTOR AUTOMÁTICO DE $IM
+# ====================================
+@roteador.rota("$im ", canais={CANAL_IM_DETECTOR}, ignorar_caixa=True, em_segundo_plano=True)
+async def rota_detector_im(message: discord.Message):
+    # Registra antes de qualquer await: a resposta da Mudae não pode chegar antes da espera
+    pendente = correlacao_mudae.registrar(message.channel.id)
+    resposta = await correlacao_mudae.esperar(pendente, message.channel.id)
+    if resposta is None:
+        return
 
-    # ====================================
-    # === DETECTOR AUTOMÁTICO DE $IM
-    # ====================================
-    CANAL_IM_DETECTOR = 1430091793529180201
-    
-    if message.channel.id != CANAL_IM_DETECTOR:
-        pass
-    elif message.content.lower().startswith("$im "):
-        await asyncio.sleep(3)
+    personagem, footer_text, descricao = dados_embed_mudae(resposta.embeds[0])
+    if not personagem or not footer_text:
+        return
         
-        personagem, footer_text, descricao = await obter_ultima_embed_mudae(message.channel)
-        if not personagem or not footer_text:
-            return
-            
-        # Melhor regex para capturar o nome completo (até o ~)
-        match = re.search(r"Pertence a ([^~\n]+)", footer_text)
-        if not match:
-            return
-            
-        dono_completo = match.group(1).strip()
-        # Remove underscores e espaços extras
-        dono_nome = dono_completo.replace("_", "").strip()
+    # Melhor regex para capturar o nome completo (até o ~)
+    match = re.search(r"Pertence a ([^~\n]+)", footer_text)
+    if not match:
+        return
         
-        guild_id = str(message.guild.id)
-        imunes = carregar_json(ARQUIVO_IMUNES)
-        if guild_id not in imunes:
-            return
-            
-        personagem_normalizado = normalizar_texto(personagem)
+    dono_completo = match.group(1).strip()
+    # Remove underscores e espaços extras
+    dono_nome = dono_completo.replace("_", "").strip()
+    
+    guild_id = str(message.guild.id)
+    imunes = await store.load(ARQUIVO_IMUNES)
+    if guild_id not in imunes:
+        return
         
-        for user_id, dados in imunes[guild_id].items():
-            if normalizar_texto(dados["personagem"]) == personagem_normalizado:
-                usuario_imune = message.guild.get_member(int(user_id))
-                if not usuario_imune:
-                    continue
+    personagem_normalizado = normalizar_texto(personagem)
+    
+    for user_id, dados in imunes[guild_id].items():
+        if normalizar_texto(dados["personagem"]) == personagem_normalizado:
+            usuario_imune = message.guild.get_member(int(user_id))
+            if not usuario_imune:
+                continue
 
-                # Remove da lista de imunidades (SEM VERIFICAR SE É O DONO)
-                del imunes[guild_id][user_id]
-                salvar_json(ARQUIVO_IMUNES, imunes)
+            # Remove da lista de imunidades (SEM VERIFICAR SE É O DONO)
+            # e aplica cooldown de 3 dias, publicados no mesmo commit
+            async with store.editar(ARQUIVO_IMUNES, ARQUIVO_COOLDOWN) as (imunes_atuais, cooldowns):
+                if imunes_atuais.get(guild_id, {}).pop(user_id, None) is None:
+                    break  # já removido por outro evento
+                aplicar_cooldown_em(cooldowns, user_id, dias=3)
 
-                # Aplica cooldown de 3 dias
-                definir_cooldown(user_id, dias=3)
+            # Envia aviso no canal configurado
+            config = await store.load(ARQUIVO_CONFIG)
+            canal_id = config.get(guild_id)
+            canal = message.guild.get_channel(canal_id) if canal_id else None
 
-                # Envia aviso no canal configurado
-                config = carregar_json(ARQUIVO_CONFIG)
-                canal_id = config.get(guild_id)
-                canal = message.guild.get_channel(canal_id) if canal_id else None
+            if canal:
+                await canal.send(
+                    f" {usuario_imune.mention}, seu personagem imune "
+                    f"**{dados['personagem']} ({dados['origem']})** já foi pego. "
+                    f"Você agora está em cooldown de **3 dias** para usar `/imune_add` novamente."
+                )
+            
+            print(f"[REMOVIDO] {dados['personagem']} removido das imunidades. Cooldown aplicado a {usuario_imune}.")
+            break
 
-                if canal:
-                    await canal.send(
-                        f" {usuario_imune.mention}, seu personagem imune "
-                        f"**{dados['personagem']} ({dados['origem']})** já foi pego. "
-                        f"Você agora está em cooldown de **3 dias** para usar `/imune_add` novamente."
-                    )
-                
-                print(f"[REMOVIDO] {dados['personagem']} removido das imunidades. Cooldown aplicado a {usuario_imune}.")
-                break
-                
+# ====================================
+# === COMANDOS DE PREFIXO
+# ====================================
+@roteador.rota(bot.command_prefix)
+async def rota_comandos(message: discord.Message):
     await bot.process_commands(message)
 
 # === LOOP DE VERIFICAÇÃO ===
@@ -2962,50 +4812,102 @@ async def on_message(message: discord.Message):
 async def verificar_imunidades():
     print(f"⏳ Verificação ({agora_brasil().strftime('%d/%m/%Y %H:%M:%S')})")
 
-# === LOOP DE VERIFICAÇÃO DE COOLDOWN ===
-@tasks.loop(minutes=30)
-async def verificar_cooldowns():
-    """Verifica se algum cooldown expirou e avisa o usuário apenas uma vez."""
-    cooldowns = carregar_json(ARQUIVO_COOLDOWN)
-    config = carregar_json(ARQUIVO_CONFIG)
-    agora = agora_brasil()
+# === AGENDA DE COOLDOWNS ===
+COOLDOWN_NOVA_TENTATIVA = 30 * 60  # segundos até tentar de novo avisar quem não foi encontrado
 
-    expirados = []
+class AgendaCooldowns:
+    """Heap de (expira, user_id) com uma única tarefa que dorme até o próximo vencimento.
 
-    # === IDENTIFICA COOLDOWNS EXPIRADOS ===
-    for user_id, data in cooldowns.items():
-        # Agora todos devem ser dicionários
-        if isinstance(data, dict):
-            expira_str = data.get("expira")
-            avisado = data.get("avisado", False)
-            
-            if not expira_str:
+    `aplicar_cooldown_em` agenda e os comandos que removem cooldown cancelam.
+    Entradas canceladas ou substituídas ficam no heap e são ignoradas ao sair
+    (o dict `_expiracoes` é quem vale). Sem cooldowns, a tarefa só espera.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._expiracoes = {}  # user_id -> expira vigente
+        self._acordar = asyncio.Event()
+        self._tarefa = None
+
+    def agendar(self, user_id, expira):
+        user_id = str(user_id)
+        self._expiracoes[user_id] = expira
+        heapq.heappush(self._heap, (expira, user_id))
+        if self._heap[0] == (expira, user_id):
+            self._acordar.set()  # novo primeiro da fila: refaz o sono
+
+    def cancelar(self, user_id):
+        self._expiracoes.pop(str(user_id), None)
+
+    def iniciar(self, cooldowns):
+        """Reconstrói o heap a partir do arquivo e inicia a tarefa (ou a acorda,
+        se já estiver rodando). Entradas sem `expira` inteiro ficam de fora."""
+        self._expiracoes = {}
+        for user_id, dados in cooldowns.items():
+            expira = dados.get("expira") if isinstance(dados, dict) else None
+            if not isinstance(expira, int):
+                print(f"⚠️ Cooldown de {user_id} ignorado na agenda: expira inválido ({expira!r})")
                 continue
-                
-            try:
-                expira = datetime.strptime(expira_str, "%Y-%m-%d %H:%M:%S")
-            except Exception:
+            self._expiracoes[user_id] = expira
+        self._heap = [(expira, user_id) for user_id, expira in self._expiracoes.items()]
+        heapq.heapify(self._heap)
+        if self._tarefa is None or self._tarefa.done():
+            self._tarefa = asyncio.create_task(self._executar())
+        else:
+            self._acordar.set()  # heap novo: refaz o sono
+        print(f"⏳ Agenda de cooldowns: {len(self._heap)} vencimento(s) carregado(s)")
+
+    def _vencidos(self, agora):
+        vencidos = []
+        while self._heap and self._heap[0][0] <= agora:
+            expira, user_id = heapq.heappop(self._heap)
+            if self._expiracoes.get(user_id) == expira:
+                del self._expiracoes[user_id]
+                vencidos.append(user_id)
+        return vencidos
+
+    async def _executar(self):
+        await bot.wait_until_ready()
+        while True:
+            self._acordar.clear()
+            vencidos = self._vencidos(agora_epoch())
+            if vencidos:
+                try:
+                    await avisar_cooldowns_expirados(vencidos)
+                except Exception as e:
+                    print(f"⚠️ Erro ao avisar cooldowns: {e}")
+                    for user_id in vencidos:
+                        self.agendar(user_id, agora_epoch() + COOLDOWN_NOVA_TENTATIVA)
                 continue
-
-            if agora >= expira and not avisado:
-                expirados.append(user_id)
-        # Mantém compatibilidade com formato antigo por segurança
-        elif isinstance(data, str):
+            espera = self._heap[0][0] - time.time() if self._heap else None
             try:
-                expira = datetime.strptime(data, "%Y-%m-%d %H:%M:%S")
-                if agora >= expira:
-                    expirados.append(user_id)
-            except Exception:
-                continue
+                await asyncio.wait_for(self._acordar.wait(), timeout=espera)
+            except asyncio.TimeoutError:
+                pass
 
-    # === ENVIA AVISO PARA COOLDOWNS EXPIRADOS ===
-    for user_id in expirados:
-        user_id_int = int(user_id)
-        aviso_enviado = False
+agenda_cooldowns = AgendaCooldowns()
+
+async def avisar_cooldowns_expirados(user_ids):
+    """Avisa quem teve o cooldown vencido e apaga o cooldown; quem não foi encontrado é reagendado."""
+    marcar_trafego_de_fundo()
+    cooldowns = await store.load(ARQUIVO_COOLDOWN)
+    config = await store.load(ARQUIVO_CONFIG)
+    agora = agora_epoch()
 
-        # Procura o membro em todos os servidores
+    avisos = {}
+    for user_id in user_ids:
+        data = cooldowns.get(user_id)
+        # Removido, renovado ou já avisado desde que foi agendado
+        if not data or data["expira"] > agora:
+            continue
+        if data.get("avisado", False):
+            avisos[user_id] = True
+            continue
+
+        # Procura o membro em todos os servidores (fora do lock: os envios podem demorar)
+        aviso_enviado = False
         for guild in bot.guilds:
-            membro = guild.get_member(user_id_int)
+            membro = guild.get_member(int(user_id))
             if not membro:
                 continue
 
@@ -3025,68 +4927,29 @@ async def verificar_cooldowns():
                 print(f"⚠️ Erro ao notificar cooldown de {membro}: {e}")
                 continue
 
-        # Marca como avisado mesmo se não encontrou o usuário
-        if user_id in cooldowns:
-            # Converte formato antigo para novo se necessário
-            if isinstance(cooldowns[user_id], str):
-                cooldowns[user_id] = {"expira": cooldowns[user_id], "avisado": aviso_enviado}
-            else:
-                cooldowns[user_id]["avisado"] = aviso_enviado
-    
-    # === ATUALIZA O ARQUIVO COM OS AVISOS ===
-    salvar_json(ARQUIVO_COOLDOWN, cooldowns)
-
-    # === LIMPEZA DEFINITIVA DE COOLDOWNS EXPIRADOS E JÁ AVISADOS ===
-    cooldowns_limpos = {}
-    agora = agora_brasil()  # Atualiza o tempo para verificação
-
-    for uid, data in cooldowns.items():
-        manter = True
-        
-        if isinstance(data, dict):
-            expira_str = data.get("expira")
-            avisado = data.get("avisado", False)
-            
-            if expira_str:
-                try:
-                    expira = datetime.strptime(expira_str, "%Y-%m-%d %H:%M:%S")
-                    # Remove se expirou E já foi avisado
-                    if agora >= expira and avisado:
-                        manter = False
-                        print(f"🧹 Cooldown removido para usuário {uid} (expirado e avisado)")
-                except Exception:
-                    pass
-                    
-        elif isinstance(data, str):
-            try:
-                expira = datetime.strptime(data, "%Y-%m-%d %H:%M:%S")
-                # Remove se expirou (formato antigo sempre remove quando expira)
-                if agora >= expira:
-                    manter = False
-                    print(f"🧹 Cooldown antigo removido para usuário {uid}")
-            except Exception:
-                pass
-        
-        if manter:
-            cooldowns_limpos[uid] = data
+        avisos[user_id] = aviso_enviado
 
-    # Salva apenas os cooldowns que devem ser mantidos
-    salvar_json(ARQUIVO_COOLDOWN, cooldowns_limpos)
-    
-    # Log informativo
-    if len(cooldowns) != len(cooldowns_limpos):
-        print(f"🧹 Cooldowns limpos: {len(cooldowns)} → {len(cooldowns_limpos)}")
-    print(f"[LOOP] Verificação de cooldowns concluída: {len(expirados)} expirados | {datetime.now()}")
+    async with store.editar(ARQUIVO_COOLDOWN) as cooldowns:
+        for user_id, aviso_enviado in avisos.items():
+            data = cooldowns.get(user_id)
+            if not data or data["expira"] > agora_epoch():
+                continue  # mudou durante os envios
+            if aviso_enviado:
+                del cooldowns[user_id]
+                print(f"🧹 Cooldown removido para usuário {user_id} (expirado e avisado)")
+            else:
+                agenda_cooldowns.agendar(user_id, agora_epoch() + COOLDOWN_NOVA_TENTATIVA)
 
 # === LOOP YOUTUBE ===
 @tasks.loop(minutes=5)
 async def verificar_youtube():
-    novos_videos = verificar_novos_videos()
+    marcar_trafego_de_fundo()
+    novos_videos = await asyncio.to_thread(verificar_novos_videos)
     if not novos_videos:
         return
 
     for guild in bot.guilds:
-        config = carregar_json(ARQUIVO_CONFIG)
+        config = await store.load(ARQUIVO_CONFIG)
         canal_id = None
 
         if "youtube" in config and str(guild.id) in config["youtube"]:
@@ -3109,13 +4972,23 @@ async def verificar_youtube():
 
                     await canal.send(mensagem)
 
+# === LOOP DE GRAVAÇÃO NO GITHUB ===
+@tasks.loop(seconds=STORAGE_FLUSH_INTERVAL)
+async def gravar_pendentes():
+    """Agrupa os salvamentos da janela: cada arquivo alterado vira um único PUT."""
+    try:
+        await atividade_rolls.descarregar()
+    except Exception as e:
+        print(f"⚠️ Erro ao gravar atividade: {e}")
+    await store.flush()
+
 # === ON READY ===
 @bot.event
 async def on_ready():
     print(f"✅ Logado como {bot.user}")
     
     # Carrega configuração de categoria
-    config = s2_load(ARQ_S2_CONFIG)
+    config = await s2_load(ARQ_S2_CONFIG)
     for guild in bot.guilds:
         guild_id = str(guild.id)
         if "categoria_salas" in config and guild_id in config["categoria_salas"]:
@@ -3124,9 +4997,71 @@ async def on_ready():
             print(f"✅ [{agora_brasil().strftime('%H:%M:%S')}] Categoria de salas carregada para {guild.name}: {S2_CATEGORIA_SALAS_ID}")
             break
 
+    # Índice de nomes dos membros (o cache de membros já está completo no on_ready)
+    for guild in bot.guilds:
+        indice_membros.indexar_guild(guild)
+    print(f"👥 Índice de membros montado para {len(bot.guilds)} servidor(es)")
+
+# === ÍNDICE DE MEMBROS ===
+@bot.event
+async def on_guild_join(guild: discord.Guild):
+    indice_membros.indexar_guild(guild)
+
+@bot.event
+async def on_member_join(member: discord.Member):
+    indice_membros.adicionar(member)
+
+@bot.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    if before.display_name != after.display_name:
+        indice_membros.adicionar(after)
+
+@bot.event
+async def on_user_update(before: discord.User, after: discord.User):
+    # Username e nome global mudam para o usuário, não por servidor
+    if before.name == after.name and before.global_name == after.global_name:
+        return
+    for guild in after.mutual_guilds:
+        membro = guild.get_member(after.id)
+        if membro:
+            indice_membros.adicionar(membro)
+
+@bot.event
+async def on_member_remove(member: discord.Member):
+    indice_membros.remover(member.guild.id, member.id)
+
+def _token_metricas_valido(environ):
+    """Aceita `Authorization: Bearer <METRICAS_TOKEN>` ou `?token=<METRICAS_TOKEN>`."""
+    if not METRICAS_TOKEN:
+        return False
+    enviado = environ.get("HTTP_AUTHORIZATION", "")
+    if enviado.startswith("Bearer "):
+        enviado = enviado[len("Bearer "):]
+    else:
+        enviado = parse_qs(environ.get("QUERY_STRING", "")).get("token", [""])[0]
+    return hmac.compare_digest(enviado.encode(), METRICAS_TOKEN.encode())
+
 def web_server():
     """Servidor web simples para manter a instância ativa"""
     def app(environ, start_response):
+        if environ.get("PATH_INFO") == "/metricas":
+            # Porta pública do keep-alive: nomes de arquivos, chamadores e cota só com token
+            if not METRICAS_TOKEN:
+                start_response('404 Not Found', [('Content-type', 'text/plain')])
+                return [b"Not found"]
+            if not _token_metricas_valido(environ):
+                start_response('401 Unauthorized', [('Content-type', 'text/plain'),
+                                                    ('WWW-Authenticate', 'Bearer')])
+                return [b"Unauthorized"]
+            # Cada parte é copiada sob o lock dela; a serialização trabalha só com as cópias
+            corpo = json.dumps({
+                "backend": backend.nome,
+                "armazenamento": metricas_storage.snapshot(),
+                "github": agendador.metricas(),
+                "rotas": roteador.snapshot(),
+            }, ensure_ascii=False).encode("utf-8")
+            start_response('200 OK', [('Content-type', 'application/json; charset=utf-8')])
+            return [corpo]
         status = '200 OK'
         headers = [('Content-type', 'text/plain')]
         start_response(status, headers)
@@ -3139,7 +5074,14 @@ def web_server():
         httpd.serve_forever()
 
 if __name__ == "__main__":
-    if not TOKEN:
+    if "--migrar-timestamps" in sys.argv:
+        # Migração avulsa, sem subir o bot: converte e grava tudo num único commit
+        async def migrar_e_gravar():
+            total = await migrar_timestamps()
+            await store.flush()
+            print(f"✅ {total} data(s) migradas para epoch")
+        asyncio.run(migrar_e_gravar())
+    elif not TOKEN:
         print("ERRO: DISCORD_BOT_TOKEN ausente!")
     else:
         # Inicia o bot na thread principal
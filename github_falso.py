@@ -0,0 +1,257 @@
+"""GitHub falso em processo, para os testes (tests/) e os benchmarks (benchmark.py).
+
+Não é importado pelo bot: quem precisa dele sobe o servidor com `iniciar()`
+e aponta `bot.GITHUB_API_URL`/`bot.REPO` para ele.
+"""
+import base64
+import hashlib
+import itertools
+import json
+import os
+import random
+import socketserver
+import threading
+import time
+from collections import deque
+from threading import Thread
+from urllib.parse import parse_qs
+from wsgiref.simple_server import make_server, WSGIServer, WSGIRequestHandler
+
+from bot import _desserializar, _serializar, _sha_blob
+
+class _ServidorWSGIThreads(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+class _HandlerSilencioso(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+class GitHubFalso:
+    """Imitação em memória das partes da API do GitHub que o bot usa.
+
+    Contents API (GET/PUT com sha, 409/422 em conflito) e Git Data API (ref,
+    trees, blobs, commits e PATCH da ref só com fast-forward), com latência,
+    cota por janela (X-RateLimit-*) e limite secundário (Retry-After) simulados.
+    Um único branch; a autenticação é ignorada.
+    """
+
+    def __init__(self, latencia_ms=0.0, limite=5000, janela=3600.0, por_segundo=0):
+        self._lock = threading.Lock()
+        self.latencia = latencia_ms / 1000
+        self.limite = limite
+        self.janela = janela
+        self.por_segundo = por_segundo
+        self._restante = limite
+        self._reset_em = time.time() + janela
+        self._ultimas = deque()  # instantes das requisições do último segundo
+        self._contador = itertools.count()
+        self._blobs = {}    # sha -> bytes
+        self._trees = {}    # sha -> {caminho: sha do blob}
+        self._commits = {}  # sha -> (sha da tree, sha do pai)
+        self._head = self._novo_commit({}, None, "Commit inicial")
+        self.requisicoes = 0
+        self.conflitos = 0
+
+    # --- objetos git ---
+    def _guardar_blob(self, conteudo):
+        sha = _sha_blob(conteudo)
+        self._blobs[sha] = conteudo
+        return sha
+
+    def _novo_commit(self, arquivos, pai, mensagem):
+        tree = hashlib.sha1(json.dumps(sorted(arquivos.items())).encode()).hexdigest()
+        self._trees[tree] = dict(arquivos)
+        sha = hashlib.sha1(f"{tree}:{pai}:{mensagem}:{next(self._contador)}".encode()).hexdigest()
+        self._commits[sha] = (tree, pai)
+        return sha
+
+    def _arquivos(self):
+        return self._trees[self._commits[self._head][0]]
+
+    def semear(self, diretorio):
+        """Copia todos os arquivos de um diretório para um commit no branch."""
+        with self._lock:
+            arquivos = dict(self._arquivos())
+            for raiz, _, nomes in os.walk(diretorio):
+                for nome in nomes:
+                    caminho = os.path.join(raiz, nome)
+                    with open(caminho, "rb") as f:
+                        relativo = os.path.relpath(caminho, diretorio).replace(os.sep, "/")
+                        arquivos[relativo] = self._guardar_blob(f.read())
+            self._head = self._novo_commit(arquivos, self._head, f"Semente de {diretorio}")
+        return len(arquivos)
+
+    def alterar(self, caminho, funcao):
+        """Commit direto no branch, como se outro processo tivesse gravado (para provocar conflitos).
+
+        `funcao` recebe o conteúdo atual do arquivo ({} se não existir) e o altera no lugar.
+        """
+        with self._lock:
+            arquivos = dict(self._arquivos())
+            dados = _desserializar(self._blobs[arquivos[caminho]]) if caminho in arquivos else {}
+            funcao(dados)
+            arquivos[caminho] = self._guardar_blob(_serializar(dados))
+            self._head = self._novo_commit(arquivos, self._head, f"Alteração externa em {caminho}")
+
+    def ler(self, caminho):
+        with self._lock:
+            sha = self._arquivos().get(caminho)
+            return _desserializar(self._blobs[sha]) if sha else None
+
+    # --- HTTP ---
+    def _cota(self):
+        """Consome uma requisição da cota. Retorna (status, corpo, headers extras) se estourou."""
+        agora = time.time()
+        if agora >= self._reset_em:
+            self._restante = self.limite
+            self._reset_em = agora + self.janela
+        if self.por_segundo:
+            while self._ultimas and agora - self._ultimas[0] > 1:
+                self._ultimas.popleft()
+            if len(self._ultimas) >= self.por_segundo:
+                return 403, {"message": "You have exceeded a secondary rate limit."}, [("Retry-After", "1")]
+            self._ultimas.append(agora)
+        if self._restante <= 0:
+            return 403, {"message": "API rate limit exceeded."}, []
+        self._restante -= 1
+        return None
+
+    def app(self, environ, start_response):
+        if self.latencia:
+            time.sleep(random.uniform(0.5, 1.5) * self.latencia)
+        metodo = environ["REQUEST_METHOD"]
+        tamanho = int(environ.get("CONTENT_LENGTH") or 0)
+        corpo = json.loads(environ["wsgi.input"].read(tamanho)) if tamanho else {}
+        consulta = parse_qs(environ.get("QUERY_STRING", ""))
+
+        with self._lock:
+            self.requisicoes += 1
+            limitada = self._cota()
+            if limitada:
+                status, resposta, extras = limitada
+            else:
+                extras = []
+                try:
+                    status, resposta = self._rotear(metodo, environ.get("PATH_INFO", ""), consulta, corpo)
+                except (KeyError, ValueError, TypeError) as e:
+                    status, resposta = 400, {"message": f"Requisição inválida: {e}"}
+                if status in (409, 422):
+                    self.conflitos += 1
+            headers = [
+                ("Content-Type", "application/json; charset=utf-8"),
+                ("X-RateLimit-Limit", str(self.limite)),
+                ("X-RateLimit-Remaining", str(self._restante)),
+                ("X-RateLimit-Reset", str(int(self._reset_em))),
+            ] + extras
+
+        motivos = {200: "OK", 201: "Created", 400: "Bad Request", 403: "Forbidden",
+                   404: "Not Found", 409: "Conflict", 422: "Unprocessable Entity"}
+        start_response(f"{status} {motivos.get(status, '')}", headers)
+        return [json.dumps(resposta).encode("utf-8")]
+
+    def _rotear(self, metodo, caminho, consulta, corpo):
+        # /repos/{dono}/{repo}/...
+        partes = caminho.strip("/").split("/")
+        if len(partes) < 4 or partes[0] != "repos":
+            return 404, {"message": "Not Found"}
+        recurso = partes[3:]
+
+        if recurso[0] == "contents" and len(recurso) > 1:
+            return self._conteudo(metodo, "/".join(recurso[1:]), corpo)
+        if recurso[0] != "git" or len(recurso) < 2:
+            return 404, {"message": "Not Found"}
+
+        tipo, resto = recurso[1], recurso[2:]
+        if tipo == "ref" and metodo == "GET":
+            return 200, {"ref": "refs/" + "/".join(resto), "object": {"sha": self._head, "type": "commit"}}
+        if tipo == "refs" and metodo == "PATCH":
+            return self._atualizar_ref(corpo)
+        if tipo == "trees" and metodo == "GET" and resto:
+            return self._ler_tree(resto[0])
+        if tipo == "trees" and metodo == "POST":
+            return self._criar_tree(corpo)
+        if tipo == "blobs" and metodo == "GET" and resto:
+            conteudo = self._blobs.get(resto[0])
+            if conteudo is None:
+                return 404, {"message": "Not Found"}
+            return 200, {"sha": resto[0], "encoding": "base64", "content": base64.b64encode(conteudo).decode()}
+        if tipo == "blobs" and metodo == "POST":
+            conteudo = corpo["content"]
+            conteudo = base64.b64decode(conteudo) if corpo.get("encoding") == "base64" else conteudo.encode("utf-8")
+            return 201, {"sha": self._guardar_blob(conteudo)}
+        if tipo == "commits" and metodo == "POST":
+            if corpo["tree"] not in self._trees:
+                return 422, {"message": "Tree not found"}
+            pai = corpo["parents"][0] if corpo.get("parents") else None
+            sha = hashlib.sha1(f"{corpo['tree']}:{pai}:{corpo.get('message')}:{next(self._contador)}".encode()).hexdigest()
+            self._commits[sha] = (corpo["tree"], pai)
+            return 201, {"sha": sha, "tree": {"sha": corpo["tree"]}}
+        return 404, {"message": "Not Found"}
+
+    def _conteudo(self, metodo, caminho, corpo):
+        arquivos = self._arquivos()
+        atual = arquivos.get(caminho)
+        if metodo == "GET":
+            if atual is None:
+                return 404, {"message": "Not Found"}
+            conteudo = base64.encodebytes(self._blobs[atual]).decode()  # com quebras de linha, como o GitHub
+            return 200, {"path": caminho, "sha": atual, "encoding": "base64", "content": conteudo}
+        if metodo != "PUT":
+            return 404, {"message": "Not Found"}
+        if atual is not None and "sha" not in corpo:
+            return 422, {"message": "Invalid request. \"sha\" wasn't supplied."}
+        if atual is not None and corpo["sha"] != atual:
+            return 409, {"message": f"{caminho} does not match {corpo['sha']}"}
+        novos = dict(arquivos)
+        novos[caminho] = self._guardar_blob(base64.b64decode(corpo["content"]))
+        self._head = self._novo_commit(novos, self._head, corpo.get("message", ""))
+        return (201 if atual is None else 200), {
+            "content": {"path": caminho, "sha": novos[caminho]},
+            "commit": {"sha": self._head},
+        }
+
+    def _ler_tree(self, sha):
+        # Aceita sha de tree ou de commit, como o GitHub
+        if sha in self._commits:
+            sha = self._commits[sha][0]
+        if sha not in self._trees:
+            return 404, {"message": "Not Found"}
+        entradas = [
+            {"path": caminho, "mode": "100644", "type": "blob", "sha": blob}
+            for caminho, blob in sorted(self._trees[sha].items())
+        ]
+        return 200, {"sha": sha, "tree": entradas, "truncated": False}
+
+    def _criar_tree(self, corpo):
+        base = corpo.get("base_tree")
+        if base in self._commits:
+            base = self._commits[base][0]
+        arquivos = dict(self._trees.get(base, {}))
+        for entrada in corpo["tree"]:
+            if "content" in entrada:
+                arquivos[entrada["path"]] = self._guardar_blob(entrada["content"].encode("utf-8"))
+            elif entrada.get("sha") is None:
+                arquivos.pop(entrada["path"], None)  # sha nulo = remover o arquivo
+            elif entrada["sha"] in self._blobs:
+                arquivos[entrada["path"]] = entrada["sha"]
+            else:
+                return 422, {"message": f"Blob {entrada['sha']} not found"}
+        sha = hashlib.sha1(json.dumps(sorted(arquivos.items())).encode()).hexdigest()
+        self._trees[sha] = arquivos
+        return 201, {"sha": sha}
+
+    def _atualizar_ref(self, corpo):
+        novo = corpo["sha"]
+        if novo not in self._commits:
+            return 422, {"message": "Object does not exist"}
+        if not corpo.get("force") and self._commits[novo][1] != self._head:
+            return 422, {"message": "Update is not a fast forward"}
+        self._head = novo
+        return 200, {"object": {"sha": novo, "type": "commit"}}
+
+    def iniciar(self, porta=0):
+        """Sobe o servidor numa thread daemon e retorna a URL base da API."""
+        servidor = make_server("127.0.0.1", porta, self.app,
+                               server_class=_ServidorWSGIThreads, handler_class=_HandlerSilencioso)
+        Thread(target=servidor.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{servidor.server_port}"
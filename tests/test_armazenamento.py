@@ -0,0 +1,349 @@
+"""Idas e voltas do armazenamento contra o GitHub falso e o backend de arquivos.
+
+Cobre o merge de três vias nos conflitos, a divisão em shards, a poda e
+compactação do histórico em bitsets e a migração das datas para epoch.
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import threading
+from datetime import date, timedelta
+
+import pytest
+
+# O bot lê a configuração ao ser importado: nada de token, nada de GitHub real
+os.environ.setdefault("STORAGE_BACKEND", "arquivos")
+os.environ.setdefault("STORAGE_DIR", tempfile.mkdtemp(prefix="bot-testes-"))
+os.environ["DISCORD_BOT_TOKEN"] = ""
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+from github_falso import GitHubFalso  # noqa: E402
+
+
+def rodar(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture(autouse=True)
+def store_limpo(monkeypatch):
+    """Cada teste começa com cache vazio e um `store` novo (locks presos ao loop do teste)."""
+    bot._cache_documentos.clear()
+    bot._documentos_pendentes.clear()
+    monkeypatch.setattr(bot, "store", bot.Armazenamento())
+    yield
+    bot._cache_documentos.clear()
+    bot._documentos_pendentes.clear()
+
+
+@pytest.fixture
+def github(monkeypatch):
+    """GitHub falso novo, com o BackendGitHub apontado para ele."""
+    falso = GitHubFalso()
+    monkeypatch.setattr(bot, "GITHUB_API_URL", falso.iniciar())
+    monkeypatch.setattr(bot, "REPO", "local/testes")
+    monkeypatch.setattr(bot, "backend", bot.BackendGitHub())
+    return falso
+
+
+@pytest.fixture
+def arquivos(monkeypatch, tmp_path):
+    monkeypatch.setattr(bot, "backend", bot.BackendArquivos(str(tmp_path)))
+    return tmp_path
+
+
+# === MERGE DE TRÊS VIAS ===
+def test_mesclar_documentos_preserva_os_dois_lados():
+    base = {"a": 1, "b": {"x": 1, "y": 1}, "c": 1}
+    nosso = {"a": 2, "b": {"x": 2, "y": 1}, "novo": 1}          # alterou a, b.x, removeu c
+    deles = {"a": 1, "b": {"x": 1, "y": 3}, "c": 1, "deles": 1}  # alterou b.y, criou deles
+
+    assert bot._mesclar_documentos(base, nosso, deles) == {
+        "a": 2, "b": {"x": 2, "y": 3}, "novo": 1, "deles": 1,
+    }
+
+
+def test_conflito_no_put_mescla_com_a_versao_remota(github):
+    async def cenario():
+        await bot.store.save("teste.json", {"a": 1})
+        await bot.store.flush()
+
+        github.alterar("teste.json", lambda dados: dados.update(b=2))
+        async with bot.store.editar("teste.json") as dados:
+            dados["c"] = 3
+        await bot.store.flush()
+        return await bot.store.load("teste.json")
+
+    cache = rodar(cenario())
+    assert github.ler("teste.json") == {"a": 1, "b": 2, "c": 3}
+    assert cache == {"a": 1, "b": 2, "c": 3}
+    assert github.conflitos >= 1
+
+
+def test_commit_de_varios_arquivos_mescla_o_que_mudou_no_remoto(github):
+    async def cenario():
+        await bot.store.save("um.json", {"a": 1})
+        await bot.store.save("dois.json", {"a": 1})
+        await bot.store.flush()
+
+        github.alterar("um.json", lambda dados: dados.update(remoto=True))
+        async with bot.store.editar("um.json", "dois.json") as (um, dois):
+            um["local"] = True
+            dois["local"] = True
+        await bot.store.flush()
+
+    rodar(cenario())
+    assert github.ler("um.json") == {"a": 1, "remoto": True, "local": True}
+    assert github.ler("dois.json") == {"a": 1, "local": True}
+
+
+# === CONCORRÊNCIA ENTRE LEITURAS E GRAVAÇÕES ===
+class BackendLento(bot.BackendArquivos):
+    """Leituras de fundo e escritas param até o teste soltar o evento correspondente."""
+
+    def __init__(self, diretorio):
+        super().__init__(diretorio)
+        self.soltar_leitura = threading.Event()
+        self.soltar_escrita = threading.Event()
+        self.soltar_leitura.set()
+        self.soltar_escrita.set()
+
+    def carregar(self, nome_arquivo):
+        if threading.current_thread().name.startswith("storage-fundo"):
+            self.soltar_leitura.wait(5)
+        return super().carregar(nome_arquivo)
+
+    def salvar_varios(self, documentos):
+        self.soltar_escrita.wait(5)
+        return super().salvar_varios(documentos)
+
+
+def test_leitura_de_fundo_atrasada_nao_desfaz_edicao(monkeypatch, tmp_path):
+    lento = BackendLento(str(tmp_path))
+    monkeypatch.setattr(bot, "backend", lento)
+    lento.salvar_varios({"teste.json": {"valor": "antigo"}})
+
+    async def leitura_de_fundo():
+        bot.marcar_trafego_de_fundo()
+        return await bot.store.load("teste.json")
+
+    async def cenario():
+        lento.soltar_leitura.clear()
+        fundo = asyncio.create_task(leitura_de_fundo())
+        await asyncio.sleep(0.05)
+        async with bot.store.editar("teste.json") as dados:
+            dados["valor"] = "novo"
+        # A leitura de fundo termina depois da edição, com a versão antiga
+        lento.soltar_leitura.set()
+        assert await fundo == {"valor": "novo"}
+        await bot.store.flush()
+        bot.invalidar_cache()
+        return await bot.store.load("teste.json")
+
+    assert rodar(cenario()) == {"valor": "novo"}
+
+
+def test_cache_nao_expira_enquanto_a_gravacao_esta_em_andamento(monkeypatch, tmp_path):
+    lento = BackendLento(str(tmp_path))
+    monkeypatch.setattr(bot, "backend", lento)
+    monkeypatch.setattr(bot, "CACHE_TTL", 0.01)
+    lento.salvar_varios({"teste.json": {"valor": "antigo"}})
+    falhar = [False, True]  # a primeira gravação falha, a segunda passa
+
+    def salvar_varios(documentos):
+        lento.soltar_escrita.wait(5)
+        if falhar.pop():
+            return False
+        return bot.BackendArquivos.salvar_varios(lento, documentos)
+
+    lento.salvar_varios = salvar_varios
+
+    async def cenario():
+        await bot.store.save("teste.json", {"valor": "novo"})
+        lento.soltar_escrita.clear()
+        gravacao = asyncio.create_task(bot.store.flush())
+        await asyncio.sleep(0.05)  # passa do TTL com a gravação parada
+        durante = await bot.store.load("teste.json")
+        lento.soltar_escrita.set()
+        await gravacao
+        assert falhar == [False]
+        # A gravação falhou: a versão em memória volta para a fila e sai no próximo flush
+        await bot.store.flush()
+        return durante
+
+    assert rodar(cenario()) == {"valor": "novo"}
+    assert bot.backend.carregar("teste.json") == {"valor": "novo"}
+
+
+def test_aquecer_segue_quando_um_documento_falha(monkeypatch, arquivos):
+    class BackendInstavel(bot.BackendArquivos):
+        def carregar(self, nome_arquivo):
+            if nome_arquivo == "ruim.json":
+                raise TimeoutError("GitHub demorou demais")
+            return super().carregar(nome_arquivo)
+
+    monkeypatch.setattr(bot, "backend", BackendInstavel(str(arquivos)))
+    bot.backend.salvar_varios({"bom.json": {"a": 1}})
+
+    prontos = rodar(bot.store.aquecer(["bom.json", "ruim.json"]))
+    assert list(prontos) == ["bom.json"]
+    assert bot._cache_valido("bom.json") == {"a": 1}
+
+
+@pytest.mark.parametrize("nomes", [["um.json"], ["um.json", "dois.json"]])
+def test_arquivo_nunca_lido_mescla_com_o_remoto(github, nomes):
+    for nome in nomes:
+        github.alterar(nome, lambda dados: dados.update(remoto=True))
+
+    async def cenario():
+        # Grava sem ter lido: o backend não conhece o sha nem a base destes arquivos
+        for nome in nomes:
+            await bot.store.save(nome, {"local": True})
+        await bot.store.flush()
+        return {nome: await bot.store.load(nome) for nome in nomes}
+
+    cache = rodar(cenario())
+    for nome in nomes:
+        assert github.ler(nome) == {"remoto": True, "local": True}
+        assert cache[nome] == {"remoto": True, "local": True}
+
+
+# === SHARDS ===
+@pytest.mark.parametrize("nome, dados", [
+    (bot.ARQUIVO_ATIVIDADE, {str(uid): {"data": uid, "usuario": f"u{uid}"} for uid in range(40)}),
+    (bot.ARQUIVO_ATIVIDADE_6DIAS, {
+        "2025-01-01": {str(uid): f"u{uid}" for uid in range(30)},
+        "2025-01-02": {str(uid): f"u{uid}" for uid in range(10, 20)},
+        "ultimo_reset": "2025-01-02",
+    }),
+])
+def test_dividir_e_juntar_shards_ida_e_volta(nome, dados):
+    shards = bot.dividir_em_shards(nome, dados, 8)
+    assert len(shards) == 8
+    assert bot.juntar_shards(nome, list(shards.values())) == dados
+
+
+def test_migrar_shards_e_editar_depois(arquivos):
+    class Resposta:
+        async def defer(self, **kwargs):
+            pass
+
+    class Followup:
+        def __init__(self):
+            self.mensagens = []
+
+        async def send(self, mensagem, **kwargs):
+            self.mensagens.append(mensagem)
+
+    class Interacao:
+        user = "admin"
+
+        def __init__(self):
+            self.response = Resposta()
+            self.followup = Followup()
+
+    dados = {str(uid): {"data": uid, "usuario": f"u{uid}"} for uid in range(40)}
+
+    async def cenario():
+        await bot.store.save(bot.ARQUIVO_ATIVIDADE, dados)
+        await bot.store.flush()
+        await bot.migrar_shards.callback(Interacao(), 4)
+
+        bot.invalidar_cache()
+        carregado = await bot.store.load(bot.ARQUIVO_ATIVIDADE)
+
+        async with bot.store.editar(bot.ARQUIVO_ATIVIDADE) as atividade:
+            atividade["7"]["data"] = 999
+        await bot.store.flush()
+        bot.invalidar_cache()
+        return carregado, await bot.store.load(bot.ARQUIVO_ATIVIDADE)
+
+    carregado, editado = rodar(cenario())
+    assert carregado == dados
+    assert bot.backend.carregar(bot.ARQUIVO_SHARDS)[bot.ARQUIVO_ATIVIDADE] == 4
+    assert editado["7"]["data"] == 999
+    assert {uid: v for uid, v in editado.items() if uid != "7"} == {
+        uid: v for uid, v in dados.items() if uid != "7"
+    }
+    # A edição cai só no shard do usuário
+    shard_do_7 = bot.nome_shard(bot.ARQUIVO_ATIVIDADE, bot._bucket("7", 4))
+    assert bot.backend.carregar(shard_do_7)["7"]["data"] == 999
+    shards = [bot.backend.carregar(bot.nome_shard(bot.ARQUIVO_ATIVIDADE, bucket)) for bucket in range(4)]
+    assert sum(len(shard) for shard in shards) == len(dados)
+
+
+# === HISTÓRICO EM BITSETS ===
+def test_historico_poda_e_compacta_como_a_contagem_direta():
+    gerador = random.Random(42)
+    janela = 30
+    hoje = date(2025, 3, 1)
+    historico = bot.HistoricoAtividade(janela)
+    marcados = set()
+    # Três quartos dos usuários só rolam no começo: saem da janela e forçam a compactação
+    for deslocamento in range(60, -1, -1):
+        dia = hoje - timedelta(days=deslocamento)
+        for uid in range(40):
+            recente = uid % 4 == 0
+            if (recente or deslocamento > janela) and gerador.random() < 0.4:
+                historico.marcar(uid, dia)
+                marcados.add((str(uid), dia.toordinal()))
+
+    assert historico.podar(hoje)
+    limite = hoje.toordinal() - janela
+    esperado = {}
+    for uid, ordinal in marcados:
+        if ordinal > limite:
+            esperado.setdefault(uid, []).append(ordinal)
+
+    assert len(historico.usuarios) == len(esperado)  # compactado: só quem ainda tem dias
+    for uid in map(str, range(40)):
+        dias = sorted(esperado.get(uid, []))
+        assert historico.dias_ativos(uid) == dias
+        media = (dias[-1] - dias[0]) / (len(dias) - 1) if len(dias) > 1 else 0
+        assert historico.resumo(uid) == (len(dias), media)
+
+    recarregado = bot.HistoricoAtividade.de_dados(historico.para_dados(), janela)
+    for uid in map(str, range(40)):
+        assert recarregado.dias_ativos(uid) == historico.dias_ativos(uid)
+        assert recarregado.resumo(uid) == historico.resumo(uid)
+
+
+# === DATAS EM EPOCH ===
+def test_migrar_datas_documento_converte_e_descarta_o_que_nao_le():
+    dados = {
+        "1": "2025-01-01 10:00:00",        # formato mais antigo: só a string
+        "2": {"data": "2025-01-01 10:00", "usuario": "b"},
+        "3": {"data": "ilegível"},
+        "4": 5,
+        "5": None,
+    }
+    convertidos = bot.migrar_datas_documento(bot.ARQUIVO_ATIVIDADE, dados)
+
+    epoch = bot.brasil_para_epoch(bot.datetime(2025, 1, 1, 10, 0))
+    assert convertidos > 0
+    assert dados == {
+        "1": {"data": epoch, "usuario": "Desconhecido"},
+        "2": {"data": epoch, "usuario": "b"},
+    }
+    assert bot.migrar_datas_documento(bot.ARQUIVO_ATIVIDADE, dados) == 0
+
+
+def test_migrar_timestamps_no_github_falso(github):
+    github.alterar(bot.ARQ_S2_SALAS, lambda dados: dados.update({
+        "1": {"aberta_em": "2025-01-01 10:00:00", "expira_em": "2025-01-01 10:10:00", "ativa": False},
+    }))
+    github.alterar(bot.ARQUIVO_COOLDOWN, lambda dados: dados.update({"9": "2025-01-04 10:00:00"}))
+
+    async def cenario():
+        total = await bot.migrar_timestamps()
+        await bot.store.flush()
+        segunda = await bot.migrar_timestamps()
+        return total, segunda
+
+    total, segunda = rodar(cenario())
+    aberta = bot.brasil_para_epoch(bot.datetime(2025, 1, 1, 10, 0))
+    assert total == 3 and segunda == 0
+    assert github.ler(bot.ARQ_S2_SALAS)["1"] == {"aberta_em": aberta, "expira_em": aberta + 600, "ativa": False}
+    assert github.ler(bot.ARQUIVO_COOLDOWN) == {"9": {"expira": aberta + 3 * 86400}}